@@ -1,7 +1,18 @@
+import logging
 import os
-import traceback
+import time
 from flask import Flask
 
+# Gunicorn does not configure the root logger; without this, startup info
+# (including the per-phase timings from create_app) would be dropped
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+# Alembic (via Flask-Migrate) logs its plugin setup at INFO on every import
+logging.getLogger("alembic").setLevel(logging.WARNING)
+logger = logging.getLogger("revmark.app")
+
 # Try to create the full app. If that fails (for example due to a missing
 # environment variable or transient DB error), fall back to a minimal app
 # that responds 200 on `/` so Railway healthchecks don't immediately fail the
@@ -10,43 +21,41 @@ from flask import Flask
 try:
     # Delay importing create_app until inside try so import-time exceptions
     # are caught and the fallback can start.
-    # 🔍 DEBUG: Check what Railway is providing
-    print("=" * 60)
-    print("🚂 RAILWAY POSTGRESQL DEBUG INFO:")
-    # Mask full DATABASE_URL to avoid leaking credentials in logs; show host and db only
-    db_url = os.getenv("DATABASE_URL")
-    if db_url:
-        try:
-            from urllib.parse import urlparse
-            p = urlparse(db_url)
-            host = p.hostname or ''
-            port = f":{p.port}" if p.port else ''
-            path = p.path or ''
-            print("DATABASE_URL:", f"{p.scheme}://{host}{port}{path}")
-        except Exception:
-            print("DATABASE_URL: [REDACTED]")
-    else:
-        print("DATABASE_URL: None")
-    print("DATABASE_PUBLIC_URL:", os.getenv("DATABASE_PUBLIC_URL"))
-    print("RAILWAY_ENVIRONMENT:", os.getenv("RAILWAY_ENVIRONMENT"))
-    print("RAILWAY_PRIVATE_DOMAIN:", os.getenv("RAILWAY_PRIVATE_DOMAIN"))
-    print("PGUSER:", os.getenv("PGUSER"))
-    print("POSTGRES_USER:", os.getenv("POSTGRES_USER"))
-    print("PGHOST:", os.getenv("PGHOST"))
-    print("PGPORT:", os.getenv("PGPORT"))
-    print("PGDATABASE:", os.getenv("PGDATABASE"))
-    print("POSTGRES_DB:", os.getenv("POSTGRES_DB"))
-    print("PGPASSWORD:", '***' if os.getenv("PGPASSWORD") else None)
-    print("POSTGRES_PASSWORD:", '***' if os.getenv("POSTGRES_PASSWORD") else None)
-    print("=" * 60)
+    if os.getenv("STARTUP_DIAGNOSTICS", "false").lower() in ("true", "1", "yes"):
+        # 🔍 DEBUG: Check what Railway is providing
+        logger.info("🚂 RAILWAY POSTGRESQL DEBUG INFO:")
+        # Mask full DATABASE_URL to avoid leaking credentials in logs; show host and db only
+        db_url = os.getenv("DATABASE_URL")
+        if db_url:
+            try:
+                from urllib.parse import urlparse
+                p = urlparse(db_url)
+                host = p.hostname or ''
+                port = f":{p.port}" if p.port else ''
+                path = p.path or ''
+                logger.info(f"DATABASE_URL: {p.scheme}://{host}{port}{path}")
+            except Exception:
+                logger.info("DATABASE_URL: [REDACTED]")
+        else:
+            logger.info("DATABASE_URL: None")
+        for name in ("DATABASE_PUBLIC_URL", "RAILWAY_ENVIRONMENT", "RAILWAY_PRIVATE_DOMAIN",
+                     "PGUSER", "POSTGRES_USER", "PGHOST", "PGPORT", "PGDATABASE", "POSTGRES_DB"):
+            logger.info(f"{name}: {os.getenv(name)}")
+        for name in ("PGPASSWORD", "POSTGRES_PASSWORD"):
+            logger.info(f"{name}: {'***' if os.getenv(name) else None}")
 
+    started = time.perf_counter()
     from revmark import create_app
+    imported = time.perf_counter()
     app = create_app()
-    print("✅ create_app() completed successfully. App ready.")
+    logger.info(
+        f"✅ create_app() completed successfully. App ready in "
+        f"{(time.perf_counter() - started) * 1000:.0f}ms "
+        f"(imports {(imported - started) * 1000:.0f}ms)."
+    )
 except Exception as e:
-    # Print traceback to make debugging easier in Railway logs
-    print("!!! create_app() failed during startup. Falling back to a minimal app.")
-    traceback.print_exc()
+    # Log the traceback to make debugging easier in Railway logs
+    logger.exception("!!! create_app() failed during startup. Falling back to a minimal app.")
 
     fallback = Flask(__name__)
 
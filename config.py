@@ -15,19 +15,47 @@ class Config:
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
     AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
     AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET", "revmark-uploads")
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")  # s3, or local for dev/CI/benchmarks without AWS
+    LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", os.path.join(BASE_DIR, "instance", "storage"))  # files for STORAGE_BACKEND=local
     
     # Stripe Configuration
     STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
     STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
     STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
     STRIPE_REDIRECT_URL = os.getenv("STRIPE_REDIRECT_URL", "http://localhost:5000/stripe/onboard/complete")
+    STRIPE_ACCOUNT_CACHE_TTL = int(os.getenv("STRIPE_ACCOUNT_CACHE_TTL", "300"))  # seconds a Connect account snapshot is fresh
+    STRIPE_ACCOUNT_CACHE_MAX_AGE = int(os.getenv("STRIPE_ACCOUNT_CACHE_MAX_AGE", "86400"))  # stale snapshots served while revalidating
+    STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", "8"))  # webhook event retries in worker.py
+    STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # override the API host (e.g. a local stand-in server)
+    STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "2"))  # retries with jittered backoff
+    STRIPE_CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "3"))  # seconds to open a connection
+    STRIPE_READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "10"))  # retrieve calls
+    STRIPE_WRITE_TIMEOUT = float(os.getenv("STRIPE_WRITE_TIMEOUT", "20"))  # create calls (payments, transfers, refunds)
+    STRIPE_LIST_TIMEOUT = float(os.getenv("STRIPE_LIST_TIMEOUT", "30"))  # paginated list calls
+    STRIPE_BREAKER_THRESHOLD = int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5"))  # consecutive failures before failing fast
+    STRIPE_BREAKER_RESET_SECONDS = float(os.getenv("STRIPE_BREAKER_RESET_SECONDS", "30"))  # fail-fast window
     
     # Platform Settings
     PLATFORM_FEE_PERCENTAGE = float(os.getenv("PLATFORM_FEE_PERCENTAGE", "5.0"))
+    PAYOUT_MIN_AGE_HOURS = float(os.getenv("PAYOUT_MIN_AGE_HOURS", "72"))  # escrow hold before batch release
+    PAYOUT_WORKERS = int(os.getenv("PAYOUT_WORKERS", "8"))  # concurrent transfer requests
+    PAYOUT_CHUNK_SIZE = int(os.getenv("PAYOUT_CHUNK_SIZE", "100"))  # payouts committed per transaction
     
     # File Upload Settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     UPLOAD_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.pdf', '.doc', '.docx']
+    UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(16 * 1024 * 1024)))  # upload bytes buffered in RAM before spilling to disk
+    S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))  # bytes; larger uploads go multipart
+    S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(5 * 1024 * 1024)))  # part size (S3 minimum is 5MB)
+    S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))  # parts uploaded in parallel
+    ATTACHMENT_BLOB_GRACE_SECONDS = int(os.getenv("ATTACHMENT_BLOB_GRACE_SECONDS", "86400"))  # unreferenced blobs kept this long before deletion
+    IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "400"))  # longest side (px) of thread thumbnails
+    IMAGE_PREVIEW_SIZE = int(os.getenv("IMAGE_PREVIEW_SIZE", "1600"))  # longest side (px) of medium previews
+    IMAGE_DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))  # WebP quality (0-100)
+    IMAGE_DERIVATIVE_BATCH_SIZE = int(os.getenv("IMAGE_DERIVATIVE_BATCH_SIZE", "20"))  # images rendered per worker pass
+    IMAGE_DERIVATIVE_MAX_ATTEMPTS = int(os.getenv("IMAGE_DERIVATIVE_MAX_ATTEMPTS", "5"))  # storage failures before an image is marked failed
+    DIRECT_UPLOAD_EXPIRATION = int(os.getenv("DIRECT_UPLOAD_EXPIRATION", "600"))  # seconds a presigned upload POST is valid
+    PRESIGNED_URL_CACHE_SIZE = int(os.getenv("PRESIGNED_URL_CACHE_SIZE", "2048"))  # signed URLs kept per worker
     
     # Simple database configuration - SQLite only for now
     SQLALCHEMY_ENGINE_OPTIONS = {
@@ -42,13 +70,13 @@ class Config:
     
     if DATABASE_URL and 'postgresql' in DATABASE_URL:
         SQLALCHEMY_DATABASE_URI = DATABASE_URL
-        print(f"✅ Using PostgreSQL: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'configured'}")
     else:
-        # Local development fallback
-        instance_dir = os.path.join(BASE_DIR, 'instance')
-        os.makedirs(instance_dir, exist_ok=True)
+        # Local development fallback (create_app creates the instance directory)
         SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(BASE_DIR, 'instance', 'revmark.db')}"
-        print("🏠 Using SQLite for local development")
+    
+    # Startup
+    AUTO_CREATE_TABLES = os.getenv("AUTO_CREATE_TABLES", "false" if DATABASE_URL else "true").lower() in ('true', '1', 'yes')  # db.create_all() in create_app; deployments use migrations
+    ADMIN_ENABLED = os.getenv("ADMIN_ENABLED", "true").lower() in ('true', '1', 'yes')  # mount Flask-Admin at /admin (false skips importing it)
 
     # Flask-Mail configuration (read from environment for security)
     MAIL_SERVER = os.getenv('MAIL_SERVER', 'localhost')
@@ -61,3 +89,9 @@ class Config:
         os.getenv('MAIL_DEFAULT_NAME', 'RevMark Contact'),
         os.getenv('MAIL_DEFAULT_SENDER', 'no-reply@revmark.local')
     )
+    
+    # Email outbox worker (see worker.py)
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 100))
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+    WORKER_POLL_SECONDS = float(os.getenv('WORKER_POLL_SECONDS', 5))
+    EMAIL_DIGEST_DAILY_HOUR = int(os.getenv('EMAIL_DIGEST_DAILY_HOUR', 8))  # UTC hour for daily digests
@@ -0,0 +1,39 @@
+# Gunicorn settings (gunicorn -c gunicorn.conf.py app:app)
+#
+# The app is imported once in the master (preload_app) and forked into the
+# workers, so startup cost is paid once and the imported code and config are
+# shared copy-on-write. gc.freeze() before each fork moves every object that
+# exists at that point out of the collector's reach: a collection in a
+# worker would otherwise write to the GC header of each of them and copy
+# nearly every shared page.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "1", "yes")
+loglevel = "info"
+accesslog = "-"
+errorlog = "-"
+
+# Loading the app only allocates; collecting before the fork would just leave
+# holes in pages that are about to be shared
+gc.disable()
+
+
+def pre_fork(server, worker):
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # Connections opened in the master (e.g. by db.create_all) must not be
+    # shared with the workers; drop them without closing the parent's sockets
+    app = server.app.wsgi()
+    if "sqlalchemy" in getattr(app, "extensions", {}):
+        from revmark import db
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
@@ -0,0 +1,42 @@
+"""
+Add attachment_blob table and message_attachment.blob_id for deduplicated attachments
+
+Revision ID: 20261018_add_attachment_blob
+Revises: 20261018_add_stripe_event
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_attachment_blob'
+down_revision = '20261018_add_stripe_event'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'attachment_blob',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('sha256', sa.String(length=64), nullable=False, unique=True),
+        sa.Column('s3_key', sa.String(length=500), nullable=False, unique=True),
+        sa.Column('file_size', sa.Integer(), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('released_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_attachment_blob_ref_count_released_at', 'attachment_blob', ['ref_count', 'released_at'])
+
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_message_attachment_blob_id', 'attachment_blob', ['blob_id'], ['id'])
+    op.create_index('ix_message_attachment_blob_id', 'message_attachment', ['blob_id'])
+
+def downgrade():
+    op.drop_index('ix_message_attachment_blob_id', table_name='message_attachment')
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.drop_constraint('fk_message_attachment_blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+    op.drop_index('ix_attachment_blob_ref_count_released_at', table_name='attachment_blob')
+    op.drop_table('attachment_blob')
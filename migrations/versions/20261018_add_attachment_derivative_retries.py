@@ -0,0 +1,25 @@
+"""
+Track derivative render attempts on message_attachment
+
+Revision ID: 20261018_add_attachment_derivative_retries
+Revises: 20261018_add_attachment_derivatives
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_attachment_derivative_retries'
+down_revision = '20261018_add_attachment_derivatives'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.add_column(sa.Column('derivative_attempts', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('derivative_next_attempt_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.drop_column('derivative_next_attempt_at')
+        batch_op.drop_column('derivative_attempts')
@@ -0,0 +1,34 @@
+"""
+Add thumbnail/preview derivative columns to message_attachment
+
+Revision ID: 20261018_add_attachment_derivatives
+Revises: 20261018_add_attachment_blob
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_attachment_derivatives'
+down_revision = '20261018_add_attachment_blob'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.add_column(sa.Column('thumbnail_key', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('preview_key', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('derivative_status', sa.String(length=20), nullable=True))
+    op.create_index('ix_message_attachment_derivative_status', 'message_attachment', ['derivative_status'])
+    # Queue derivatives for images uploaded before the pipeline existed
+    op.execute(
+        "UPDATE message_attachment SET derivative_status = 'pending' "
+        "WHERE content_type LIKE 'image/%'"
+    )
+
+def downgrade():
+    op.drop_index('ix_message_attachment_derivative_status', table_name='message_attachment')
+    with op.batch_alter_table('message_attachment') as batch_op:
+        batch_op.drop_column('derivative_status')
+        batch_op.drop_column('preview_key')
+        batch_op.drop_column('thumbnail_key')
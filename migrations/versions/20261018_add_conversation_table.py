@@ -0,0 +1,56 @@
+"""
+Add conversation summary table and backfill it from message
+
+Revision ID: 20261018_add_conversation_table
+Revises: 20261018_add_message_receiver_timestamp_index
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_conversation_table'
+down_revision = '20261018_add_message_receiver_timestamp_index'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'conversation',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_low_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('user_high_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), sa.ForeignKey('message.id'), nullable=True),
+        sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('unread_low', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unread_high', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('has_pending_offer', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.UniqueConstraint('user_low_id', 'user_high_id', name='uq_conversation_pair'),
+    )
+    op.create_index('ix_conversation_low_last', 'conversation', ['user_low_id', 'last_timestamp', 'id'])
+    op.create_index('ix_conversation_high_last', 'conversation', ['user_high_id', 'last_timestamp', 'id'])
+
+    # One grouped pass over message; Conversation.rebuild() does the same from Python.
+    # Legacy messages may have no timestamp, and last_timestamp is NOT NULL, so a
+    # pair with none falls back to the migration time (as rebuild() does)
+    op.execute("""
+        INSERT INTO conversation (user_low_id, user_high_id, last_message_id, last_timestamp,
+                                  unread_low, unread_high, has_pending_offer)
+        SELECT low, high, MAX(id), COALESCE(MAX(timestamp), CURRENT_TIMESTAMP),
+               SUM(CASE WHEN receiver_id = low AND is_read = false THEN 1 ELSE 0 END),
+               SUM(CASE WHEN receiver_id = high AND low <> high AND is_read = false THEN 1 ELSE 0 END),
+               MAX(CASE WHEN COALESCE(is_offer, false) AND NOT COALESCE(offer_approved, false)
+                         AND NOT COALESCE(offer_rejected, false) THEN 1 ELSE 0 END) = 1
+        FROM (
+            SELECT id, timestamp, receiver_id, is_read, is_offer, offer_approved, offer_rejected,
+                   CASE WHEN sender_id < receiver_id THEN sender_id ELSE receiver_id END AS low,
+                   CASE WHEN sender_id < receiver_id THEN receiver_id ELSE sender_id END AS high
+            FROM message
+        ) AS pairs
+        GROUP BY low, high
+    """)
+
+def downgrade():
+    op.drop_index('ix_conversation_high_last', table_name='conversation')
+    op.drop_index('ix_conversation_low_last', table_name='conversation')
+    op.drop_table('conversation')
@@ -0,0 +1,39 @@
+"""
+Add email_outbox table for queued outbound email
+
+Revision ID: 20261018_add_email_outbox
+Revises: 20261018_add_message_conversation_id
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_email_outbox'
+down_revision = '20261018_add_message_conversation_id'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('recipient', sa.String(length=120), nullable=False),
+        sa.Column('subject', sa.String(length=255), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('html', sa.Text(), nullable=True),
+        sa.Column('coalesce_key', sa.String(length=50), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_email_outbox_recipient', 'email_outbox', ['recipient'])
+    op.create_index('ix_email_outbox_status_next_attempt', 'email_outbox', ['status', 'next_attempt_at'])
+
+def downgrade():
+    op.drop_index('ix_email_outbox_status_next_attempt', table_name='email_outbox')
+    op.drop_index('ix_email_outbox_recipient', table_name='email_outbox')
+    op.drop_table('email_outbox')
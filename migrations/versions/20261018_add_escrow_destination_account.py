@@ -0,0 +1,31 @@
+"""
+Record the destination account of destination-charge escrow payments
+
+Revision ID: 20261018_add_escrow_destination_account
+Revises: 20261018_add_attachment_derivative_retries
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_escrow_destination_account'
+down_revision = '20261018_add_attachment_derivative_retries'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('escrow_payment', sa.Column('stripe_destination_account_id', sa.String(length=100), nullable=True))
+    # Older payments did not record it. Checkout made a destination charge
+    # whenever the seller had finished onboarding, so assume one for those
+    # sellers: a held-back payout can be cleared and released, a double one
+    # cannot be undone
+    op.execute(
+        'UPDATE escrow_payment SET stripe_destination_account_id = ('
+        'SELECT "user".stripe_account_id FROM "user" '
+        'WHERE "user".id = escrow_payment.seller_id AND "user".stripe_onboarding_complete = true) '
+        'WHERE stripe_transfer_id IS NULL'
+    )
+
+def downgrade():
+    op.drop_column('escrow_payment', 'stripe_destination_account_id')
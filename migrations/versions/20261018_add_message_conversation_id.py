@@ -0,0 +1,38 @@
+"""
+Add conversation_id to message with a (conversation_id, timestamp, id) index
+
+Revision ID: 20261018_add_message_conversation_id
+Revises: 20261018_add_conversation_table
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_message_conversation_id'
+down_revision = '20261018_add_conversation_table'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    with op.batch_alter_table('message') as batch_op:
+        batch_op.add_column(sa.Column('conversation_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_message_conversation_id', 'conversation', ['conversation_id'], ['id'])
+    op.create_index('ix_message_conversation_timestamp_id', 'message', ['conversation_id', 'timestamp', 'id'])
+
+    # Point existing messages at the summary rows created by the previous revision
+    op.execute("""
+        UPDATE message SET conversation_id = (
+            SELECT conversation.id FROM conversation
+            WHERE conversation.user_low_id = CASE WHEN message.sender_id < message.receiver_id
+                                                  THEN message.sender_id ELSE message.receiver_id END
+              AND conversation.user_high_id = CASE WHEN message.sender_id < message.receiver_id
+                                                   THEN message.receiver_id ELSE message.sender_id END
+        )
+    """)
+
+def downgrade():
+    op.drop_index('ix_message_conversation_timestamp_id', table_name='message')
+    with op.batch_alter_table('message') as batch_op:
+        batch_op.drop_constraint('fk_message_conversation_id', type_='foreignkey')
+        batch_op.drop_column('conversation_id')
@@ -0,0 +1,21 @@
+"""
+Add composite (receiver_id, timestamp, id) index to message table
+
+Revision ID: 20261018_add_message_receiver_timestamp_index
+Revises: 20261018_add_user_unread_count
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_message_receiver_timestamp_index'
+down_revision = '20261018_add_user_unread_count'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_index('ix_message_receiver_timestamp_id', 'message', ['receiver_id', 'timestamp', 'id'])
+
+def downgrade():
+    op.drop_index('ix_message_receiver_timestamp_id', table_name='message')
@@ -0,0 +1,21 @@
+"""
+Add composite (timestamp, id) index to request table
+
+Revision ID: 20261018_add_request_timestamp_id_index
+Revises: 20251017_add_offer_columns_to_message
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_request_timestamp_id_index'
+down_revision = '20251017_add_offer_columns_to_message'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_index('ix_request_timestamp_id', 'request', ['timestamp', 'id'])
+
+def downgrade():
+    op.drop_index('ix_request_timestamp_id', table_name='request')
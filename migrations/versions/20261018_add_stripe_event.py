@@ -0,0 +1,38 @@
+"""
+Add stripe_event table for deduplicated, queued webhook processing
+
+Revision ID: 20261018_add_stripe_event
+Revises: 20261018_add_user_notification_digest
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_stripe_event'
+down_revision = '20261018_add_user_notification_digest'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'stripe_event',
+        sa.Column('id', sa.String(length=255), primary_key=True),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('object_id', sa.String(length=255), nullable=True),
+        sa.Column('created', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('ix_stripe_event_object_status_created', 'stripe_event', ['object_id', 'status', 'created'])
+    op.create_index('ix_stripe_event_status_created', 'stripe_event', ['status', 'created'])
+
+def downgrade():
+    op.drop_index('ix_stripe_event_status_created', table_name='stripe_event')
+    op.drop_index('ix_stripe_event_object_status_created', table_name='stripe_event')
+    op.drop_table('stripe_event')
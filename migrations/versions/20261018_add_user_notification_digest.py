@@ -0,0 +1,23 @@
+"""
+Add notification digest policy columns to user table
+
+Revision ID: 20261018_add_user_notification_digest
+Revises: 20261018_add_email_outbox
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_user_notification_digest'
+down_revision = '20261018_add_email_outbox'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('user', sa.Column('notification_digest', sa.String(length=20), nullable=False, server_default='immediate'))
+    op.add_column('user', sa.Column('digest_interval_minutes', sa.Integer(), nullable=False, server_default='15'))
+
+def downgrade():
+    op.drop_column('user', 'digest_interval_minutes')
+    op.drop_column('user', 'notification_digest')
@@ -0,0 +1,27 @@
+"""
+Add denormalized unread_count to user table
+
+Revision ID: 20261018_add_user_unread_count
+Revises: 20261018_add_request_timestamp_id_index
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_add_user_unread_count'
+down_revision = '20261018_add_request_timestamp_id_index'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.add_column('user', sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+    # Backfill from the message table; reconcile_counters.py repairs later drift
+    op.execute(
+        'UPDATE "user" SET unread_count = ('
+        'SELECT COUNT(*) FROM message '
+        'WHERE message.receiver_id = "user".id AND message.is_read = false)'
+    )
+
+def downgrade():
+    op.drop_column('user', 'unread_count')
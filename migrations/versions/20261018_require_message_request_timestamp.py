@@ -0,0 +1,34 @@
+"""
+Backfill missing timestamps on message and request and make them NOT NULL
+
+Revision ID: 20261018_require_message_request_timestamp
+Revises: 20261018_add_escrow_destination_account
+Create Date: 2026-10-18
+"""
+# revision identifiers, used by Alembic.
+revision = '20261018_require_message_request_timestamp'
+down_revision = '20261018_add_escrow_destination_account'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+TABLES = ('message', 'request')
+
+def upgrade():
+    for table in TABLES:
+        # Keyset cursors are built from (timestamp, id); legacy rows without a
+        # timestamp are dated with the table's oldest one so they stay at the end
+        op.execute(
+            f'UPDATE "{table}" SET timestamp = COALESCE('
+            f'(SELECT MIN(dated.timestamp) FROM "{table}" AS dated), CURRENT_TIMESTAMP) '
+            f'WHERE timestamp IS NULL'
+        )
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
@@ -0,0 +1,37 @@
+# Repair denormalized counters (User.unread_count, Conversation) from the source tables.
+# Run once after deploying, then periodically (e.g. from cron or a worker):
+#   python reconcile_counters.py             # single pass
+#   python reconcile_counters.py --every 600 # loop every 10 minutes
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from revmark import create_app
+from revmark.models import User, Conversation
+
+def reconcile(app):
+    with app.app_context():
+        try:
+            repaired = User.reconcile_unread_counts()
+            print(f"✅ Unread counters reconciled ({repaired} users repaired)")
+        except Exception as e:
+            print(f"❌ Error reconciling unread counters: {e}")
+        try:
+            rebuilt = Conversation.rebuild()
+            print(f"✅ Conversation summaries rebuilt ({rebuilt} conversations)")
+        except Exception as e:
+            print(f"❌ Error rebuilding conversations: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile denormalized counters")
+    parser.add_argument("--every", type=int, default=0, help="Repeat every N seconds (0 = run once)")
+    args = parser.parse_args()
+
+    app = create_app()
+    reconcile(app)
+    while args.every > 0:
+        time.sleep(args.every)
+        reconcile(app)
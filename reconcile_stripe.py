@@ -0,0 +1,51 @@
+# Check EscrowPayment / Request against Stripe PaymentIntents, Transfers and Refunds.
+#   python reconcile_stripe.py                       # report only
+#   python reconcile_stripe.py --since-days 30       # limit to recent Stripe objects
+#   python reconcile_stripe.py --repair              # make the database match Stripe
+# An interrupted run resumes from its checkpoint; pass --restart to start over.
+# Set STRIPE_API_BASE to run against a local Stripe stand-in.
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from revmark import create_app
+from revmark.reconciliation import Reconciler, Checkpoint, SOURCES
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "stripe_reconcile_checkpoint.json")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile escrow payments with Stripe")
+    parser.add_argument("--report", default=None, help="JSONL diff report path (default reconciliation-<timestamp>.jsonl)")
+    parser.add_argument("--repair", action="store_true", help="Update the database to match Stripe")
+    parser.add_argument("--since-days", type=float, default=None, help="Only Stripe objects created in the last N days")
+    parser.add_argument("--source", action="append", choices=SOURCES, dest="sources", help="Source to walk (repeatable, default: all)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file used to resume runs")
+    parser.add_argument("--restart", action="store_true", help="Ignore any existing checkpoint")
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+    elif checkpoint.state:
+        print(f"✅ Resuming from checkpoint {args.checkpoint}")
+
+    report_path = args.report or f"reconciliation-{datetime.utcnow():%Y%m%d-%H%M%S}.jsonl"
+    created_gte = time.time() - args.since_days * 86400 if args.since_days else None
+
+    app = create_app()
+    with app.app_context(), open(report_path, "a") as report:
+        try:
+            stats = Reconciler(report, repair=args.repair, checkpoint=checkpoint,
+                               created_gte=created_gte).run(tuple(args.sources or SOURCES))
+        except Exception as e:
+            print(f"❌ Reconciliation stopped: {e} (re-run to resume)")
+            sys.exit(1)
+
+    print(f"✅ Reconciled {stats['objects']} Stripe objects in {stats['elapsed_seconds']}s: "
+          f"{stats['matched']} matched, {stats['ignored']} ignored, {stats['diffs']} differences, "
+          f"{stats['repaired']} repaired")
+    print(f"   Report: {report_path}")
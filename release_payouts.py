@@ -0,0 +1,48 @@
+# Release funded escrow payments to sellers in bulk, outside the web tier.
+#   python release_payouts.py --dry-run          # report what would be released
+#   python release_payouts.py                    # release everything past the hold period
+#   python release_payouts.py --limit 5000 --workers 16
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from revmark import create_app
+from revmark.payouts import release_payouts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch escrow release and payout")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum payouts this run")
+    parser.add_argument("--min-age-hours", type=float, default=None, help="Escrow hold period (default PAYOUT_MIN_AGE_HOURS)")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent Stripe requests (default PAYOUT_WORKERS)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Payouts committed per transaction (default PAYOUT_CHUNK_SIZE)")
+    parser.add_argument("--status", action="append", dest="statuses", help="Eligible escrow status (repeatable, default: paid)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be released")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        try:
+            stats = release_payouts(
+                limit=args.limit,
+                min_age_hours=args.min_age_hours,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                statuses=tuple(args.statuses or ("paid",)),
+                dry_run=args.dry_run
+            )
+        except Exception as e:
+            print(f"❌ Payout run failed: {e}")
+            sys.exit(1)
+
+    if stats["dry_run"]:
+        print(f"✅ Dry run: {stats['eligible']} payouts eligible (${stats['amount_eligible']:.2f})")
+    else:
+        print(f"✅ Released {stats['released']}/{stats['eligible']} payouts (${stats['amount_released']:.2f}) "
+              f"in {stats['elapsed_seconds']}s — {stats['payouts_per_second']}/s, "
+              f"p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms, max {stats['max_ms']}ms")
+        if stats["failed"] or stats["retry_later"] or stats["skipped"]:
+            print(f"❌ {stats['failed']} rejected, {stats['retry_later']} to retry, {stats['skipped']} skipped")
+        if stats["conflicts"]:
+            print(f"🚨 {stats['conflicts']} transfers not recorded, their escrow payments changed during the run")
@@ -8,6 +8,7 @@ from config import Config
 from scaling_config import ScalingConfig
 import os
 from urllib.parse import urlparse, urlunparse
+from revmark.utils.startup_timer import StartupTimer
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -17,78 +18,107 @@ mail = Mail()
 migrate = Migrate()
 
 def create_app():
-    app = Flask(__name__, template_folder='../templates', static_folder='../static')
-    app.config.from_object(Config)
-    app.config.from_object(ScalingConfig)
+    """
+    Build the Flask app
     
-    # 🔍 CRITICAL DEBUG: Log a masked SQLAlchemy URI (do NOT print credentials)
-    raw_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
-    if raw_uri:
-        try:
-            parsed = urlparse(raw_uri)
-            # Build a netloc without username/password
-            netloc = parsed.hostname or ''
-            if parsed.port:
-                netloc = f"{netloc}:{parsed.port}"
-            masked = urlunparse((parsed.scheme, netloc, parsed.path or '', '', '', ''))
-            app.logger.info(f"🔍 SQLAlchemy will use: {masked}")
-        except Exception:
-            app.logger.info("🔍 SQLAlchemy will use: [REDACTED]")
-    else:
-        app.logger.info("🔍 SQLAlchemy will use: NOT_SET")
+    Heavy SDKs (boto3, stripe) are imported on first use rather than here,
+    and each phase below is timed; the breakdown is logged once the app is
+    ready and kept in app.extensions['startup_timings'].
+    """
+    timer = StartupTimer()
+    with timer.phase("config"):
+        app = Flask(__name__, template_folder='../templates', static_folder='../static')
+        # Buffer uploads in memory rather than spooling them to disk (see upload_stream)
+        from revmark.utils.upload_stream import UploadRequest
+        app.request_class = UploadRequest
+        app.config.from_object(Config)
+        app.config.from_object(ScalingConfig)
+        
+        # 🔍 CRITICAL DEBUG: Log a masked SQLAlchemy URI (do NOT print credentials)
+        raw_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+        if raw_uri:
+            try:
+                parsed = urlparse(raw_uri)
+                # Build a netloc without username/password
+                netloc = parsed.hostname or ''
+                if parsed.port:
+                    netloc = f"{netloc}:{parsed.port}"
+                masked = urlunparse((parsed.scheme, netloc, parsed.path or '', '', '', ''))
+                app.logger.info(f"🔍 SQLAlchemy will use: {masked}")
+            except Exception:
+                app.logger.info("🔍 SQLAlchemy will use: [REDACTED]")
+            if raw_uri.startswith('sqlite:///'):
+                # Local SQLite database (instance/revmark.db by default)
+                os.makedirs(os.path.dirname(os.path.abspath(raw_uri[len('sqlite:///'):])), exist_ok=True)
+        else:
+            app.logger.info("🔍 SQLAlchemy will use: NOT_SET")
     
-    # Initialize extensions (use defensive try/except so one failing optional
-    # integration doesn't completely crash the app at import time)
-    try:
-        db.init_app(app)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize SQLAlchemy: {e}")
-
-    try:
-        login_manager.init_app(app)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize LoginManager: {e}")
+    with timer.phase("sessions"):
+        # Server-side sessions (Redis, or files when Redis is absent)
+        try:
+            from revmark.sessions import create_session_interface
+            session_interface = create_session_interface(app.config)
+            if session_interface is not None:
+                app.session_interface = session_interface
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize server-side sessions: {e}")
 
-    try:
-        cache.init_app(app)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize Cache: {e}")
+    with timer.phase("extensions"):
+        # Initialize extensions (use defensive try/except so one failing optional
+        # integration doesn't completely crash the app at import time)
+        try:
+            db.init_app(app)
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize SQLAlchemy: {e}")
 
-    try:
-        mail.init_app(app)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize Mail: {e}")
+        try:
+            login_manager.init_app(app)
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize LoginManager: {e}")
 
-    try:
-        migrate.init_app(app, db)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize Migrate: {e}")
+        try:
+            cache.init_app(app)
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize Cache: {e}")
 
-    # Initialize admin panel (defensive)
-    try:
-        from revmark.admin import init_admin
-        init_admin(app, db)
-    except Exception as e:
-        app.logger.exception(f"Failed to initialize admin panel: {e}")
+        try:
+            mail.init_app(app)
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize Mail: {e}")
 
-    # Import and register blueprints (defensive)
-    try:
-        from revmark import routes, models
-        from revmark.api_routes import api_bp
-        app.register_blueprint(routes.bp)
-        app.register_blueprint(api_bp)
-    except Exception as e:
-        app.logger.exception(f"Failed to register blueprints: {e}")
+        try:
+            migrate.init_app(app, db)
+        except Exception as e:
+            app.logger.exception(f"Failed to initialize Migrate: {e}")
 
-    # Create tables only when appropriate
-    # In production, tables should be created via migration or manual setup
-    if not os.environ.get('DATABASE_URL'):
-        # Local development - safe to auto-create tables
-        with app.app_context():
+    # Initialize admin panel (defensive; ADMIN_ENABLED=false skips importing Flask-Admin)
+    if app.config.get('ADMIN_ENABLED', True):
+        with timer.phase("admin"):
             try:
-                db.create_all()
+                from revmark.admin import init_admin
+                init_admin(app, db)
             except Exception as e:
-                app.logger.error(f"Could not create database tables: {e}")
+                app.logger.exception(f"Failed to initialize admin panel: {e}")
+
+    with timer.phase("blueprints"):
+        # Import and register blueprints (defensive)
+        try:
+            from revmark import routes, models
+            from revmark.api_routes import api_bp
+            app.register_blueprint(routes.bp)
+            app.register_blueprint(api_bp)
+        except Exception as e:
+            app.logger.exception(f"Failed to register blueprints: {e}")
+
+    # Create tables only in local development (AUTO_CREATE_TABLES)
+    # In production, tables should be created via migration or manual setup
+    if app.config.get('AUTO_CREATE_TABLES'):
+        with timer.phase("create_all"):
+            with app.app_context():
+                try:
+                    db.create_all()
+                except Exception as e:
+                    app.logger.error(f"Could not create database tables: {e}")
 
     # Lightweight health endpoint for platform healthchecks
     @app.route('/__status')
@@ -96,4 +126,6 @@ def create_app():
         # Keep this minimal and fast: return 200 if the app process is up.
         return {"status": "ok"}, 200
     
+    app.extensions['startup_timings'] = dict(timer.phases)
+    app.logger.info(f"🚀 App created in {timer.summary()}")
     return app
@@ -2,9 +2,9 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from revmark import db
 from revmark.models import Message, MessageAttachment, Request, User, EscrowPayment
-from revmark.utils.email_utils import send_email
+from revmark.utils.email_utils import queue_email
 from revmark.s3_utils import s3_manager
-from revmark.stripe_utils import stripe_manager
+from revmark.pagination import keyset_paginate, estimate_row_count
 import logging
 import os
 
@@ -12,6 +12,35 @@ logger = logging.getLogger(__name__)
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
+# ---------- REQUEST FEED ENDPOINTS ----------
+
+@api_bp.route("/requests", methods=["GET"])
+def list_requests():
+    """Cursor-paginated request feed (same ordering as the home page)"""
+    per_page = min(max(request.args.get('per_page', 12, type=int), 1), 100)
+    page = keyset_paginate(
+        Request.query, Request.timestamp, Request.id,
+        cursor=request.args.get('cursor'), per_page=per_page,
+        total=estimate_row_count(Request)
+    )
+
+    return jsonify({
+        "requests": [{
+            "id": req.id,
+            "title": req.title,
+            "description": req.description,
+            "budget": req.budget,
+            "status": req.status,
+            "buyer_id": req.buyer_id,
+            "timestamp": req.timestamp.isoformat() if req.timestamp else None
+        } for req in page.items],
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+        "page": page.page,
+        "estimated_total": page.total,
+        "estimated_pages": page.pages
+    })
+
 # ---------- FILE UPLOAD ENDPOINTS ----------
 
 @api_bp.route("/upload", methods=["POST"])
@@ -26,8 +55,8 @@ def upload_file():
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
         
-        # Check if AWS S3 is configured
-        if not current_app.config.get('AWS_ACCESS_KEY_ID'):
+        # Check if file storage is configured
+        if not s3_manager.is_configured():
             return jsonify({"error": "File upload not available (AWS S3 not configured)"}), 503
         
         # Upload to S3
@@ -53,6 +82,100 @@ def upload_file():
         logger.error(f"File upload error: {str(e)}")
         return jsonify({"error": "File upload service unavailable"}), 503
 
+@api_bp.route("/uploads/init", methods=["POST"])
+@login_required
+def init_upload():
+    """Start a direct-to-S3 upload: returns a presigned POST for one file"""
+    try:
+        data = request.get_json() or {}
+        filename = data.get('filename')
+        if not filename:
+            return jsonify({"error": "No file provided"}), 400
+        
+        # Check if file storage is configured
+        if not s3_manager.is_configured():
+            return jsonify({"error": "File upload not available (AWS S3 not configured)"}), 503
+        
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        declared_size = data.get('size')
+        if declared_size is not None and int(declared_size) > max_size:
+            return jsonify({"error": f"File size exceeds maximum allowed size of {max_size} bytes"}), 400
+        
+        s3_key, original_filename = s3_manager.new_object_key(
+            filename, folder="message-attachments", owner_id=current_user.id
+        )
+        expires_in = current_app.config.get('DIRECT_UPLOAD_EXPIRATION', 600)
+        upload = s3_manager.generate_presigned_post(
+            s3_key, original_filename, max_size=max_size, expiration=expires_in
+        )
+        
+        return jsonify({
+            "success": True,
+            "key": s3_key,
+            "upload": upload,
+            "max_size": max_size,
+            "expires_in": expires_in
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Upload init error: {str(e)}")
+        return jsonify({"error": "File upload service unavailable"}), 503
+
+@api_bp.route("/uploads/complete", methods=["POST"])
+@login_required
+def complete_upload():
+    """Attach directly uploaded files to a message the current user sent"""
+    try:
+        data = request.get_json() or {}
+        keys = data.get('keys') or ([data['key']] if data.get('key') else [])
+        if not keys:
+            return jsonify({"error": "No upload keys provided"}), 400
+        
+        message = Message.query.get_or_404(data.get('message_id'))
+        if message.sender_id != current_user.id:
+            return jsonify({"error": "Access denied"}), 403
+        
+        existing = {
+            a.s3_key: a for a in MessageAttachment.query.filter(
+                MessageAttachment.message_id == message.id,
+                MessageAttachment.s3_key.in_(keys)
+            )
+        }
+        attachments = []
+        for key in keys:
+            attachment = existing.get(key)
+            if attachment is None:
+                # Completing twice is harmless; only new keys are HEAD-checked
+                file_info = s3_manager.verify_upload(
+                    key, folder="message-attachments", owner_id=current_user.id
+                )
+                attachment = MessageAttachment.from_file_info(message.id, file_info)
+                db.session.add(attachment)
+                existing[key] = attachment
+            attachments.append(attachment)
+        db.session.commit()
+        
+        return jsonify({
+            "success": True,
+            "attachments": [{
+                "id": a.id,
+                "s3_key": a.s3_key,
+                "original_filename": a.original_filename,
+                "file_size": a.file_size,
+                "content_type": a.content_type
+            } for a in attachments]
+        })
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Upload completion error: {str(e)}")
+        return jsonify({"error": "File upload service unavailable"}), 503
+
 @api_bp.route("/file/<int:attachment_id>/download", methods=["GET"])
 @login_required
 def download_file(attachment_id):
@@ -65,15 +188,25 @@ def download_file(attachment_id):
         if message.sender_id != current_user.id and message.receiver_id != current_user.id:
             return jsonify({"error": "Access denied"}), 403
         
+        # ?variant=thumbnail|preview serves the WebP derivative once it exists
+        variant = request.args.get('variant', 'original')
+        if variant not in ('original', 'thumbnail', 'preview'):
+            return jsonify({"error": "Unknown variant"}), 400
+        s3_key = {
+            'thumbnail': attachment.thumbnail_key,
+            'preview': attachment.preview_key
+        }.get(variant) or attachment.s3_key
+        
         # Generate presigned URL
         download_url = s3_manager.generate_presigned_url(
-            attachment.s3_key, 
+            s3_key, 
             expiration=3600  # 1 hour
         )
         
         return jsonify({
             "download_url": download_url,
             "filename": attachment.original_filename,
+            "variant": variant if s3_key != attachment.s3_key else 'original',
             "expires_in": 3600
         })
         
@@ -87,6 +220,7 @@ def download_file(attachment_id):
 @login_required
 def create_seller_account():
     """Create Stripe Connect account for seller"""
+    from revmark.stripe_utils import stripe_manager
     try:
         if current_user.stripe_account_id:
             return jsonify({"error": "Seller account already exists"}), 400
@@ -114,27 +248,31 @@ def create_seller_account():
 @login_required
 def get_seller_status():
     """Get seller account status"""
+    from revmark.stripe_utils import stripe_manager
     try:
-        if not current_user.stripe_account_id:
+        user = User.query.get(current_user.id)
+        if not user.stripe_account_id:
             return jsonify({
                 "connected": False,
                 "onboarding_complete": False
             })
         
-        status = stripe_manager.get_account_status(current_user.stripe_account_id)
+        status = stripe_manager.get_account_status(user.stripe_account_id)
         
         if status:
-            # Update user onboarding status
-            current_user.stripe_onboarding_complete = (
+            # Update user onboarding status (only write when it changed)
+            onboarding_complete = (
                 status['charges_enabled'] and 
                 status['payouts_enabled'] and 
                 status['details_submitted']
             )
-            db.session.commit()
+            if user.stripe_onboarding_complete != onboarding_complete:
+                user.stripe_onboarding_complete = onboarding_complete
+                db.session.commit()
         
         return jsonify({
             "connected": True,
-            "onboarding_complete": current_user.stripe_onboarding_complete,
+            "onboarding_complete": user.stripe_onboarding_complete,
             "account_status": status
         })
         
@@ -148,6 +286,7 @@ def get_seller_status():
 @login_required
 def create_payment_intent():
     """Create payment intent for escrow payment"""
+    from revmark.stripe_utils import stripe_manager
     try:
         data = request.get_json()
         request_id = data.get('request_id')
@@ -179,9 +318,9 @@ def create_payment_intent():
                 if seller and seller.email:
                     subject = f"Your offer was selected for request #{request_id}" 
                     body = f"Good news! The buyer has created a payment for Request #{request_id}.\n\nAmount: ${amount:.2f}\n\nLog in to RevMark to view details and message the buyer."
-                    send_email(subject, [seller.email], body)
+                    queue_email(subject, [seller.email], body)
         except Exception:
-            logger.exception("Failed to send offer-made email to seller")
+            logger.exception("Failed to queue offer-made email to seller")
         
         return jsonify({
             "success": True,
@@ -198,6 +337,7 @@ def create_payment_intent():
 @login_required
 def release_payment():
     """Release escrow payment to seller"""
+    from revmark.stripe_utils import stripe_manager
     try:
         data = request.get_json()
         request_id = data.get('request_id')
@@ -232,11 +372,11 @@ def release_payment():
             buyer = User.query.get(request_obj.buyer_id) if request_obj else None
             seller = User.query.get(request_obj.seller_id) if request_obj and request_obj.seller_id else None
             if buyer and buyer.email:
-                send_email(f"Payment released for Request #{request_id}", [buyer.email], f"Your payment for Request #{request_id} has been released to the seller.")
+                queue_email(f"Payment released for Request #{request_id}", [buyer.email], f"Your payment for Request #{request_id} has been released to the seller.")
             if seller and seller.email:
-                send_email(f"You received payment for Request #{request_id}", [seller.email], f"A payment for Request #{request_id} has been released to your account. Amount: ${transfer_info['amount_transferred']:.2f}")
+                queue_email(f"You received payment for Request #{request_id}", [seller.email], f"A payment for Request #{request_id} has been released to your account. Amount: ${transfer_info['amount_transferred']:.2f}")
         except Exception:
-            logger.exception("Failed to send payment released emails")
+            logger.exception("Failed to queue payment released emails")
         
         return jsonify({
             "success": True,
@@ -253,6 +393,7 @@ def release_payment():
 @login_required
 def refund_payment():
     """Refund escrow payment to buyer"""
+    from revmark.stripe_utils import stripe_manager
     try:
         data = request.get_json()
         request_id = data.get('request_id')
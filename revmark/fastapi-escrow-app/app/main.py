@@ -30,12 +30,15 @@ JWT_EXPIRE_MINUTES = 60*24*7
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # e.g. scripts/fake_stripe_server.py for offline load tests
 PLATFORM_FEE_PERCENT = int(os.getenv("PLATFORM_FEE_PERCENT", "5"))
 
 if not STRIPE_API_KEY:
     print("WARNING: STRIPE_API_KEY not set. Please set it in your .env file")
 else:
     stripe.api_key = STRIPE_API_KEY
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
@@ -271,12 +274,15 @@ JWT_EXPIRE_MINUTES = 60*24*7
 
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")  # e.g. scripts/fake_stripe_server.py for offline load tests
 PLATFORM_FEE_PERCENT = int(os.getenv("PLATFORM_FEE_PERCENT", "5"))
 
 if not STRIPE_API_KEY:
     print("WARNING: STRIPE_API_KEY not set. Please set it in your .env file")
 else:
     stripe.api_key = STRIPE_API_KEY
+if STRIPE_API_BASE:
+    stripe.api_base = STRIPE_API_BASE
 
 # -----------------------
 # Database (SQLAlchemy)
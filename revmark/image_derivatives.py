@@ -0,0 +1,182 @@
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import or_
+from revmark import db
+from revmark.models import MessageAttachment
+from revmark.s3_utils import s3_manager
+from revmark.utils.upload_stream import UploadTooLarge
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Derivative name -> (config key for its longest side in pixels, default)
+DERIVATIVES = {
+    'thumbnail': ('IMAGE_THUMBNAIL_SIZE', 400),
+    'preview': ('IMAGE_PREVIEW_SIZE', 1600),
+}
+
+
+class UnusableImage(Exception):
+    """The source object is missing, too large or cannot be decoded as an image."""
+
+
+def derivative_keys(s3_key):
+    """
+    S3 keys of an object's derivatives
+
+    Keys depend only on the source key, so attachments sharing a blob share
+    its derivatives and the blob sweeper can delete them without a lookup.
+
+    Returns:
+        dict: Derivative name -> S3 key
+    """
+    return {name: f"derivatives/{name}/{s3_key}.webp" for name in DERIVATIVES}
+
+
+def render_derivatives(source):
+    """
+    Render every derivative of an image as WebP
+
+    Largest first, each one shrunk from the previous, so the full-size image
+    is only resampled once. JPEGs are decoded at a reduced scale (draft mode)
+    that is still at least as large as the biggest derivative.
+
+    Args:
+        source: Readable file-like object holding the original image
+
+    Returns:
+        dict: Derivative name -> WebP bytes
+    """
+    config = current_app.config
+    sizes = {name: config.get(key, default) for name, (key, default) in DERIVATIVES.items()}
+    quality = config.get('IMAGE_DERIVATIVE_QUALITY', 80)
+
+    with Image.open(source) as original:
+        largest = max(sizes.values())
+        original.draft('RGB', (largest, largest))
+        # Phone photos are stored sideways with an EXIF orientation tag
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            keep_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if keep_alpha else 'RGB')
+
+        rendered = {}
+        for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            out = BytesIO()
+            image.save(out, 'WEBP', quality=quality, method=4)
+            rendered[name] = out.getvalue()
+    return rendered
+
+
+def generate_derivatives(s3_key):
+    """
+    Download an image, render its derivatives and upload them
+
+    Raises:
+        UnusableImage: The source is missing, too large or not a readable image
+        Exception: Storage errors (worth retrying)
+
+    Returns:
+        dict: Derivative name -> S3 key
+    """
+    max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+    try:
+        source = s3_manager.read_file(s3_key, max_size=max_size)
+    except (FileNotFoundError, UploadTooLarge) as e:
+        raise UnusableImage(str(e))
+    try:
+        rendered = render_derivatives(source)
+    except Exception as e:
+        # Pillow raises a range of error types for corrupt or unsupported input
+        raise UnusableImage(str(e))
+    keys = derivative_keys(s3_key)
+    for name, data in rendered.items():
+        s3_manager.upload_bytes(data, keys[name], 'image/webp', {'source_key': s3_key})
+    return keys
+
+
+def _defer(attachments, max_attempts):
+    """Count a failed render and schedule the next try, or give up after max_attempts"""
+    for attachment in attachments:
+        attachment.derivative_attempts = (attachment.derivative_attempts or 0) + 1
+        if attachment.derivative_attempts >= max_attempts:
+            attachment.derivative_status = 'failed'
+        else:
+            delay = min(60 * (2 ** (attachment.derivative_attempts - 1)), 3600)
+            attachment.derivative_next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=delay + random.uniform(0, delay / 4)
+            )
+    db.session.commit()
+
+
+def process_pending_derivatives(limit=None):
+    """
+    Render thumbnails and previews for newly uploaded image attachments
+
+    Attachments with the same source object (deduplicated blobs) are rendered
+    once; content already rendered for another attachment is reused. Files
+    that are missing or not readable as images are marked failed and keep
+    showing their original. A storage error backs off only the attachments
+    of that source, which are retried with exponential backoff and marked
+    failed after IMAGE_DERIVATIVE_MAX_ATTEMPTS tries; the rest of the batch
+    carries on.
+
+    Args:
+        limit: Maximum attachments per run (default IMAGE_DERIVATIVE_BATCH_SIZE)
+
+    Returns:
+        int: Number of attachments handled
+    """
+    limit = limit or current_app.config.get('IMAGE_DERIVATIVE_BATCH_SIZE', 20)
+    max_attempts = current_app.config.get('IMAGE_DERIVATIVE_MAX_ATTEMPTS', 5)
+    pending = MessageAttachment.query.filter(
+        MessageAttachment.derivative_status == 'pending',
+        or_(
+            MessageAttachment.derivative_next_attempt_at.is_(None),
+            MessageAttachment.derivative_next_attempt_at <= datetime.utcnow()
+        )
+    ).order_by(MessageAttachment.id).limit(limit).all()
+    if not pending:
+        return 0
+
+    by_source = {}
+    for attachment in pending:
+        by_source.setdefault(attachment.s3_key, []).append(attachment)
+    rendered_before = {
+        a.s3_key: a for a in MessageAttachment.query.filter(
+            MessageAttachment.s3_key.in_(list(by_source)),
+            MessageAttachment.derivative_status == 'ready'
+        )
+    }
+
+    handled = 0
+    for s3_key, attachments in by_source.items():
+        existing = rendered_before.get(s3_key)
+        status = 'ready'
+        if existing is not None:
+            keys = {'thumbnail': existing.thumbnail_key, 'preview': existing.preview_key}
+        else:
+            try:
+                keys = generate_derivatives(s3_key)
+            except UnusableImage as e:
+                logger.warning(f"No derivatives for {s3_key}: {str(e)}")
+                status, keys = 'failed', {}
+            except Exception as e:
+                logger.error(f"Failed to render derivatives for {s3_key}: {str(e)}")
+                _defer(attachments, max_attempts)
+                continue
+
+        for attachment in attachments:
+            attachment.thumbnail_key = keys.get('thumbnail')
+            attachment.preview_key = keys.get('preview')
+            attachment.derivative_status = status
+        db.session.commit()
+        handled += len(attachments)
+
+    if handled:
+        logger.info(f"🖼️ Processed derivatives for {handled} image attachments")
+    return handled
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+from revmark.models import Request, cache_is_shared
+from revmark.pagination import keyset_paginate, estimate_row_count, encode_cursor, decode_cursor
+from revmark.utils.memoize import memoize, invalidate_namespace
+
+# Generation namespace of every cached request listing page
+FEED_NAMESPACE = "request_feed"
+
+# Request columns the feed and detail templates read
+REQUEST_FIELDS = ('id', 'title', 'description', 'budget', 'timestamp', 'status', 'buyer_id', 'seller_id')
+
+
+def request_snapshot(request_obj):
+    """Plain, picklable copy of a Request for the cache (no session or lazy loads)"""
+    return SimpleNamespace(**{field: getattr(request_obj, field) for field in REQUEST_FIELDS})
+
+
+def _cache_is_local():
+    # Invalidations from another worker (or worker.py) would never reach a
+    # per-process cache, so listings are only cached in a shared one
+    return not cache_is_shared()
+
+
+def request_feed_page(cursor, per_page):
+    """
+    One page of the newest-first request feed (index and browse pages)
+
+    The cursor comes from the query string, so it is decoded and re-encoded
+    before it becomes part of the cache key: anything malformed shares the
+    first page's entry instead of filling the cache with one per variant.
+
+    Returns:
+        KeysetPage of request snapshots
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        position = encode_cursor(position['timestamp'], position['id'], position['direction'], position['page'])
+    return _request_feed_page(position, per_page)
+
+
+@memoize(timeout=60, namespace=FEED_NAMESPACE, unless=_cache_is_local)
+def _request_feed_page(cursor, per_page):
+    page = keyset_paginate(
+        Request.query, Request.timestamp, Request.id,
+        cursor=cursor, per_page=per_page,
+        total=estimate_row_count(Request)
+    )
+    page.items = [request_snapshot(r) for r in page.items]
+    return page
+
+
+@memoize(timeout=60, unless=_cache_is_local)
+def request_detail(request_id):
+    """
+    Snapshot of one request for its detail page
+
+    Returns:
+        SimpleNamespace or None if there is no such request
+    """
+    request_obj = Request.query.get(request_id)
+    return request_snapshot(request_obj) if request_obj else None
+
+
+def invalidate_request_listings(*request_ids):
+    """
+    Drop cached feed pages (and these requests' details) after requests change
+
+    Call after the commit, or a concurrent reader can cache the old row again.
+    """
+    invalidate_namespace(FEED_NAMESPACE)
+    for request_id in request_ids:
+        request_detail.invalidate(int(request_id))
@@ -1,10 +1,140 @@
-from datetime import datetime
-from revmark import db, login_manager
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from revmark import db, login_manager, cache
+from revmark.utils.request_cache import request_cached
 from flask_login import UserMixin
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached user snapshot / unread count may be reused
+USER_SNAPSHOT_TIMEOUT = 3600
+UNREAD_COUNT_TIMEOUT = 60
+
+def cache_is_shared():
+    """
+    True when the app cache is one store for every process
+    
+    SimpleCache (the default without REDIS_URL) lives inside each worker,
+    so a version bump in one process, or in worker.py, would never reach the
+    others; values that must be invalidated on change are not cached there.
+    """
+    from cachelib import SimpleCache, NullCache
+    return not isinstance(cache.cache, (SimpleCache, NullCache))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return UserSnapshot.load(int(user_id))
+
+@dataclass(frozen=True, eq=False)
+class UserSnapshot(UserMixin):
+    """
+    Immutable copy of the logged-in user, kept in the shared cache so requests
+    authenticate without loading the user row
+    
+    Each snapshot carries the version stamp it was built under; the stamp is
+    replaced after any commit that changes the user row, which retires the
+    snapshot. Code that changes the user must load the User row
+    (User.query.get(current_user.id)) rather than assign to current_user.
+    """
+    id: int
+    username: str
+    email: str
+    stripe_account_id: str
+    stripe_onboarding_complete: bool
+    notification_digest: str
+    digest_interval_minutes: int
+    version: str
+    # Only on snapshots read straight from the row (version None); a cached
+    # snapshot would serve a stale count
+    unread_count: int = None
+    
+    @staticmethod
+    def _keys(user_id):
+        return f"user:version:{user_id}", f"user:snapshot:{user_id}"
+    
+    @classmethod
+    def load(cls, user_id):
+        """
+        Cached snapshot of a user (None if there is no such user)
+        
+        Read straight from the database unless the cache is shared
+        (see cache_is_shared) or when it is unreachable.
+        """
+        if not cache_is_shared():
+            return cls._from_database(user_id)
+        version_key, snapshot_key = cls._keys(user_id)
+        try:
+            version, snapshot = cache.get_many(version_key, snapshot_key)
+        except Exception as e:
+            logger.warning(f"User cache unavailable: {str(e)}")
+            return cls._from_database(user_id)
+        if snapshot is not None and version is not None and snapshot.version == version:
+            return snapshot
+        
+        if version is None:
+            version = uuid.uuid4().hex[:12]
+            if not cache.add(version_key, version, timeout=0):
+                version = cache.get(version_key) or version
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        snapshot = cls.from_user(user, version)
+        cache.set(snapshot_key, snapshot, timeout=USER_SNAPSHOT_TIMEOUT)
+        return snapshot
+    
+    @classmethod
+    def _from_database(cls, user_id):
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+        snapshot = cls.from_user(user, None)
+        # The counter came with the row, so seed the request memo: the navbar
+        # badge costs no second query, and a change later in the request
+        # (which invalidates the memo) is still read back
+        request_cached(("unread_count", user_id), lambda: snapshot.unread_count)
+        return snapshot
+    
+    @classmethod
+    def from_user(cls, user, version):
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            stripe_account_id=user.stripe_account_id,
+            stripe_onboarding_complete=bool(user.stripe_onboarding_complete),
+            notification_digest=user.notification_digest,
+            digest_interval_minutes=user.digest_interval_minutes,
+            version=version,
+            unread_count=max(user.unread_count or 0, 0) if version is None else None
+        )
+    
+    @classmethod
+    def bump_version(cls, *user_ids):
+        """Retire the cached snapshots of these users"""
+        for user_id in user_ids:
+            try:
+                cache.set(cls._keys(user_id)[0], uuid.uuid4().hex[:12], timeout=0)
+            except Exception as e:
+                logger.warning(f"Could not invalidate cached user {user_id}: {str(e)}")
+    
+    def unread_message_count(self):
+        """Unread message count (cached briefly, memoized for the current request)"""
+        return request_cached(("unread_count", self.id), lambda: User.cached_unread_count(self.id))
+    
+    @property
+    def is_verified_seller(self):
+        """Check if user is a verified seller with completed Stripe onboarding"""
+        return self.stripe_account_id is not None and self.stripe_onboarding_complete
+    
+    @property
+    def can_receive_payments(self):
+        """Check if user can receive payments (alias for is_verified_seller)"""
+        return self.is_verified_seller
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -16,13 +146,82 @@ class User(db.Model, UserMixin):
     stripe_account_id = db.Column(db.String(100), nullable=True)
     stripe_onboarding_complete = db.Column(db.Boolean, default=False)
     
+    # Denormalized unread-message counter, maintained on write
+    unread_count = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    
+    # Message-notification email policy: immediate, batched (every N minutes) or daily
+    notification_digest = db.Column(db.String(20), default="immediate", server_default="immediate", nullable=False)
+    digest_interval_minutes = db.Column(db.Integer, default=15, server_default="15", nullable=False)
+    
     # Define relationships with explicit foreign_keys to avoid ambiguity
     messages_sent = db.relationship("Message", foreign_keys="Message.sender_id", backref="sender", lazy=True)
     messages_received = db.relationship("Message", foreign_keys="Message.receiver_id", backref="receiver", lazy=True)
     
     def unread_message_count(self):
-        """Count unread messages for this user"""
-        return Message.query.filter_by(receiver_id=self.id, is_read=False).count()
+        """Count unread messages for this user (memoized for the current request)"""
+        return request_cached(("unread_count", self.id), lambda: max(self.unread_count or 0, 0))
+    
+    @classmethod
+    def cached_unread_count(cls, user_id):
+        """Unread counter from the cache (if shared), read from the row on a miss"""
+        shared = cache_is_shared()
+        key = f"user:unread:{user_id}"
+        count = None
+        if shared:
+            try:
+                count = cache.get(key)
+            except Exception:
+                pass
+        if count is None:
+            count = max(db.session.query(cls.unread_count).filter_by(id=user_id).scalar() or 0, 0)
+            if shared:
+                try:
+                    cache.set(key, count, timeout=UNREAD_COUNT_TIMEOUT)
+                except Exception:
+                    pass
+        return count
+    
+    @staticmethod
+    def invalidate_unread_count(*user_ids):
+        """Forget cached unread counters (after a committed change)"""
+        try:
+            cache.delete_many(*(f"user:unread:{user_id}" for user_id in user_ids))
+        except Exception as e:
+            logger.warning(f"Could not invalidate unread counts: {str(e)}")
+    
+    @classmethod
+    def reconcile_unread_counts(cls):
+        """Repair drifted unread counters from the message table
+        
+        Returns:
+            int: Number of users whose counter was corrected
+        """
+        actual = db.select(db.func.count(Message.id)).where(
+            Message.receiver_id == cls.id,
+            Message.is_read.is_(False)
+        ).scalar_subquery()
+        result = db.session.execute(
+            db.update(cls).where(cls.unread_count != actual).values(unread_count=actual)
+        )
+        db.session.commit()
+        return result.rowcount
+    
+    def notification_send_time(self, now=None, daily_hour=8):
+        """When a message notification queued now should go out under this user's digest policy
+        
+        Batched windows are aligned to multiples of digest_interval_minutes so
+        every notification in a window shares one send time and is coalesced
+        into a single email. Returns None for immediate delivery.
+        """
+        now = now or datetime.utcnow()
+        if self.notification_digest == "batched":
+            window = max(self.digest_interval_minutes or 15, 1) * 60
+            epoch_seconds = int((now - datetime(1970, 1, 1)).total_seconds())
+            return datetime(1970, 1, 1) + timedelta(seconds=(epoch_seconds // window + 1) * window)
+        if self.notification_digest == "daily":
+            send_at = now.replace(hour=daily_hour, minute=0, second=0, microsecond=0)
+            return send_at if send_at > now else send_at + timedelta(days=1)
+        return None
     
     @property
     def is_verified_seller(self):
@@ -34,12 +233,40 @@ class User(db.Model, UserMixin):
         """Check if user can receive payments (alias for is_verified_seller)"""
         return self.is_verified_seller
 
+def _remember_changed_user(target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_user_ids", set()).add(target.id)
+
+@event.listens_for(User, "after_update")
+def _mark_user_changed(mapper, connection, target):
+    """Remember changed users; their cached snapshots are retired on commit"""
+    # after_update also fires for relationship-only changes to the row
+    if object_session(target).is_modified(target, include_collections=False):
+        _remember_changed_user(target)
+
+@event.listens_for(User, "after_delete")
+def _mark_user_deleted(mapper, connection, target):
+    # A deleted row has no attribute changes, so is_modified() would be False
+    _remember_changed_user(target)
+
+@event.listens_for(Session, "after_commit")
+def _retire_user_snapshots(session):
+    # After the commit, so a concurrent reload cannot cache the old row
+    changed = session.info.pop("changed_user_ids", None)
+    if changed:
+        UserSnapshot.bump_version(*changed)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_user_changes(session):
+    session.info.pop("changed_user_ids", None)
+
 class Request(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False, index=True)
     description = db.Column(db.Text, nullable=False)
     budget = db.Column(db.Float, nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     
     # Escrow payment fields
@@ -55,13 +282,21 @@ class Request(db.Model):
     seller = db.relationship("User", foreign_keys=[seller_id], backref="sold_requests")
     payments = db.relationship("EscrowPayment", backref="request", lazy=True)
 
+    # Composite key for keyset pagination of the request feed
+    __table_args__ = (
+        db.Index("ix_request_timestamp_id", "timestamp", "id"),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     receiver_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
     is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    
+    # Normalized sender/receiver pair, set by Conversation.record_message
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=True)
 
     # Offer-related fields
     is_offer = db.Column(db.Boolean, default=False, nullable=False, index=True)
@@ -71,11 +306,177 @@ class Message(db.Model):
     # File attachments
     attachments = db.relationship("MessageAttachment", backref="message", lazy=True, cascade="all, delete-orphan")
 
+    # Serve the bulk mark-as-read UPDATE and the paginated thread view
+    __table_args__ = (
+        db.Index("ix_message_receiver_timestamp_id", "receiver_id", "timestamp", "id"),
+        db.Index("ix_message_conversation_timestamp_id", "conversation_id", "timestamp", "id"),
+    )
+
     def mark_as_read(self):
         """Mark this message as read"""
         self.is_read = True
         db.session.commit()
 
+class Conversation(db.Model):
+    """Summary row per unordered user pair, maintained as messages are written"""
+    id = db.Column(db.Integer, primary_key=True)
+    # The pair is stored normalized: user_low_id < user_high_id
+    user_low_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey("message.id", use_alter=True), nullable=True)
+    last_timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Unread messages addressed to each side of the pair
+    unread_low = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    unread_high = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+    has_pending_offer = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    
+    user_low = db.relationship("User", foreign_keys=[user_low_id])
+    user_high = db.relationship("User", foreign_keys=[user_high_id])
+    last_message = db.relationship("Message", foreign_keys=[last_message_id], post_update=True)
+    
+    __table_args__ = (
+        db.UniqueConstraint("user_low_id", "user_high_id", name="uq_conversation_pair"),
+        db.Index("ix_conversation_low_last", "user_low_id", "last_timestamp", "id"),
+        db.Index("ix_conversation_high_last", "user_high_id", "last_timestamp", "id"),
+    )
+    
+    @staticmethod
+    def normalize_pair(user_a_id, user_b_id):
+        """Return the pair ordered as (low, high)"""
+        return (user_a_id, user_b_id) if user_a_id <= user_b_id else (user_b_id, user_a_id)
+    
+    @classmethod
+    def participant_filters(cls, user_id):
+        """
+        The user's conversations as two filters, one per side of the pair
+        
+        Each matches one (user_x_id, last_timestamp, id) index; paginate
+        them as keyset_paginate branches rather than OR-ing them, which no
+        single index range can serve.
+        """
+        return (cls.user_low_id == user_id, cls.user_high_id == user_id)
+    
+    @classmethod
+    def get_or_create(cls, user_a_id, user_b_id):
+        """Fetch the pair's conversation, creating it inside the current transaction"""
+        low, high = cls.normalize_pair(user_a_id, user_b_id)
+        conversation = cls.query.filter_by(user_low_id=low, user_high_id=high).first()
+        if conversation:
+            return conversation
+        try:
+            with db.session.begin_nested():
+                conversation = cls(user_low_id=low, user_high_id=high)
+                db.session.add(conversation)
+        except IntegrityError:
+            # Another request created it first
+            conversation = cls.query.filter_by(user_low_id=low, user_high_id=high).one()
+        return conversation
+    
+    @classmethod
+    def record_message(cls, message):
+        """Fold a newly flushed message into its conversation summary"""
+        conversation = cls.get_or_create(message.sender_id, message.receiver_id)
+        message.conversation_id = conversation.id
+        conversation.last_message_id = message.id
+        conversation.last_timestamp = message.timestamp or datetime.utcnow()
+        # SQL-side increments so concurrent senders don't lose updates
+        if message.receiver_id == conversation.user_low_id:
+            conversation.unread_low = cls.unread_low + 1
+        else:
+            conversation.unread_high = cls.unread_high + 1
+        if message.is_offer:
+            conversation.has_pending_offer = True
+        return conversation
+    
+    @classmethod
+    def mark_read_for(cls, user_id):
+        """Reset the user's side of every conversation after the inbox marks messages read"""
+        cls.query.filter(cls.user_low_id == user_id, cls.unread_low > 0).update(
+            {cls.unread_low: 0}, synchronize_session=False
+        )
+        cls.query.filter(cls.user_high_id == user_id, cls.unread_high > 0).update(
+            {cls.unread_high: 0}, synchronize_session=False
+        )
+    
+    @classmethod
+    def refresh_offer_flag(cls, user_a_id, user_b_id):
+        """Recompute has_pending_offer after an offer is approved or rejected"""
+        low, high = cls.normalize_pair(user_a_id, user_b_id)
+        conversation = cls.query.filter_by(user_low_id=low, user_high_id=high).first()
+        if conversation is None:
+            return
+        pending = db.session.query(Message.query.filter(
+            Message.conversation_id == conversation.id,
+            Message.is_offer.is_(True),
+            Message.offer_approved.is_(False),
+            Message.offer_rejected.is_(False)
+        ).exists()).scalar()
+        conversation.has_pending_offer = bool(pending)
+    
+    @classmethod
+    def between(cls, user_a_id, user_b_id):
+        """The pair's conversation, or None if they have never messaged"""
+        low, high = cls.normalize_pair(user_a_id, user_b_id)
+        return cls.query.filter_by(user_low_id=low, user_high_id=high).first()
+    
+    @classmethod
+    def rebuild(cls):
+        """Recreate every summary row from the message table (repair tool)
+        
+        Returns:
+            int: Number of conversations written
+        """
+        low = db.case((Message.sender_id < Message.receiver_id, Message.sender_id), else_=Message.receiver_id)
+        high = db.case((Message.sender_id < Message.receiver_id, Message.receiver_id), else_=Message.sender_id)
+        unread = Message.is_read.is_(False)
+        pending_offer = db.and_(
+            Message.is_offer.is_(True),
+            Message.offer_approved.is_(False),
+            Message.offer_rejected.is_(False)
+        )
+        rows = db.session.query(
+            low.label("low"),
+            high.label("high"),
+            db.func.max(Message.id),
+            db.func.max(Message.timestamp),
+            db.func.sum(db.case((db.and_(unread, Message.receiver_id == low), 1), else_=0)),
+            db.func.sum(db.case((db.and_(unread, Message.receiver_id == high, low != high), 1), else_=0)),
+            db.func.max(db.case((pending_offer, 1), else_=0))
+        ).group_by(low, high)
+        
+        existing = {(c.user_low_id, c.user_high_id): c for c in cls.query.all()}
+        written = 0
+        for pair_low, pair_high, last_id, last_ts, unread_low, unread_high, offer in rows:
+            conversation = existing.get((pair_low, pair_high))
+            if conversation is None:
+                conversation = cls(user_low_id=pair_low, user_high_id=pair_high)
+                db.session.add(conversation)
+            conversation.last_message_id = last_id
+            conversation.last_timestamp = last_ts or datetime.utcnow()
+            conversation.unread_low = unread_low or 0
+            conversation.unread_high = unread_high or 0
+            conversation.has_pending_offer = bool(offer)
+            written += 1
+        db.session.flush()
+        
+        # Attach messages that predate the conversation_id column
+        pair_id = db.select(cls.id).where(cls.user_low_id == low, cls.user_high_id == high).scalar_subquery()
+        db.session.execute(
+            db.update(Message).where(Message.conversation_id.is_(None)).values(conversation_id=pair_id)
+        )
+        db.session.commit()
+        return written
+    
+    def partner_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+    
+    def partner(self, user_id):
+        return self.user_high if user_id == self.user_low_id else self.user_low
+    
+    def unread_for(self, user_id):
+        return self.unread_low if user_id == self.user_low_id else self.unread_high
+
 class MessageAttachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.Integer, db.ForeignKey("message.id"), nullable=False, index=True)
@@ -85,6 +486,88 @@ class MessageAttachment(db.Model):
     file_size = db.Column(db.Integer, nullable=False)   # File size in bytes
     content_type = db.Column(db.String(100), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Shared content-addressed object (None for per-upload objects)
+    blob_id = db.Column(db.Integer, db.ForeignKey("attachment_blob.id"), nullable=True, index=True)
+    # WebP derivatives of image attachments, rendered by the background worker
+    thumbnail_key = db.Column(db.String(500), nullable=True)
+    preview_key = db.Column(db.String(500), nullable=True)
+    derivative_status = db.Column(db.String(20), nullable=True, index=True)  # pending, ready, failed (None for non-images)
+    derivative_attempts = db.Column(db.Integer, default=0, nullable=False)
+    derivative_next_attempt_at = db.Column(db.DateTime, nullable=True)  # None = render on the next pass
+
+    @classmethod
+    def from_file_info(cls, message_id, file_info):
+        """Build an attachment from S3Manager.upload_file / upload_blob / verify_upload output"""
+        content_type = file_info['content_type'] or ''
+        return cls(
+            message_id=message_id,
+            filename=file_info['s3_key'].split('/')[-1],
+            original_filename=file_info['original_filename'],
+            s3_key=file_info['s3_key'],
+            file_size=file_info['file_size'],
+            content_type=file_info['content_type'],
+            blob_id=file_info.get('blob_id'),
+            derivative_status='pending' if content_type.startswith('image/') else None
+        )
+
+class AttachmentBlob(db.Model):
+    """One stored object per distinct file content, shared by every attachment with that content"""
+    __tablename__ = "attachment_blob"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    s3_key = db.Column(db.String(500), unique=True, nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    # Attachments pointing at this blob; the object is only deleted at zero
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime, nullable=True)  # last time a reference was dropped
+    
+    __table_args__ = (
+        db.Index("ix_attachment_blob_ref_count_released_at", "ref_count", "released_at"),
+    )
+    
+    @classmethod
+    def acquire(cls, sha256):
+        """
+        Add a reference to the blob with this hash, if there is one
+        
+        Returns:
+            AttachmentBlob or None
+        """
+        # SQL-side increment; also blocks on a sweeper deleting this row
+        updated = cls.query.filter_by(sha256=sha256).update(
+            {cls.ref_count: cls.ref_count + 1}, synchronize_session=False
+        )
+        if not updated:
+            return None
+        return cls.query.filter_by(sha256=sha256).populate_existing().one()
+    
+    @classmethod
+    def create(cls, sha256, s3_key, file_size, content_type):
+        """Record a newly uploaded blob holding one reference (or join a concurrent insert)"""
+        try:
+            with db.session.begin_nested():
+                blob = cls(sha256=sha256, s3_key=s3_key, file_size=file_size,
+                           content_type=content_type, ref_count=1)
+                db.session.add(blob)
+        except IntegrityError:
+            # Another request stored the same content first
+            blob = cls.acquire(sha256)
+        return blob
+
+@event.listens_for(MessageAttachment, "after_delete")
+def _release_attachment_blob(mapper, connection, target):
+    """Drop the deleted attachment's blob reference (the worker deletes unreferenced blobs)"""
+    if target.blob_id is None:
+        return
+    blobs = AttachmentBlob.__table__
+    connection.execute(
+        blobs.update()
+        .where(blobs.c.id == target.blob_id)
+        .values(ref_count=blobs.c.ref_count - 1, released_at=datetime.utcnow())
+    )
 
 class EscrowPayment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -100,6 +583,8 @@ class EscrowPayment(db.Model):
     # Stripe IDs
     stripe_payment_intent_id = db.Column(db.String(100), nullable=False, unique=True)
     stripe_transfer_id = db.Column(db.String(100), nullable=True)
+    # Set for destination charges, which Stripe pays out to this account itself
+    stripe_destination_account_id = db.Column(db.String(100), nullable=True)
     
     # Status tracking
     status = db.Column(db.String(20), default='pending', index=True)  # pending, completed, failed, refunded
@@ -109,3 +594,51 @@ class EscrowPayment(db.Model):
     # Relationships with explicit foreign keys
     buyer = db.relationship("User", foreign_keys=[buyer_id], backref="buyer_payments")
     seller = db.relationship("User", foreign_keys=[seller_id], backref="seller_payments")
+
+class EmailOutbox(db.Model):
+    """Outbound email waiting for the background worker to send it"""
+    __tablename__ = "email_outbox"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False, index=True)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=True)
+    # Pending rows for the same recipient and key may be sent as one email
+    coalesce_key = db.Column(db.String(50), nullable=True)
+    
+    # Delivery tracking
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class StripeEvent(db.Model):
+    """Verified Stripe webhook event, stored once and applied by the worker"""
+    __tablename__ = "stripe_event"
+    
+    # Stripe's event id (evt_...) doubles as the deduplication key
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    object_id = db.Column(db.String(255), nullable=True)
+    created = db.Column(db.Integer, nullable=False)  # Stripe event timestamp (epoch seconds)
+    payload = db.Column(db.Text, nullable=False)
+    
+    # Processing state
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, processed, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index("ix_stripe_event_object_status_created", "object_id", "status", "created"),
+        db.Index("ix_stripe_event_status_created", "status", "created"),
+    )
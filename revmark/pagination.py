@@ -0,0 +1,210 @@
+import base64
+import json
+import math
+from datetime import datetime
+from sqlalchemy import tuple_, text
+from revmark import db, cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a table row-count estimate is reused before it is re-read
+ROW_ESTIMATE_TIMEOUT = 60
+
+
+def encode_cursor(timestamp, row_id, direction, page):
+    """
+    Build an opaque cursor pointing at a (timestamp, id) position
+
+    Args:
+        timestamp: datetime of the boundary row (key columns are NOT NULL, a
+            NULL could neither be encoded nor compared in the range scan)
+        row_id: primary key of the boundary row
+        direction: 'next' (older rows) or 'prev' (newer rows)
+        page: page number the cursor leads to (display only)
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    payload = json.dumps({
+        't': timestamp.isoformat(),
+        'i': row_id,
+        'd': direction,
+        'p': page
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Returns:
+        dict with timestamp, id, direction and page, or None if the
+        cursor is missing or malformed (callers fall back to page one)
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = data['d']
+        if direction not in ('next', 'prev'):
+            return None
+        return {
+            'timestamp': datetime.fromisoformat(data['t']),
+            'id': int(data['i']),
+            'direction': direction,
+            'page': max(int(data.get('p', 1)), 1)
+        }
+    except Exception:
+        logger.debug(f"Ignoring malformed cursor: {cursor!r}")
+        return None
+
+
+def estimate_row_count(model):
+    """
+    Cheap row-count estimate for a model's table
+
+    Uses the planner statistics on PostgreSQL and the highest primary key
+    elsewhere, so it never runs a full COUNT(*). The result is cached briefly.
+    """
+    table_name = model.__tablename__
+    cache_key = f"row_estimate:{table_name}"
+    try:
+        cached = cache.get(cache_key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return cached
+
+    estimate = None
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            estimate = db.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                {'table': f'"{table_name}"'}
+            ).scalar()
+            # reltuples is -1 until the table has been analyzed
+            if estimate is not None and estimate < 0:
+                estimate = None
+        if estimate is None:
+            estimate = db.session.query(db.func.max(model.id)).scalar()
+    except Exception as e:
+        logger.warning(f"Could not estimate row count for {table_name}: {str(e)}")
+    estimate = int(estimate or 0)
+
+    try:
+        cache.set(cache_key, estimate, timeout=ROW_ESTIMATE_TIMEOUT)
+    except Exception:
+        pass
+    return estimate
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated query, newest rows first
+
+    Mirrors the attributes templates used from Flask-SQLAlchemy's
+    Pagination (items, page, pages, has_next, has_prev) and adds opaque
+    next_cursor / prev_cursor tokens. ``total`` and ``pages`` are estimates.
+    """
+
+    def __init__(self, items, per_page, page, has_next, has_prev, total,
+                 timestamp_attr='timestamp', id_attr='id'):
+        self.items = items
+        self.per_page = per_page
+        self.page = page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self.pages = max(math.ceil(total / per_page) if per_page else 1, page)
+        self.next_cursor = None
+        self.prev_cursor = None
+        if items and has_next:
+            last = items[-1]
+            self.next_cursor = encode_cursor(
+                getattr(last, timestamp_attr), getattr(last, id_attr), 'next', page + 1
+            )
+        if items and has_prev:
+            first = items[0]
+            self.prev_cursor = encode_cursor(
+                getattr(first, timestamp_attr), getattr(first, id_attr), 'prev', max(page - 1, 1)
+            )
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(query, timestamp_col, id_col, cursor=None, per_page=20, total=None, branches=None):
+    """
+    Paginate a query on a descending (timestamp, id) key without OFFSET
+
+    Each page is a single index range scan of per_page + 1 rows, so the
+    cost stays flat no matter how deep the cursor points.
+
+    A filter that is an OR across two indexed columns (e.g. either side of a
+    conversation) cannot use one range scan; pass its alternatives as
+    ``branches`` instead. Each branch is scanned on its own index with its
+    own LIMIT, the candidate ids are combined with UNION ALL, and only those
+    rows are ordered, so a page still reads at most per_page + 1 rows per
+    branch.
+
+    Args:
+        query: Base query (filters applied, no ordering)
+        timestamp_col: Timestamp column of the key
+        id_col: Primary key column used as tie-breaker
+        cursor: Opaque cursor from a previous page (None for the first page)
+        per_page: Rows per page
+        total: Row estimate for page-count display (optional)
+        branches: Filter criteria whose union is paginated (optional)
+
+    Returns:
+        KeysetPage
+    """
+    position = decode_cursor(cursor)
+    key = tuple_(timestamp_col, id_col)
+
+    def fetch(boundary, ordering):
+        if not branches:
+            scoped = query if boundary is None else query.filter(boundary)
+            return scoped.order_by(*ordering).limit(per_page + 1).all()
+        scans = []
+        for criterion in branches:
+            scan = db.select(id_col).where(criterion)
+            if boundary is not None:
+                scan = scan.where(boundary)
+            scans.append(db.select(scan.order_by(*ordering).limit(per_page + 1).subquery()))
+        candidates = db.union_all(*scans).subquery()
+        return query.filter(id_col.in_(db.select(candidates.c[0]))) \
+            .order_by(*ordering).limit(per_page + 1).all()
+
+    if position is None:
+        rows = fetch(None, (timestamp_col.desc(), id_col.desc()))
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = False
+        page = 1
+    elif position['direction'] == 'next':
+        rows = fetch(key < tuple_(position['timestamp'], position['id']),
+                     (timestamp_col.desc(), id_col.desc()))
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_prev = True
+        page = position['page']
+    else:
+        # Walk backwards in ascending order, then flip back to newest-first
+        rows = fetch(key > tuple_(position['timestamp'], position['id']),
+                     (timestamp_col.asc(), id_col.asc()))
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+        page = position['page'] if has_prev else 1
+
+    if total is None:
+        total = len(items)
+    return KeysetPage(items, per_page, page, has_next, has_prev, total,
+                      timestamp_attr=timestamp_col.key, id_attr=id_col.key)
@@ -0,0 +1,236 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import stripe
+from flask import current_app
+from sqlalchemy.orm import aliased
+from revmark import db
+from revmark.models import User, EscrowPayment, Request
+from revmark.stripe_utils import stripe_call, to_cents, transfer_idempotency_key, StripeUnavailableError
+from revmark.utils.email_utils import queue_email
+from revmark.listings import invalidate_request_listings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stripe rejected the transfer itself; retrying the same request will not help
+PERMANENT_ERRORS = (
+    stripe.error.InvalidRequestError,
+    stripe.error.PermissionError,
+    stripe.error.AuthenticationError,
+)
+
+# Rejections that clear up on their own: the platform balance is topped up
+# by incoming charges, and an idempotency conflict means another request
+# with the same key is in flight or was sent with different parameters
+RETRYABLE_ERROR_CODES = (
+    'balance_insufficient',
+    'idempotency_key_in_use',
+)
+
+
+def _is_permanent(error):
+    """True if a failed transfer should not be retried"""
+    if not isinstance(error, PERMANENT_ERRORS):
+        return False
+    if getattr(error, 'code', None) in RETRYABLE_ERROR_CODES:
+        return False
+    # Stripe reports reused keys with different parameters as invalid_request
+    # errors whose message names the idempotency key
+    return 'idempotent' not in str(error).lower()
+
+
+def eligible_payouts(statuses=('paid',), min_age_hours=None, limit=None):
+    """
+    Escrow payments ready to be released to their sellers
+
+    Args:
+        statuses: EscrowPayment statuses that count as funded
+        min_age_hours: Only payments older than this (escrow hold period)
+        limit: Maximum number of rows
+
+    Returns:
+        list of dicts (plain values, safe to hand to worker threads)
+    """
+    if min_age_hours is None:
+        min_age_hours = current_app.config.get('PAYOUT_MIN_AGE_HOURS', 72)
+    cutoff = datetime.utcnow() - timedelta(hours=min_age_hours)
+    seller = aliased(User)
+    buyer = aliased(User)
+
+    query = db.session.query(
+        EscrowPayment.id,
+        EscrowPayment.request_id,
+        EscrowPayment.buyer_id,
+        EscrowPayment.seller_id,
+        EscrowPayment.seller_amount,
+        EscrowPayment.platform_fee,
+        EscrowPayment.stripe_payment_intent_id,
+        seller.stripe_account_id,
+        seller.email.label('seller_email'),
+        buyer.email.label('buyer_email')
+    ).join(seller, seller.id == EscrowPayment.seller_id) \
+        .join(buyer, buyer.id == EscrowPayment.buyer_id) \
+        .filter(
+            EscrowPayment.status.in_(statuses),
+            EscrowPayment.stripe_transfer_id.is_(None),
+            # Destination charges were already paid out by Stripe
+            EscrowPayment.stripe_destination_account_id.is_(None),
+            EscrowPayment.created_at <= cutoff,
+            seller.stripe_account_id.isnot(None)
+        ).order_by(EscrowPayment.created_at, EscrowPayment.id)
+    if limit:
+        query = query.limit(limit)
+    return [dict(row._mapping) for row in query.all()]
+
+
+def _create_transfer(app, payout):
+    """Issue one transfer (runs on a pool thread); never raises"""
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            transfer = stripe_call('write', lambda client: client.transfers.create(params={
+                'amount': to_cents(payout['seller_amount']),
+                'currency': 'usd',
+                'destination': payout['stripe_account_id'],
+                'transfer_group': payout['stripe_payment_intent_id'],
+                'metadata': {
+                    'request_id': str(payout['request_id']),
+                    'buyer_id': str(payout['buyer_id']),
+                    'seller_id': str(payout['seller_id'])
+                }
+            }, options={'idempotency_key': transfer_idempotency_key(payout['stripe_payment_intent_id'])}))
+            return payout, transfer.id, None, time.perf_counter() - started
+        except Exception as e:
+            return payout, None, e, time.perf_counter() - started
+
+
+def _record_chunk(results, stats, statuses):
+    """Write one chunk of transfer results in a single transaction
+
+    Rows are only updated while they are still unreleased and in one of the
+    run's statuses, so a refund or manual release that landed while the
+    transfer was in flight is not overwritten.
+    """
+    now = datetime.utcnow()
+    completed_request_ids = []
+    for payout, transfer_id, error, latency in results:
+        unreleased = EscrowPayment.query.filter(
+            EscrowPayment.id == payout['id'],
+            EscrowPayment.status.in_(statuses),
+            EscrowPayment.stripe_transfer_id.is_(None)
+        )
+        if transfer_id:
+            recorded = unreleased.update({
+                'stripe_transfer_id': transfer_id,
+                'status': 'completed',
+                'completed_at': now
+            }, synchronize_session=False)
+            if not recorded:
+                # The money has moved but the escrow row says otherwise
+                logger.error(f"🚨 Transfer {transfer_id} for escrow {payout['id']} not recorded: "
+                             f"the payment changed during the run, reconcile it by hand")
+                stats['conflicts'] += 1
+                continue
+            Request.query.filter_by(id=payout['request_id']).update({
+                'stripe_transfer_id': transfer_id,
+                'status': 'completed'
+            }, synchronize_session=False)
+            request_id = payout['request_id']
+            completed_request_ids.append(request_id)
+            queue_email(f"Payment released for Request #{request_id}", [payout['buyer_email']],
+                        f"Your payment for Request #{request_id} has been released to the seller.",
+                        commit=False)
+            queue_email(f"You received payment for Request #{request_id}", [payout['seller_email']],
+                        f"A payment for Request #{request_id} has been released to your account. Amount: ${payout['seller_amount']:.2f}",
+                        commit=False)
+            stats['released'] += 1
+            stats['amount_released'] += payout['seller_amount']
+        elif _is_permanent(error):
+            unreleased.update({'status': 'failed'}, synchronize_session=False)
+            logger.error(f"❌ Payout for escrow {payout['id']} rejected: {str(error)}")
+            stats['failed'] += 1
+        else:
+            # Transient: left as-is for the next run
+            logger.warning(f"Payout for escrow {payout['id']} will be retried: {str(error)}")
+            stats['retry_later'] += 1
+    db.session.commit()
+    if completed_request_ids:
+        invalidate_request_listings(*completed_request_ids)
+
+
+def _latency_summary(latencies):
+    if not latencies:
+        return {'p50_ms': 0, 'p95_ms': 0, 'max_ms': 0}
+    ordered = sorted(latencies)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+    return {'p50_ms': round(pick(0.5), 1), 'p95_ms': round(pick(0.95), 1), 'max_ms': round(ordered[-1] * 1000, 1)}
+
+
+def release_payouts(limit=None, min_age_hours=None, workers=None, chunk_size=None,
+                    statuses=('paid',), dry_run=False):
+    """
+    Release funded escrow payments to sellers in bulk
+
+    Transfers are issued concurrently by a bounded thread pool; each uses the
+    same idempotency key as a manual release, so re-running after a crash or
+    overlapping runs cannot pay twice. Results are committed one chunk at a
+    time, so a failure midway loses at most one chunk of bookkeeping (which
+    the idempotency keys recover on the next run). The run stops early if the
+    Stripe circuit breaker opens.
+
+    Args:
+        limit: Maximum number of payouts this run
+        min_age_hours: Escrow hold period (default PAYOUT_MIN_AGE_HOURS)
+        workers: Concurrent Stripe requests (default PAYOUT_WORKERS)
+        chunk_size: Payouts per transaction (default PAYOUT_CHUNK_SIZE)
+        statuses: EscrowPayment statuses eligible for release
+        dry_run: Only report what would be released
+
+    Returns:
+        dict: Counts, amounts, elapsed seconds, throughput and latency percentiles
+    """
+    config = current_app.config
+    workers = workers or config.get('PAYOUT_WORKERS', 8)
+    chunk_size = chunk_size or config.get('PAYOUT_CHUNK_SIZE', 100)
+    started = time.perf_counter()
+
+    payouts = eligible_payouts(statuses=statuses, min_age_hours=min_age_hours, limit=limit)
+    # Release the read snapshot before the long-running transfers
+    db.session.rollback()
+    stats = {
+        'eligible': len(payouts),
+        'amount_eligible': round(sum(p['seller_amount'] for p in payouts), 2),
+        'released': 0,
+        'amount_released': 0.0,
+        'failed': 0,
+        'retry_later': 0,
+        'conflicts': 0,
+        'skipped': 0,
+        'dry_run': dry_run
+    }
+    latencies = []
+
+    if dry_run:
+        for payout in payouts:
+            logger.info(f"[dry run] Would transfer ${payout['seller_amount']:.2f} to "
+                        f"{payout['stripe_account_id']} for escrow {payout['id']}")
+    else:
+        app = current_app._get_current_object()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='payout') as pool:
+            for offset in range(0, len(payouts), chunk_size):
+                chunk = payouts[offset:offset + chunk_size]
+                results = list(pool.map(lambda payout: _create_transfer(app, payout), chunk))
+                latencies.extend(latency for _, _, _, latency in results)
+                _record_chunk(results, stats, statuses)
+                if any(isinstance(error, StripeUnavailableError) for _, _, error, _ in results):
+                    stats['skipped'] = len(payouts) - offset - len(chunk)
+                    logger.warning(f"⚡ Stripe unavailable, stopping payout run ({stats['skipped']} skipped)")
+                    break
+
+    elapsed = time.perf_counter() - started
+    stats['amount_released'] = round(stats['amount_released'], 2)
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['payouts_per_second'] = round(len(latencies) / elapsed, 1) if elapsed and latencies else 0
+    stats.update(_latency_summary(latencies))
+    return stats
@@ -0,0 +1,287 @@
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+from revmark import db
+from revmark.models import EscrowPayment, Request
+from revmark.listings import invalidate_request_listings
+from revmark.stripe_utils import stripe_call, to_cents
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+
+# Order in which sources are walked; refunds and transfers come after
+# PaymentIntents so their (later) states win when repairing
+SOURCES = ('payment_intents', 'transfers', 'refunds')
+
+# EscrowPayment status implied by each PaymentIntent status; unlisted
+# statuses (processing, requires_action, ...) are still in flight
+INTENT_STATUS = {
+    'succeeded': 'paid',
+    'canceled': 'failed',
+}
+
+# Escrow statuses that already account for a succeeded PaymentIntent
+SETTLED_STATUSES = ('paid', 'completed', 'refunded')
+
+
+class Checkpoint:
+    """
+    Resumable position of a reconciliation run, stored as a small JSON file
+
+    For each source it records the id of the last Stripe object whose page
+    was fully reconciled (lists are newest-first, so a resumed run continues
+    with starting_after=that id) and whether the source is finished.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def position(self, source):
+        return self.state.get(source, {})
+
+    def advance(self, source, last_id=None, done=False):
+        self.state[source] = {'starting_after': last_id, 'done': done}
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.state = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Reconciler:
+    """
+    Walk Stripe PaymentIntents, Transfers and Refunds and diff them against
+    EscrowPayment / Request
+
+    Stripe objects are streamed with auto-paging iterators and joined a page
+    at a time (one IN query per page), so memory stays constant however many
+    objects there are. Every discrepancy is written to ``report`` as one JSON
+    line; with ``repair`` the database is updated to match Stripe, one
+    transaction per page.
+
+    Args:
+        report: Writable text file for the JSONL diff report
+        repair: Apply fixes (default: report only)
+        checkpoint: Checkpoint instance (optional) to resume interrupted runs
+        created_gte: Only consider Stripe objects created at/after this Unix time
+            (a resumed run keeps the checkpoint's cutoff)
+    """
+
+    def __init__(self, report, repair=False, checkpoint=None, created_gte=None):
+        self.report = report
+        self.repair = repair
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.created_gte = created_gte
+        # A checkpoint only applies to a run with the same options. A window
+        # given relative to now (--since-days) moves between runs, so a resumed
+        # run keeps the cutoff it started with.
+        stored = self.checkpoint.state.get('options')
+        if stored is not None:
+            if stored.get('repair') == repair and (stored.get('created_gte') is None) == (created_gte is None):
+                self.created_gte = stored.get('created_gte')
+            else:
+                logger.warning("Checkpoint was written with different options, starting over")
+                self.checkpoint.clear()
+        self.checkpoint.state['options'] = {'repair': repair, 'created_gte': self.created_gte}
+        self.stats = {'objects': 0, 'ignored': 0, 'matched': 0, 'diffs': 0, 'repaired': 0}
+        # Requests whose status was repaired in the current page
+        self._repaired_request_ids = set()
+
+    # ---------- STREAMING ----------
+
+    def _iter_source(self, source):
+        params = {'limit': PAGE_SIZE}
+        if self.created_gte:
+            params['created'] = {'gte': int(self.created_gte)}
+        starting_after = self.checkpoint.position(source).get('starting_after')
+        if starting_after:
+            params['starting_after'] = starting_after
+        first_page = stripe_call('list', lambda client: getattr(client, source).list(params=params))
+        return first_page.auto_paging_iter()
+
+    def _pages(self, source):
+        objects = self._iter_source(source)
+        while True:
+            page = list(itertools.islice(objects, PAGE_SIZE))
+            if not page:
+                return
+            yield page
+
+    def _escrows_for(self, payment_intent_ids):
+        ids = [pi for pi in set(payment_intent_ids) if pi]
+        if not ids:
+            return {}
+        escrows = EscrowPayment.query.filter(EscrowPayment.stripe_payment_intent_id.in_(ids)).all()
+        return {escrow.stripe_payment_intent_id: escrow for escrow in escrows}
+
+    def _requests_for(self, escrows):
+        ids = {escrow.request_id for escrow in escrows}
+        if not ids:
+            return {}
+        return {r.id: r for r in Request.query.filter(Request.id.in_(ids)).all()}
+
+    # ---------- DIFFING ----------
+
+    def _diff(self, source, obj, escrow, field, db_value, stripe_value, fix=None):
+        repaired = False
+        if self.repair and fix is not None:
+            fix()
+            repaired = True
+            self.stats['repaired'] += 1
+        self.stats['diffs'] += 1
+        self.report.write(json.dumps({
+            'source': source,
+            'stripe_id': obj['id'],
+            'payment_intent': escrow.stripe_payment_intent_id if escrow else self._payment_intent_of(source, obj),
+            'escrow_id': escrow.id if escrow else None,
+            'request_id': escrow.request_id if escrow else None,
+            'field': field,
+            'db': db_value,
+            'stripe': stripe_value,
+            'repaired': repaired
+        }) + '\n')
+
+    def _check_request(self, source, obj, escrow, request_obj, expected):
+        if request_obj and request_obj.status != expected:
+            def fix():
+                request_obj.status = expected
+                self._repaired_request_ids.add(request_obj.id)
+            self._diff(source, obj, escrow, 'request.status', request_obj.status, expected, fix)
+
+    def _reconcile_intent(self, intent, escrow, request_obj):
+        source = 'payment_intents'
+        if escrow is None:
+            self._diff(source, intent, None, 'escrow', None, intent['status'])
+            return
+        expected_cents = intent['amount']
+        if to_cents(escrow.amount) != expected_cents:
+            self._diff(source, intent, escrow, 'amount', escrow.amount, expected_cents / 100)
+
+        expected = INTENT_STATUS.get(intent['status'])
+        if expected == 'paid':
+            if escrow.status not in SETTLED_STATUSES:
+                def fix():
+                    escrow.status = 'paid'
+                self._diff(source, intent, escrow, 'status', escrow.status, 'paid', fix)
+            if escrow.status not in ('completed', 'refunded'):
+                # Later states are checked by the transfer and refund passes
+                self._check_request(source, intent, escrow, request_obj, 'funded')
+        elif expected == 'failed' and escrow.status == 'pending':
+            def fix():
+                escrow.status = 'failed'
+            self._diff(source, intent, escrow, 'status', escrow.status, 'failed', fix)
+        elif expected is None and escrow.status in SETTLED_STATUSES:
+            # Marked paid locally but Stripe never captured the money
+            self._diff(source, intent, escrow, 'status', escrow.status, intent['status'])
+
+    def _reconcile_transfer(self, transfer, escrow, request_obj):
+        source = 'transfers'
+        if escrow is None:
+            self._diff(source, transfer, None, 'escrow', None, transfer.get('transfer_group'))
+            return
+        if escrow.status == 'refunded':
+            self._diff(source, transfer, escrow, 'status', escrow.status, 'transferred')
+            return
+        if escrow.stripe_transfer_id != transfer['id'] or escrow.status != 'completed':
+            def fix():
+                escrow.stripe_transfer_id = transfer['id']
+                escrow.status = 'completed'
+                escrow.completed_at = escrow.completed_at or datetime.utcfromtimestamp(transfer['created'])
+                if request_obj:
+                    request_obj.stripe_transfer_id = transfer['id']
+            self._diff(source, transfer, escrow, 'transfer', escrow.stripe_transfer_id, transfer['id'], fix)
+        self._check_request(source, transfer, escrow, request_obj, 'completed')
+
+    def _reconcile_refund(self, refund, escrow, request_obj):
+        source = 'refunds'
+        if refund.get('status') not in ('succeeded', 'pending') or escrow is None:
+            # Failed refunds change nothing; refunds of other charges are not ours
+            return False
+        if escrow.status != 'refunded':
+            def fix():
+                escrow.status = 'refunded'
+                escrow.completed_at = escrow.completed_at or datetime.utcfromtimestamp(refund['created'])
+            self._diff(source, refund, escrow, 'status', escrow.status, 'refunded', fix)
+        self._check_request(source, refund, escrow, request_obj, 'cancelled')
+        return True
+
+    # ---------- DRIVER ----------
+
+    @staticmethod
+    def _payment_intent_of(source, obj):
+        if source == 'refunds':
+            return obj.get('payment_intent')
+        # Only PaymentIntents and Transfers created by RevMark carry a request_id
+        if not (obj.get('metadata') or {}).get('request_id'):
+            return None
+        if source == 'transfers':
+            return obj.get('transfer_group')
+        return obj['id']
+
+    def run_source(self, source):
+        if self.checkpoint.position(source).get('done'):
+            logger.info(f"Skipping {source} (already reconciled in this run)")
+            return
+        handler = {
+            'payment_intents': self._reconcile_intent,
+            'transfers': self._reconcile_transfer,
+            'refunds': self._reconcile_refund,
+        }[source]
+
+        for page in self._pages(source):
+            keyed = [(obj, self._payment_intent_of(source, obj)) for obj in page]
+            escrows = self._escrows_for(pi for _, pi in keyed)
+            requests_by_id = self._requests_for(escrows.values())
+            for obj, payment_intent_id in keyed:
+                self.stats['objects'] += 1
+                if not payment_intent_id:
+                    self.stats['ignored'] += 1
+                    continue
+                escrow = escrows.get(payment_intent_id)
+                diffs_before = self.stats['diffs']
+                request_obj = requests_by_id.get(escrow.request_id) if escrow else None
+                if handler(obj, escrow, request_obj) is False:
+                    self.stats['ignored'] += 1
+                elif self.stats['diffs'] == diffs_before:
+                    self.stats['matched'] += 1
+            if self.repair:
+                db.session.commit()
+                if self._repaired_request_ids:
+                    invalidate_request_listings(*self._repaired_request_ids)
+                    self._repaired_request_ids.clear()
+            else:
+                db.session.rollback()
+            self.report.flush()
+            self.checkpoint.advance(source, last_id=page[-1]['id'])
+        self.checkpoint.advance(source, done=True)
+
+    def run(self, sources=SOURCES):
+        """
+        Reconcile each source in turn, resuming from the checkpoint
+
+        Returns:
+            dict: Object, match, diff and repair counts plus elapsed seconds
+        """
+        started = time.perf_counter()
+        for source in sources:
+            self.run_source(source)
+        self.checkpoint.clear()
+        self.stats['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+        return self.stats
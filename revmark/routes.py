@@ -1,21 +1,21 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy.orm import joinedload, selectinload
 from revmark import db, cache
-from revmark.utils.email_utils import send_email
-from revmark.models import User, Request, Message, MessageAttachment, EscrowPayment
-from revmark.stripe_utils import StripeManager
+from revmark.utils.email_utils import send_email, queue_email, queue_message_notification
+from revmark.utils.request_cache import invalidate_request_cache
+from revmark.models import User, Request, Message, MessageAttachment, EscrowPayment, Conversation
+from revmark.pagination import keyset_paginate
+from revmark.listings import request_feed_page, request_detail, invalidate_request_listings
 
 bp = Blueprint("main", __name__)
 
 # ---------- PAGES ----------
 @bp.route("/")
 def index():
-    page = request.args.get('page', 1, type=int)
-    requests = Request.query.order_by(Request.timestamp.desc()).paginate(
-        page=page, per_page=12, error_out=False
-    )
+    requests = request_feed_page(request.args.get('cursor'), 12)
     return render_template("index.html", requests=requests)
 
 @bp.route("/about")
@@ -34,7 +34,7 @@ def contact():
         admin_email = current_app.config.get("MAIL_DEFAULT_SENDER", (None, "admin@example.com"))[1]
         body = f"Contact form submission from {name} <{email}>\n\nSubject: {subject}\n\nMessage:\n{message}"
         try:
-            send_email(f"[RevMark Contact] {subject}", [admin_email], body)
+            queue_email(f"[RevMark Contact] {subject}", [admin_email], body)
             flash(f"Thank you {name}! Your message has been sent. We'll get back to you at {email} soon.", "success")
         except Exception as e:
             flash(f"Sorry, there was an error sending your message. Please try again later.", "danger")
@@ -114,10 +114,11 @@ def post_request():
             title=title,
             description=description,
             budget=float(budget) if budget else None,
-            buyer=current_user
+            buyer_id=current_user.id
         )
         db.session.add(new_request)
         db.session.commit()
+        invalidate_request_listings(new_request.id)
         flash("Request posted successfully!", "success")
         return redirect(url_for("main.index"))
 
@@ -128,17 +129,49 @@ def post_request():
 @bp.route("/inbox")
 @login_required
 def inbox():
-    # All messages where user is receiver
-    messages = Message.query.filter_by(receiver_id=current_user.id).order_by(Message.timestamp.desc()).all()
+    # One row per conversation partner, most recent activity first
+    page = keyset_paginate(
+        Conversation.query.options(
+            joinedload(Conversation.user_low),
+            joinedload(Conversation.user_high),
+            joinedload(Conversation.last_message)
+        ),
+        Conversation.last_timestamp, Conversation.id,
+        cursor=request.args.get('cursor'), per_page=25,
+        branches=Conversation.participant_filters(current_user.id)
+    )
+    # Snapshot what the template needs before the commit below expires the rows
+    conversations = []
+    for conversation in page.items:
+        partner = conversation.partner(current_user.id)
+        last_message = conversation.last_message
+        conversations.append({
+            "partner_id": partner.id,
+            "partner_username": partner.username,
+            "last_body": last_message.body if last_message else None,
+            "last_sent_by_me": bool(last_message and last_message.sender_id == current_user.id),
+            "last_timestamp": conversation.last_timestamp,
+            "unread": conversation.unread_for(current_user.id),
+            "has_pending_offer": conversation.has_pending_offer
+        })
     
-    # Mark all messages as read when user visits inbox
-    unread_messages = Message.query.filter_by(receiver_id=current_user.id, is_read=False).all()
-    for message in unread_messages:
-        message.is_read = True
-    if unread_messages:
+    # Mark all messages as read when user visits inbox (one set-based UPDATE)
+    marked = Message.query.filter_by(receiver_id=current_user.id, is_read=False).update(
+        {Message.is_read: True}, synchronize_session=False
+    )
+    if marked:
+        User.query.filter_by(id=current_user.id).update({
+            User.unread_count: db.case(
+                (User.unread_count > marked, User.unread_count - marked),
+                else_=0
+            )
+        }, synchronize_session=False)
+        Conversation.mark_read_for(current_user.id)
         db.session.commit()
+        invalidate_request_cache(("unread_count", current_user.id))
+        User.invalidate_unread_count(current_user.id)
     
-    return render_template("inbox.html", messages=messages)
+    return render_template("inbox.html", conversations=conversations, page=page)
 
 
 @bp.route("/message/<int:receiver_id>", methods=["GET", "POST"])
@@ -149,7 +182,7 @@ def message(receiver_id):
     if request.method == "POST":
         body = request.form["body"]
         is_offer = 'is_offer' in request.form  # Checkbox or hidden input in form for offers
-        msg = Message(body=body, sender=current_user, receiver=receiver, is_offer=is_offer)
+        msg = Message(body=body, sender_id=current_user.id, receiver_id=receiver.id, is_offer=is_offer)
         db.session.add(msg)
         db.session.flush()  # Get the message ID
         
@@ -159,77 +192,96 @@ def message(receiver_id):
             for file in files:
                 if file and file.filename:
                     try:
-                        # Check if AWS S3 is configured
-                        if not current_app.config.get('AWS_ACCESS_KEY_ID'):
+                        # Check if file storage is configured
+                        from revmark.s3_utils import s3_manager
+                        if not s3_manager.is_configured():
                             flash("File upload not available (AWS S3 not configured)", "warning")
                             continue
                             
-                        # Upload to S3
-                        from revmark.s3_utils import s3_manager
-                        file_info = s3_manager.upload_file(file, folder="message-attachments")
+                        # Upload to S3 (or the local storage backend)
+                        # Content-addressed: a file sent before is not uploaded again
+                        file_info = s3_manager.upload_blob(file)
                         
                         # Create attachment record
-                        attachment = MessageAttachment(
-                            message_id=msg.id,
-                            filename=file_info['s3_key'].split('/')[-1],
-                            original_filename=file_info['original_filename'],
-                            s3_key=file_info['s3_key'],
-                            file_size=file_info['file_size'],
-                            content_type=file_info['content_type']
-                        )
-                        db.session.add(attachment)
+                        db.session.add(MessageAttachment.from_file_info(msg.id, file_info))
                     except Exception as e:
                         flash(f"Failed to upload {file.filename}: File upload service unavailable", "warning")
         
+        # Files the browser already uploaded straight to S3 (see /api/uploads/init)
+        for s3_key in request.form.getlist('upload_keys'):
+            try:
+                from revmark.s3_utils import s3_manager
+                file_info = s3_manager.verify_upload(
+                    s3_key, folder="message-attachments", owner_id=current_user.id
+                )
+                db.session.add(MessageAttachment.from_file_info(msg.id, file_info))
+            except ValueError as e:
+                flash(f"Could not attach upload: {str(e)}", "warning")
+            except Exception:
+                flash("Could not attach upload: File upload service unavailable", "warning")
+        
+        # Keep the receiver's unread counter and the conversation summary in step
+        User.query.filter_by(id=receiver.id).update(
+            {User.unread_count: User.unread_count + 1}, synchronize_session=False
+        )
+        Conversation.record_message(msg)
         db.session.commit()
-        # Send email notification to receiver
+        User.invalidate_unread_count(receiver.id)
+        # Send email notification to receiver (immediately or in their digest)
         try:
-            recipient = receiver.email
             subject = f"New message from {current_user.username} on RevMark"
             if is_offer:
                 subject = f"New offer from {current_user.username} on RevMark"
             body_email = f"You have a new message from {current_user.username}:\n\n{body}\n\nView the conversation in your RevMark inbox."
-            send_email(subject, [recipient], body_email)
+            queue_message_notification(receiver, subject, body_email)
         except Exception:
-            current_app.logger.exception("Failed to send message notification email")
+            current_app.logger.exception("Failed to queue message notification email")
         flash("Message sent!" if not is_offer else "Offer sent!", "success")
         return redirect(url_for("main.message", receiver_id=receiver.id))
 
-    # Conversation thread
-    thread = Message.query.filter(
-        ((Message.sender_id == current_user.id) & (Message.receiver_id == receiver.id)) |
-        ((Message.sender_id == receiver.id) & (Message.receiver_id == current_user.id))
-    ).order_by(Message.timestamp.asc()).all()
+    # Conversation thread: the most recent page, older pages by cursor
+    conversation = Conversation.between(current_user.id, receiver.id)
+    page = None
+    thread = []
+    if conversation:
+        page = keyset_paginate(
+            Message.query.options(selectinload(Message.attachments))
+                .filter(Message.conversation_id == conversation.id),
+            Message.timestamp, Message.id,
+            cursor=request.args.get('cursor'), per_page=50
+        )
+        # Pages come newest-first; the thread reads oldest-first
+        thread = list(reversed(page.items))
 
     # Add presigned URL and is_image to each attachment
     from revmark.s3_utils import s3_manager
     def is_image_type(content_type):
         return content_type and content_type.startswith("image/")
 
-    for m in thread:
-        for attachment in m.attachments:
-            try:
-                attachment.download_url = s3_manager.generate_presigned_url(attachment.s3_key)
-            except Exception:
-                attachment.download_url = None
-            attachment.is_image = is_image_type(attachment.content_type)
+    attachments = [attachment for m in thread for attachment in m.attachments]
+    # Images are shown by their thumbnail (once rendered) and link to the original
+    keys = [a.s3_key for a in attachments] + [a.thumbnail_key for a in attachments if a.thumbnail_key]
+    download_urls = s3_manager.generate_presigned_urls(keys) if attachments else {}
+    for attachment in attachments:
+        attachment.download_url = download_urls.get(attachment.s3_key)
+        attachment.thumbnail_url = download_urls.get(attachment.thumbnail_key) if attachment.thumbnail_key else None
+        attachment.is_image = is_image_type(attachment.content_type)
 
-    return render_template("thread.html", receiver=receiver, thread=thread)
+    return render_template("thread.html", receiver=receiver, thread=thread, page=page)
 
 
 # ---------- BROWSE & VIEW REQUESTS ----------
 @bp.route("/browse")
 def browse_requests():
-    page = request.args.get('page', 1, type=int)
-    requests = Request.query.order_by(Request.timestamp.desc()).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    requests = request_feed_page(request.args.get('cursor'), 10)
     return render_template("browse_requests.html", requests=requests)
 
 
 @bp.route("/request/<int:request_id>")
 def view_request(request_id):
-    request_item = Request.query.get_or_404(request_id)
+    request_item = request_detail(request_id)
+    if request_item is None:
+        abort(404)
     return render_template("view_request.html", request=request_item)
 
 
@@ -265,23 +317,29 @@ def payment(request_id):
 @login_required
 def seller_onboarding_complete():
     """Handle successful Stripe Connect onboarding"""
-    if not current_user.stripe_account_id:
+    user = User.query.get(current_user.id)
+    if not user.stripe_account_id:
         flash("No seller account found. Please contact support.", "danger")
         return redirect(url_for("main.account"))
     
     # Update onboarding status
     from revmark.stripe_utils import stripe_manager
     try:
-        status = stripe_manager.get_account_status(current_user.stripe_account_id)
+        status = stripe_manager.get_account_status(user.stripe_account_id)
+        if status and not (status['charges_enabled'] and status['payouts_enabled'] and status['details_submitted']):
+            # The cached snapshot may predate the onboarding just finished
+            status = stripe_manager.get_account_status(user.stripe_account_id, max_age=0)
         if status:
-            current_user.stripe_onboarding_complete = (
+            onboarding_complete = (
                 status['charges_enabled'] and 
                 status['payouts_enabled'] and 
                 status['details_submitted']
             )
-            db.session.commit()
+            if user.stripe_onboarding_complete != onboarding_complete:
+                user.stripe_onboarding_complete = onboarding_complete
+                db.session.commit()
             
-        if current_user.stripe_onboarding_complete:
+        if user.stripe_onboarding_complete:
             flash("Congratulations! Your seller account is now active. You can start receiving payments.", "success")
         else:
             flash("Your seller account is being reviewed. You'll be able to receive payments once approved.", "info")
@@ -305,7 +363,32 @@ def seller_onboarding_refresh():
 def account():
     tab = request.args.get('tab', 'profile')  # Default to profile tab
     user_requests = Request.query.filter_by(buyer_id=current_user.id).order_by(Request.timestamp.desc()).all()
-    return render_template("account.html", requests=user_requests, active_tab=tab)
+    
+    # Message totals via COUNT subqueries instead of loading both collections
+    received = db.select(db.func.count(Message.id)).where(Message.receiver_id == current_user.id).scalar_subquery()
+    sent = db.select(db.func.count(Message.id)).where(Message.sender_id == current_user.id).scalar_subquery()
+    received_count, sent_count = db.session.execute(db.select(received, sent)).one()
+    message_stats = {"received": received_count, "sent": sent_count}
+    
+    return render_template("account.html", requests=user_requests, active_tab=tab, message_stats=message_stats)
+
+
+@bp.route("/account/notifications", methods=["POST"])
+@login_required
+def update_notification_settings():
+    digest = request.form.get("notification_digest", "immediate")
+    if digest not in ("immediate", "batched", "daily"):
+        flash("Invalid notification setting.", "danger")
+        return redirect(url_for("main.account", tab="settings"))
+    
+    user = User.query.get(current_user.id)
+    user.notification_digest = digest
+    if digest == "batched":
+        interval = request.form.get("digest_interval_minutes", 15, type=int) or 15
+        user.digest_interval_minutes = min(max(interval, 5), 24 * 60)
+    db.session.commit()
+    flash("Notification preferences saved.", "success")
+    return redirect(url_for("main.account", tab="settings"))
 
 
 @bp.route("/delete_request/<int:request_id>", methods=["POST"])
@@ -321,6 +404,7 @@ def delete_request(request_id):
     # Delete the request
     db.session.delete(request_item)
     db.session.commit()
+    invalidate_request_listings(request_id)
     flash("Request deleted successfully!", "success")
     return redirect(url_for("main.account"))
 
@@ -374,22 +458,23 @@ def onboard_seller():
     
     try:
         stripe_manager = StripeManager()
+        user = User.query.get(current_user.id)
         
         # Create or retrieve Stripe account
-        if not current_user.stripe_account_id:
+        if not user.stripe_account_id:
             # Create new connected account
             account = stripe_manager.create_connect_account(
-                email=current_user.email,
+                email=user.email,
                 user_id=current_user.id
             )
             
             # Save account ID to user
-            current_user.stripe_account_id = account['id']
+            user.stripe_account_id = account['id']
             db.session.commit()
         
         # Create onboarding link
         account_link = stripe_manager.create_account_link(
-            account_id=current_user.stripe_account_id,
+            account_id=user.stripe_account_id,
             return_url=url_for('main.stripe_onboard_complete', _external=True),
             refresh_url=url_for('main.stripe_onboard_refresh', _external=True)
         )
@@ -408,15 +493,20 @@ def stripe_onboard_complete():
     
     try:
         stripe_manager = StripeManager()
+        user = User.query.get(current_user.id)
         
-        if current_user.stripe_account_id:
+        if user.stripe_account_id:
             # Check account status
-            account = stripe_manager.get_account(current_user.stripe_account_id)
+            account = stripe_manager.get_account(user.stripe_account_id)
+            if not (account.get('details_submitted') and account.get('charges_enabled')):
+                # The cached snapshot may predate the onboarding just finished
+                account = stripe_manager.get_account(user.stripe_account_id, max_age=0)
             
             # Update onboarding status based on account details
             if account.get('details_submitted') and account.get('charges_enabled'):
-                current_user.stripe_onboarding_complete = True
-                db.session.commit()
+                if not user.stripe_onboarding_complete:
+                    user.stripe_onboarding_complete = True
+                    db.session.commit()
                 flash("🎉 Stripe account connected successfully! You can now receive payments.", "success")
             else:
                 flash("Please complete your Stripe account setup to receive payments.", "warning")
@@ -453,8 +543,9 @@ def admin_test_email():
 
 @bp.route("/stripe/webhook", methods=["POST"])
 def stripe_webhook():
-    """Handle Stripe webhooks for payment and account events"""
+    """Verify and record Stripe webhooks; the worker applies them (see revmark.stripe_events)"""
     from revmark.stripe_utils import StripeManager
+    from revmark.stripe_events import record_event
     import stripe
     
     payload = request.data
@@ -464,55 +555,10 @@ def stripe_webhook():
         stripe_manager = StripeManager()
         event = stripe_manager.verify_webhook(payload, sig_header)
         
-        current_app.logger.info(f"Received Stripe webhook: {event['type']}")
-        
-        if event["type"] == "payment_intent.succeeded":
-            payment_intent = event["data"]["object"]
-            current_app.logger.info(f"💰 Payment successful for {payment_intent['id']}")
-            
-            # Update request and escrow payment status
-            request_id = payment_intent['metadata'].get('request_id')
-            if request_id:
-                request_obj = Request.query.get(request_id)
-                if request_obj:
-                    request_obj.status = 'funded'
-                    db.session.commit()
-                    
-                # Update escrow payment record
-                escrow_payment = EscrowPayment.query.filter_by(
-                    stripe_payment_intent_id=payment_intent['id']
-                ).first()
-                if escrow_payment:
-                    escrow_payment.status = 'paid'
-                    escrow_payment.paid_at = datetime.utcnow()
-                    db.session.commit()
-            
-        elif event["type"] == "transfer.paid":
-            transfer = event["data"]["object"]
-            current_app.logger.info(f"✅ Transfer completed for {transfer['id']}")
-            
-            # Find and update related request status
-            if 'metadata' in transfer and 'request_id' in transfer['metadata']:
-                request_id = transfer['metadata']['request_id']
-                request_obj = Request.query.get(request_id)
-                if request_obj:
-                    request_obj.status = 'completed'
-                    db.session.commit()
-            
-        elif event["type"] == "account.updated":
-            account = event["data"]["object"]
-            current_app.logger.info(f"👤 Account updated: {account['id']}")
-            
-            # Update user's onboarding status
-            user = User.query.filter_by(stripe_account_id=account['id']).first()
-            if user:
-                if account.get('details_submitted') and account.get('charges_enabled'):
-                    user.stripe_onboarding_complete = True
-                    db.session.commit()
-                    
-        elif event["type"] == "payment_intent.payment_failed":
-            payment_intent = event["data"]["object"]
-            current_app.logger.warning(f"❌ Payment failed for {payment_intent['id']}")
+        if record_event(event):
+            current_app.logger.info(f"Received Stripe webhook: {event['type']} ({event['id']})")
+        else:
+            current_app.logger.info(f"Duplicate Stripe webhook ignored: {event['id']}")
             
         return "Success", 200
         
@@ -526,6 +572,35 @@ def stripe_webhook():
         current_app.logger.error(f"Webhook error: {str(e)}")
         return "Webhook error", 500
 
+# ---------- LOCAL FILE STORAGE ----------
+# Signed URLs handed out by the local storage backend (STORAGE_BACKEND=local)
+@bp.route("/files/<token>")
+def local_file(token):
+    from revmark.s3_utils import s3_manager
+    from revmark.storage import LocalStorage
+    backend = s3_manager.backend
+    if not isinstance(backend, LocalStorage):
+        abort(404)
+    try:
+        return backend.send(token)
+    except ValueError:
+        abort(403)
+    except FileNotFoundError:
+        abort(404)
+
+@bp.route("/files/upload/<token>", methods=["POST"])
+def local_upload(token):
+    from revmark.s3_utils import s3_manager
+    from revmark.storage import LocalStorage
+    backend = s3_manager.backend
+    if not isinstance(backend, LocalStorage):
+        abort(404)
+    try:
+        backend.receive(token, request.files.get('file'))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return "", 204
+
 @bp.route("/terms")
 def terms():
     return render_template("terms.html")
@@ -537,6 +612,7 @@ def privacy():
 @bp.route("/approve_offer", methods=["POST"])
 @login_required
 def approve_offer():
+    from revmark.stripe_utils import StripeManager
     message_id = request.form.get("message_id")
     msg = Message.query.get_or_404(message_id)
     # Only receiver (buyer) can approve
@@ -544,6 +620,7 @@ def approve_offer():
         flash("Invalid offer approval.", "danger")
         return redirect(url_for("main.message", receiver_id=msg.sender_id))
     msg.offer_approved = True
+    Conversation.refresh_offer_flag(msg.sender_id, msg.receiver_id)
     db.session.commit()
     # --- Stripe payment release logic ---
     try:
@@ -562,9 +639,9 @@ def approve_offer():
         try:
             subject = f"Your offer was approved on RevMark"
             body_email = f"Congratulations! Your offer was approved and payment has been released to your account.\n\nRequest: {request_obj.title}"
-            send_email(subject, [seller.email], body_email)
+            queue_email(subject, [seller.email], body_email)
         except Exception:
-            current_app.logger.exception("Failed to send offer approval email to seller")
+            current_app.logger.exception("Failed to queue offer approval email to seller")
     except Exception as e:
         flash(f"Offer approved, but payment release failed: {str(e)}", "warning")
     return redirect(url_for("main.message", receiver_id=msg.sender_id))
@@ -579,13 +656,14 @@ def reject_offer():
     if msg.receiver_id != current_user.id or not msg.is_offer or msg.offer_approved or msg.offer_rejected:
         return {"error": "Invalid offer rejection."}, 400
     msg.offer_rejected = True
+    Conversation.refresh_offer_flag(msg.sender_id, msg.receiver_id)
     db.session.commit()
     # Notify seller by email
     try:
         seller = User.query.get(msg.sender_id)
         subject = f"Your offer was rejected on RevMark"
         body_email = f"Your offer was rejected by the buyer.\n\nMessage: {msg.body}"
-        send_email(subject, [seller.email], body_email)
+        queue_email(subject, [seller.email], body_email)
     except Exception:
-        current_app.logger.exception("Failed to send offer rejection email to seller")
+        current_app.logger.exception("Failed to queue offer rejection email to seller")
     return {"status": "rejected"}, 200
@@ -1,32 +1,102 @@
-import boto3
+import hashlib
+import mimetypes
 import os
+import shutil
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from io import BytesIO
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
 from werkzeug.utils import secure_filename
 from flask import current_app
-from botocore.exceptions import ClientError
+from revmark.storage import create_storage
+from revmark.utils.upload_stream import CountingReader
 import logging
 
 logger = logging.getLogger(__name__)
 
+class PresignedUrlCache:
+    """Bounded, thread-safe LRU of signed URLs with per-entry expiry"""
+    
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def lifetime(expiration):
+        """How long a URL signed for `expiration` seconds may be served from cache
+        
+        A cached URL handed out at the end of its lifetime must still be usable,
+        so entries are dropped while at least a quarter of the signature
+        (and never less than a minute) remains.
+        """
+        margin = max(expiration // 4, 60)
+        return max(expiration - margin, 0)
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+    
+    def set(self, key, url, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (url, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def discard(self, s3_key):
+        """Forget every cached URL for an object (e.g. after it is deleted)"""
+        with self._lock:
+            for key in [k for k in self._entries if k[1] == s3_key]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
 class S3Manager:
+    """Attachment storage: uploads, deduplication and cached signed URLs
+    
+    Storage operations go through a StorageBackend (see revmark.storage)
+    chosen by STORAGE_BACKEND: S3 in production, a local directory for
+    development, CI and benchmarks.
+    """
+    
     def __init__(self):
-        self.s3_client = None
+        self._backend = None
+        self._url_cache = None
     
-    def _get_client(self):
-        """Get S3 client, initializing if needed"""
-        if self.s3_client is None:
-            try:
-                self.s3_client = boto3.client(
-                    's3',
-                    aws_access_key_id=current_app.config['AWS_ACCESS_KEY_ID'],
-                    aws_secret_access_key=current_app.config['AWS_SECRET_ACCESS_KEY'],
-                    region_name=current_app.config['AWS_REGION']
-                )
-            except Exception as e:
-                logger.error(f"Failed to initialize S3 client: {str(e)}")
-                self.s3_client = None
-        return self.s3_client
+    def _get_url_cache(self):
+        """Get the presigned URL cache, sizing it from config on first use"""
+        if self._url_cache is None:
+            self._url_cache = PresignedUrlCache(
+                max_entries=current_app.config.get('PRESIGNED_URL_CACHE_SIZE', 2048)
+            )
+        return self._url_cache
+    
+    @property
+    def backend(self):
+        """Storage backend, built from config on first use"""
+        if self._backend is None:
+            self._backend = create_storage(current_app.config)
+        return self._backend
+    
+    def is_configured(self):
+        """Whether uploads can be stored (S3 needs credentials)"""
+        return self.backend.is_configured()
     
     def upload_file(self, file, folder="uploads"):
         """
@@ -37,17 +107,202 @@ class S3Manager:
             folder: S3 folder prefix
             
         Returns:
-            dict: Contains s3_key, original_filename, file_size, content_type
+            dict: Contains s3_key, original_filename, file_size, content_type,
+                  elapsed_ms and throughput_mbps
         """
-        client = self._get_client()
-        if not client:
-            raise Exception("S3 client not initialized")
-        
         if not file or not file.filename:
             raise ValueError("No file provided")
         
         # Secure the filename and generate unique S3 key
-        original_filename = secure_filename(file.filename)
+        s3_key, original_filename = self.new_object_key(file.filename, folder=folder)
+        
+        # Size is counted (and capped) while the backend reads the stream
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        reader = CountingReader(file.stream, max_size=max_size)
+        content_type = file.content_type or 'application/octet-stream'
+        
+        started = time.perf_counter()
+        self._put_object(reader, s3_key, content_type, {'original_filename': original_filename})
+        elapsed = time.perf_counter() - started
+        file_size = reader.bytes_read
+        throughput = file_size / elapsed / (1024 * 1024) if elapsed else 0.0
+        logger.info(f"⬆️ Uploaded {s3_key}: {file_size} bytes in {elapsed * 1000:.0f}ms ({throughput:.1f} MB/s)")
+        
+        return {
+            's3_key': s3_key,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'content_type': content_type,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'throughput_mbps': round(throughput, 2)
+        }
+    
+    def _put_object(self, stream, s3_key, content_type, metadata):
+        """Upload a stream (on S3, multipart and parallel above the threshold)"""
+        self.backend.put(stream, s3_key, content_type, dict(metadata, upload_timestamp=str(int(time.time()))))
+    
+    def upload_bytes(self, data, s3_key, content_type, metadata=None):
+        """
+        Upload in-memory content (e.g. a rendered image derivative) under a fixed key
+        
+        Returns:
+            str: The S3 key
+        """
+        self._put_object(BytesIO(data), s3_key, content_type, metadata or {})
+        return s3_key
+    
+    def read_file(self, s3_key, max_size=None):
+        """
+        Download an object into memory
+        
+        Args:
+            s3_key: S3 object key
+            max_size: Refuse objects larger than this many bytes (optional)
+            
+        Returns:
+            BytesIO: Object content, positioned at the start
+            
+        Raises:
+            FileNotFoundError: The object does not exist
+        """
+        return self.backend.open(s3_key, max_size=max_size)
+    
+    def upload_blob(self, file, folder="blobs"):
+        """
+        Store an upload content-addressed, skipping the upload if the content is already stored
+        
+        The request buffer is hashed (SHA-256) and sized in one pass. A known
+        hash only gains a reference on its AttachmentBlob; new content is
+        uploaded once under <folder>/<sha[:2]>/<sha>. Joins the caller's
+        transaction (the reference is committed with the attachment).
+        
+        Args:
+            file: FileStorage object from Flask request
+            folder: S3 folder prefix for blobs
+            
+        Returns:
+            dict: As upload_file, plus blob_id and deduplicated
+        """
+        from revmark.models import AttachmentBlob
+        
+        if not file or not file.filename:
+            raise ValueError("No file provided")
+        _, original_filename = self.new_object_key(file.filename, folder=folder)
+        content_type = file.content_type or 'application/octet-stream'
+        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        started = time.perf_counter()
+        
+        stream = file.stream
+        if not (hasattr(stream, 'seekable') and stream.seekable()):
+            # Hashing needs a second pass for the upload itself
+            spool = SpooledTemporaryFile(
+                max_size=current_app.config.get('UPLOAD_SPOOL_MAX_MEMORY', 16 * 1024 * 1024), mode='w+b'
+            )
+            shutil.copyfileobj(stream, spool)
+            stream = spool
+        stream.seek(0)
+        hasher = hashlib.sha256()
+        file_size = CountingReader(stream, max_size=max_size, hasher=hasher).drain()
+        sha256 = hasher.hexdigest()
+        
+        blob = AttachmentBlob.acquire(sha256)
+        deduplicated = blob is not None
+        if blob is None:
+            stream.seek(0)
+            s3_key = f"{folder}/{sha256[:2]}/{sha256}"
+            self._put_object(stream, s3_key, content_type, {'sha256': sha256})
+            blob = AttachmentBlob.create(sha256, s3_key, file_size, content_type)
+        
+        elapsed = time.perf_counter() - started
+        throughput = file_size / elapsed / (1024 * 1024) if elapsed else 0.0
+        if deduplicated:
+            logger.info(f"♻️ Reused {blob.s3_key} for {original_filename}: {file_size} bytes not uploaded ({elapsed * 1000:.0f}ms)")
+        else:
+            logger.info(f"⬆️ Uploaded {blob.s3_key}: {file_size} bytes in {elapsed * 1000:.0f}ms ({throughput:.1f} MB/s)")
+        
+        return {
+            's3_key': blob.s3_key,
+            'original_filename': original_filename,
+            'file_size': file_size,
+            'content_type': content_type,
+            'blob_id': blob.id,
+            'deduplicated': deduplicated,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'throughput_mbps': round(throughput, 2)
+        }
+    
+    def delete_orphaned_blobs(self, grace_seconds=None, limit=100):
+        """
+        Delete blobs nobody references any more
+        
+        A blob is only removed once its ref_count has been zero for
+        grace_seconds. The rows are deleted (conditionally on ref_count <= 0)
+        before the objects, in one transaction, so an upload re-acquiring the
+        same content either wins the row first or waits and re-uploads. Rows
+        whose object or derivatives could not be deleted are put back
+        unchanged, so the next sweep retries them.
+        
+        Returns:
+            int: Number of blobs deleted
+        """
+        from revmark.models import AttachmentBlob
+        from revmark.image_derivatives import derivative_keys
+        from revmark import db
+        
+        if grace_seconds is None:
+            grace_seconds = current_app.config.get('ATTACHMENT_BLOB_GRACE_SECONDS', 86400)
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        blobs = AttachmentBlob.__table__
+        candidates = db.session.execute(
+            blobs.select().where(
+                blobs.c.ref_count <= 0,
+                blobs.c.released_at <= cutoff
+            ).order_by(blobs.c.released_at).limit(limit)
+        ).all()
+        db.session.rollback()
+        
+        removed = {}
+        for row in candidates:
+            deleted_rows = db.session.execute(
+                blobs.delete().where(blobs.c.id == row.id, blobs.c.ref_count <= 0)
+            ).rowcount
+            if deleted_rows:
+                keys = [row.s3_key]
+                if row.content_type.startswith('image/'):
+                    # Derivatives are keyed by the blob's key, so they go with it
+                    keys.extend(derivative_keys(row.s3_key).values())
+                removed[row] = keys
+        if not removed:
+            db.session.rollback()
+            return 0
+        
+        # One batch delete while the row locks are held
+        failed = set(self.delete_files(key for keys in removed.values() for key in keys))
+        kept = [row for row, keys in removed.items() if failed.intersection(keys)]
+        if kept:
+            # An object left without its row would never be swept again
+            db.session.execute(blobs.insert(), [dict(row._mapping) for row in kept])
+            logger.warning(f"Could not delete {len(failed)} blob objects, kept {len(kept)} blobs for the next sweep: {', '.join(sorted(failed)[:10])}")
+        db.session.commit()
+        deleted = len(removed) - len(kept)
+        logger.info(f"🗑️ Deleted {deleted} unreferenced attachment blobs")
+        return deleted
+    
+    def new_object_key(self, filename, folder="uploads", owner_id=None):
+        """
+        Validate an upload's filename and pick a fresh, unguessable S3 key for it
+        
+        Args:
+            filename: Filename supplied by the client
+            folder: S3 folder prefix
+            owner_id: User ID to namespace the key under (optional)
+            
+        Returns:
+            tuple: (s3_key, secured original filename)
+        """
+        original_filename = secure_filename(filename or '')
+        if not original_filename:
+            raise ValueError("No file provided")
         file_extension = os.path.splitext(original_filename)[1].lower()
         
         # Validate file extension
@@ -55,51 +310,73 @@ class S3Manager:
         if file_extension not in allowed_extensions:
             raise ValueError(f"File type {file_extension} not allowed")
         
-        # Generate unique filename
-        unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-        s3_key = f"{folder}/{unique_filename}"
+        prefix = f"{folder}/{owner_id}" if owner_id is not None else folder
+        return f"{prefix}/{uuid.uuid4().hex}{file_extension}", original_filename
+    
+    def generate_presigned_post(self, s3_key, original_filename, content_type=None, max_size=None, expiration=600):
+        """
+        Sign a browser form POST that uploads straight to S3
         
-        # Get file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        The policy pins the key, ACL and Content-Type and caps the body with a
+        content-length-range, so the client cannot upload anything else under
+        this signature. The bucket needs a CORS rule allowing POST from the site.
+        The local backend signs a POST to the app itself instead.
         
-        # Validate file size
-        max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
-        if file_size > max_size:
-            raise ValueError(f"File size exceeds maximum allowed size of {max_size} bytes")
+        Args:
+            s3_key: Key the object must be stored under (see new_object_key)
+            original_filename: Stored as x-amz-meta-original_filename
+            content_type: Content-Type the upload must declare (guessed from the name if None)
+            max_size: Largest accepted body in bytes (default MAX_CONTENT_LENGTH)
+            expiration: Seconds the signature is valid
+            
+        Returns:
+            dict: {'url': ..., 'fields': {...}} to send as multipart form data,
+                  with the file as the last field
+        """
+        content_type = content_type or mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
+        max_size = max_size or current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        return self.backend.presigned_post(s3_key, original_filename, content_type, max_size, expiration)
+    
+    def verify_upload(self, s3_key, folder="uploads", owner_id=None, max_size=None):
+        """
+        Confirm a direct upload landed and describe it
         
-        try:
-            # Upload to S3
-            client.upload_fileobj(
-                file,
-                current_app.config['AWS_S3_BUCKET'],
-                s3_key,
-                ExtraArgs={
-                    'ACL': 'private',
-                    'ContentType': file.content_type or 'application/octet-stream',
-                    'Metadata': {
-                        'original_filename': original_filename,
-                        'upload_timestamp': str(int(time.time()))
-                    }
-                }
-            )
+        Args:
+            s3_key: Key handed out by new_object_key
+            folder: Folder the key must be under
+            owner_id: User the key must be namespaced to (optional)
+            max_size: Largest accepted size in bytes (default MAX_CONTENT_LENGTH)
             
-            return {
-                's3_key': s3_key,
-                'original_filename': original_filename,
-                'file_size': file_size,
-                'content_type': file.content_type or 'application/octet-stream'
-            }
+        Returns:
+            dict: Same shape as upload_file (s3_key, original_filename, file_size, content_type)
             
-        except ClientError as e:
-            logger.error(f"Failed to upload file to S3: {str(e)}")
-            raise Exception(f"Failed to upload file: {str(e)}")
+        Raises:
+            ValueError: The key is not the caller's, or the object is missing or too large
+        """
+        prefix = f"{folder}/{owner_id}/" if owner_id is not None else f"{folder}/"
+        if not s3_key or not s3_key.startswith(prefix) or '..' in s3_key:
+            raise ValueError("Invalid upload key")
+        info = self.get_file_info(s3_key)
+        if not info:
+            raise ValueError("Upload not found")
+        max_size = max_size or current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)
+        if info['size'] > max_size:
+            self.delete_file(s3_key)
+            raise ValueError(f"File size exceeds maximum allowed size of {max_size} bytes")
+        return {
+            's3_key': s3_key,
+            'original_filename': info['metadata'].get('original_filename') or s3_key.rsplit('/', 1)[-1],
+            'file_size': info['size'],
+            'content_type': info['content_type'] or 'application/octet-stream'
+        }
     
     def generate_presigned_url(self, s3_key, expiration=3600):
         """
         Generate a presigned URL for accessing a file
         
+        URLs are reused from an in-process cache keyed by
+        (bucket, s3_key, expiration) until shortly before they expire.
+        
         Args:
             s3_key: S3 object key
             expiration: URL expiration time in seconds (default 1 hour)
@@ -107,27 +384,41 @@ class S3Manager:
         Returns:
             str: Presigned URL
         """
-        client = self._get_client()
-        if not client:
-            raise Exception("S3 client not initialized")
-        
-        try:
-            url = client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': current_app.config['AWS_S3_BUCKET'],
-                    'Key': s3_key
-                },
-                ExpiresIn=expiration
-            )
+        url_cache = self._get_url_cache()
+        cache_key = (self.backend.location, s3_key, expiration)
+        url = url_cache.get(cache_key)
+        if url:
             return url
-        except ClientError as e:
-            logger.error(f"Failed to generate presigned URL: {str(e)}")
-            raise Exception(f"Failed to generate download URL: {str(e)}")
+        
+        url = self.backend.url(s3_key, expiration)
+        url_cache.set(cache_key, url, PresignedUrlCache.lifetime(expiration))
+        return url
+    
+    def generate_presigned_urls(self, s3_keys, expiration=3600):
+        """
+        Generate presigned URLs for many files at once
+        
+        Args:
+            s3_keys: Iterable of S3 object keys
+            expiration: URL expiration time in seconds (default 1 hour)
+            
+        Returns:
+            dict: Maps each key to its URL, or None if signing failed
+        """
+        urls = {}
+        for s3_key in s3_keys:
+            if s3_key in urls:
+                continue
+            try:
+                urls[s3_key] = self.generate_presigned_url(s3_key, expiration=expiration)
+            except Exception as e:
+                logger.warning(f"Could not sign URL for {s3_key}: {str(e)}")
+                urls[s3_key] = None
+        return urls
     
     def delete_file(self, s3_key):
         """
-        Delete a file from S3
+        Delete a file from storage
         
         Args:
             s3_key: S3 object key to delete
@@ -135,47 +426,37 @@ class S3Manager:
         Returns:
             bool: True if successful
         """
-        client = self._get_client()
-        if not client:
-            raise Exception("S3 client not initialized")
+        deleted = self.backend.delete(s3_key)
+        if deleted:
+            self._get_url_cache().discard(s3_key)
+        return deleted
+    
+    def delete_files(self, s3_keys):
+        """
+        Delete many files (S3 DeleteObjects, up to 1000 keys per request)
         
-        try:
-            client.delete_object(
-                Bucket=current_app.config['AWS_S3_BUCKET'],
-                Key=s3_key
-            )
-            return True
-        except ClientError as e:
-            logger.error(f"Failed to delete file from S3: {str(e)}")
-            return False
+        Returns:
+            list: Keys that could not be deleted
+        """
+        s3_keys = list(s3_keys)
+        failed = self.backend.delete_many(s3_keys)
+        url_cache = self._get_url_cache()
+        for s3_key in set(s3_keys) - set(failed):
+            url_cache.discard(s3_key)
+        return failed
     
     def get_file_info(self, s3_key):
         """
-        Get metadata about a file in S3
+        Get metadata about a file in storage
         
         Args:
             s3_key: S3 object key
             
         Returns:
-            dict: File metadata
+            dict: File metadata (size, last_modified, content_type, metadata),
+                  or None if it does not exist
         """
-        if not self.s3_client:
-            raise Exception("S3 client not initialized")
-        
-        try:
-            response = self._get_client().head_object(
-                Bucket=current_app.config['AWS_S3_BUCKET'],
-                Key=s3_key
-            )
-            return {
-                'size': response['ContentLength'],
-                'last_modified': response['LastModified'],
-                'content_type': response['ContentType'],
-                'metadata': response.get('Metadata', {})
-            }
-        except ClientError as e:
-            logger.error(f"Failed to get file info: {str(e)}")
-            return None
+        return self.backend.head(s3_key)
 
 # Initialize global S3 manager instance
 s3_manager = S3Manager()
\ No newline at end of file
@@ -0,0 +1,179 @@
+import re
+import secrets
+from flask.sessions import SessionInterface, SessionMixin
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Session ids are 32 random bytes, URL-safe base64 encoded
+SID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{43}$")
+
+
+class ServerSideSession(SessionMixin):
+    """
+    Session whose data lives in a server-side store, fetched on first access
+
+    The cookie only carries the session id. Requests that never read the
+    session (static files, health checks, anonymous API calls) never touch
+    the store.
+    """
+
+    def __init__(self, sid=None, load=None):
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._load = load
+        self._data = None if load else {}
+        self._stored_user_id = None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._load() or {}
+            self._load = None
+            self._stored_user_id = self._data.get('_user_id')
+        self.accessed = True
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def setdefault(self, key, default=None):
+        # The caller may mutate the returned value in place
+        self.modified = True
+        return self.data.setdefault(key, default)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface backed by a cachelib cache (Redis or filesystem)
+
+    Session data is stored with the cache's pickle serializer (binary and
+    compact, and it round-trips the tuples Flask keeps flashed messages in)
+    under the random session id. The store is written only when the session
+    changed, or to extend the expiry of a permanent session when
+    SESSION_REFRESH_EACH_REQUEST is on.
+
+    Args:
+        store: cachelib cache holding the session data
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def _fetch(self, sid):
+        try:
+            return self.store.get(sid)
+        except Exception as e:
+            # Treat an unreachable store as an empty session rather than a 500
+            logger.warning(f"Session store unavailable: {str(e)}")
+            return None
+
+    def _delete(self, sid):
+        try:
+            self.store.delete(sid)
+        except Exception as e:
+            logger.warning(f"Could not delete session: {str(e)}")
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SID_PATTERN.match(sid):
+            return ServerSideSession()
+        return ServerSideSession(sid, load=lambda: self._fetch(sid))
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path,
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    httponly=self.get_cookie_httponly(app)
+                )
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        if session.sid is not None and session.get('_user_id') != session._stored_user_id:
+            # New id on login/logout so an id planted before login is worthless
+            self._delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        timeout = int(app.permanent_session_lifetime.total_seconds())
+        try:
+            self.store.set(session.sid, dict(session.data), timeout=timeout)
+        except Exception as e:
+            logger.error(f"Failed to save session: {str(e)}")
+            return
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def create_session_interface(config):
+    """
+    Build the session interface selected by SESSION_TYPE
+
+    'redis' shares sessions across nodes through SESSION_REDIS, 'filesystem'
+    keeps them under SESSION_FILE_DIR for single-node and local runs. Any
+    other value keeps Flask's signed-cookie sessions.
+
+    Args:
+        config: Flask app config
+
+    Returns:
+        ServerSideSessionInterface or None
+    """
+    session_type = config.get('SESSION_TYPE')
+    prefix = config.get('SESSION_KEY_PREFIX', 'session:')
+    if session_type == 'redis':
+        import redis
+        from cachelib import RedisCache
+        client = redis.Redis.from_url(config['SESSION_REDIS'])
+        return ServerSideSessionInterface(RedisCache(host=client, key_prefix=prefix))
+    if session_type == 'filesystem':
+        from cachelib import FileSystemCache
+        return ServerSideSessionInterface(FileSystemCache(
+            config['SESSION_FILE_DIR'],
+            threshold=config.get('SESSION_FILE_THRESHOLD', 10000),
+            mode=0o600
+        ))
+    return None
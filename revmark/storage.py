@@ -0,0 +1,388 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from flask import url_for, send_file
+from itsdangerous import URLSafeSerializer, BadSignature
+from werkzeug.security import safe_join
+from revmark.utils.upload_stream import CountingReader
+import logging
+
+logger = logging.getLogger(__name__)
+
+# S3 DeleteObjects accepts at most this many keys per request
+S3_DELETE_BATCH = 1000
+
+
+def _client_error():
+    """botocore's ClientError (boto3 is only imported once S3 is actually used)"""
+    from botocore.exceptions import ClientError
+    return ClientError
+
+
+class StorageBackend:
+    """
+    Object storage used for attachments, blobs and image derivatives
+
+    Keys are '/'-separated paths (e.g. blobs/ab/abcd...). S3Manager holds the
+    upload, deduplication and URL-caching logic and calls a backend only for
+    the storage operations below.
+    """
+
+    # Identifies the store in cache keys (bucket URL or directory)
+    location = None
+
+    def is_configured(self):
+        return True
+
+    def put(self, stream, key, content_type, metadata):
+        """Store a readable stream under key"""
+        raise NotImplementedError
+
+    def open(self, key, max_size=None):
+        """
+        Read an object into memory
+
+        Raises:
+            FileNotFoundError: No object under key
+            UploadTooLarge: The object is larger than max_size
+        """
+        raise NotImplementedError
+
+    def url(self, key, expiration):
+        """Signed URL that serves the object for expiration seconds"""
+        raise NotImplementedError
+
+    def presigned_post(self, key, original_filename, content_type, max_size, expiration):
+        """Signed form POST ({'url': ..., 'fields': {...}}) that uploads key from a browser"""
+        raise NotImplementedError("Direct uploads are not supported by this storage backend")
+
+    def head(self, key):
+        """
+        Describe an object
+
+        Returns:
+            dict: size, last_modified, content_type, metadata (None if missing)
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """Delete an object (deleting a missing object succeeds); returns bool"""
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """
+        Delete several objects
+
+        Returns:
+            list: Keys that could not be deleted
+        """
+        return [key for key in keys if not self.delete(key)]
+
+
+class S3Storage(StorageBackend):
+    """Private S3 bucket; large uploads go multipart and in parallel"""
+
+    def __init__(self, config):
+        self.config = config
+        self.bucket = config['AWS_S3_BUCKET']
+        self.location = f"s3://{self.bucket}"
+        self.s3_client = None
+        self._transfer_config = None
+
+    def is_configured(self):
+        return bool(self.config.get('AWS_ACCESS_KEY_ID'))
+
+    def _get_client(self):
+        """Get S3 client, initializing if needed"""
+        if self.s3_client is None:
+            try:
+                import boto3
+                from botocore.config import Config as BotoConfig
+                # Enough pooled connections for every part of a parallel upload
+                self.s3_client = boto3.client(
+                    's3',
+                    aws_access_key_id=self.config['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=self.config['AWS_SECRET_ACCESS_KEY'],
+                    region_name=self.config['AWS_REGION'],
+                    config=BotoConfig(
+                        max_pool_connections=max(10, self.config.get('S3_MAX_CONCURRENCY', 8))
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Failed to initialize S3 client: {str(e)}")
+                self.s3_client = None
+        if self.s3_client is None:
+            raise Exception("S3 client not initialized")
+        return self.s3_client
+
+    def _get_transfer_config(self):
+        """Multipart settings for upload_fileobj, read from config on first use"""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(
+                multipart_threshold=self.config.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024),
+                multipart_chunksize=self.config.get('S3_MULTIPART_CHUNKSIZE', 5 * 1024 * 1024),
+                max_concurrency=self.config.get('S3_MAX_CONCURRENCY', 8),
+                use_threads=True
+            )
+        return self._transfer_config
+
+    def put(self, stream, key, content_type, metadata):
+        try:
+            self._get_client().upload_fileobj(
+                stream,
+                self.bucket,
+                key,
+                ExtraArgs={
+                    'ACL': 'private',
+                    'ContentType': content_type,
+                    'Metadata': metadata
+                },
+                Config=self._get_transfer_config()
+            )
+        except _client_error() as e:
+            logger.error(f"Failed to upload file to S3: {str(e)}")
+            raise Exception(f"Failed to upload file: {str(e)}")
+
+    def open(self, key, max_size=None):
+        buffer = BytesIO()
+        try:
+            response = self._get_client().get_object(Bucket=self.bucket, Key=key)
+            reader = CountingReader(response['Body'], max_size=max_size)
+            shutil.copyfileobj(reader, buffer, 1024 * 1024)
+        except _client_error() as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                raise FileNotFoundError(f"No such object: {key}")
+            logger.error(f"Failed to download file from S3: {str(e)}")
+            raise Exception(f"Failed to download file: {str(e)}")
+        buffer.seek(0)
+        return buffer
+
+    def url(self, key, expiration):
+        try:
+            return self._get_client().generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': self.bucket,
+                    'Key': key
+                },
+                ExpiresIn=expiration
+            )
+        except _client_error() as e:
+            logger.error(f"Failed to generate presigned URL: {str(e)}")
+            raise Exception(f"Failed to generate download URL: {str(e)}")
+
+    def presigned_post(self, key, original_filename, content_type, max_size, expiration):
+        # The policy pins the key, ACL and Content-Type and caps the body, so
+        # the client cannot upload anything else under this signature
+        fields = {
+            'acl': 'private',
+            'Content-Type': content_type,
+            'x-amz-meta-original_filename': original_filename,
+        }
+        conditions = [
+            {'acl': 'private'},
+            {'Content-Type': content_type},
+            {'x-amz-meta-original_filename': original_filename},
+            ['content-length-range', 1, max_size],
+        ]
+        try:
+            return self._get_client().generate_presigned_post(
+                self.bucket,
+                key,
+                Fields=fields,
+                Conditions=conditions,
+                ExpiresIn=expiration
+            )
+        except _client_error() as e:
+            logger.error(f"Failed to generate presigned POST: {str(e)}")
+            raise Exception(f"Failed to prepare upload: {str(e)}")
+
+    def head(self, key):
+        try:
+            response = self._get_client().head_object(Bucket=self.bucket, Key=key)
+            return {
+                'size': response['ContentLength'],
+                'last_modified': response['LastModified'],
+                'content_type': response['ContentType'],
+                'metadata': response.get('Metadata', {})
+            }
+        except _client_error() as e:
+            logger.error(f"Failed to get file info: {str(e)}")
+            return None
+
+    def delete(self, key):
+        try:
+            self._get_client().delete_object(Bucket=self.bucket, Key=key)
+            return True
+        except _client_error() as e:
+            logger.error(f"Failed to delete file from S3: {str(e)}")
+            return False
+
+    def delete_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        failed = []
+        client = self._get_client()
+        for start in range(0, len(keys), S3_DELETE_BATCH):
+            batch = keys[start:start + S3_DELETE_BATCH]
+            try:
+                response = client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+                failed.extend(error['Key'] for error in response.get('Errors', []))
+            except _client_error() as e:
+                logger.error(f"Failed to delete files from S3: {str(e)}")
+                failed.extend(batch)
+        return failed
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files in a local directory, for development, CI and benchmarks
+
+    Objects live at <root>/<key>, with content type and metadata in
+    <root>/.meta/<key>.json. URLs point at the app itself: a token signed with
+    SECRET_KEY names the key and its expiry, and the file is streamed with
+    send_file (sendfile under gunicorn, or X-Sendfile with USE_X_SENDFILE).
+    Direct uploads POST to a signed URL in the same way.
+    """
+
+    def __init__(self, root, secret_key):
+        self.root = os.path.abspath(root)
+        self.location = f"file://{self.root}"
+        self._serializer = URLSafeSerializer(secret_key, salt='revmark-local-storage')
+
+    def _path(self, key, base=None):
+        path = safe_join(base or self.root, key)
+        if path is None or key.startswith('.meta/'):
+            raise ValueError("Invalid storage key")
+        return path
+
+    def _meta_path(self, key):
+        return self._path(key, os.path.join(self.root, '.meta')) + '.json'
+
+    def _write(self, path, write):
+        """Write through a temporary file so readers never see a partial object"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def put(self, stream, key, content_type, metadata):
+        meta = json.dumps({'content_type': content_type, 'metadata': metadata}).encode()
+        self._write(self._path(key), lambda f: shutil.copyfileobj(stream, f, 1024 * 1024))
+        self._write(self._meta_path(key), lambda f: f.write(meta))
+
+    def open(self, key, max_size=None):
+        buffer = BytesIO()
+        with open(self._path(key), 'rb') as f:
+            shutil.copyfileobj(CountingReader(f, max_size=max_size), buffer, 1024 * 1024)
+        buffer.seek(0)
+        return buffer
+
+    def _sign(self, **claims):
+        return self._serializer.dumps(claims)
+
+    def _verify(self, token):
+        """Claims of an unexpired token; ValueError otherwise"""
+        try:
+            claims = self._serializer.loads(token)
+        except BadSignature:
+            raise ValueError("Invalid link")
+        if claims.get('e', 0) < time.time():
+            raise ValueError("Link expired")
+        return claims
+
+    def url(self, key, expiration):
+        return url_for('main.local_file', token=self._sign(k=key, e=int(time.time()) + expiration))
+
+    def presigned_post(self, key, original_filename, content_type, max_size, expiration):
+        token = self._sign(k=key, e=int(time.time()) + expiration, ct=content_type,
+                           fn=original_filename, max=max_size)
+        return {'url': url_for('main.local_upload', token=token), 'fields': {}}
+
+    def send(self, token):
+        """
+        Response for a signed URL (see url)
+
+        Raises:
+            ValueError: Bad or expired token
+            FileNotFoundError: The object is gone
+        """
+        claims = self._verify(token)
+        info = self.head(claims['k'])
+        if info is None:
+            raise FileNotFoundError(claims['k'])
+        response = send_file(
+            self._path(claims['k']),
+            mimetype=info['content_type'],
+            conditional=True,
+            max_age=max(int(claims['e'] - time.time()), 0)
+        )
+        # Attachments are private: browsers may cache them, shared caches may not
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+    def receive(self, token, file):
+        """
+        Store a browser upload sent to a signed POST URL (see presigned_post)
+
+        Raises:
+            ValueError: Bad or expired token, no file, or the file is too large
+        """
+        claims = self._verify(token)
+        if not file:
+            raise ValueError("No file provided")
+        self.put(CountingReader(file.stream, max_size=claims['max']), claims['k'],
+                 claims['ct'], {'original_filename': claims['fn']})
+
+    def head(self, key):
+        try:
+            stat = os.stat(self._path(key))
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return {
+            'size': stat.st_size,
+            'last_modified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            'content_type': meta['content_type'],
+            'metadata': meta['metadata']
+        }
+
+    def delete(self, key):
+        for path in (self._path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to delete {path}: {str(e)}")
+                return False
+        return True
+
+
+def create_storage(config):
+    """
+    Build the backend selected by STORAGE_BACKEND ('s3' or 'local')
+
+    Args:
+        config: Flask app config
+    """
+    backend = config.get('STORAGE_BACKEND', 's3')
+    if backend == 's3':
+        return S3Storage(config)
+    if backend == 'local':
+        return LocalStorage(config['LOCAL_STORAGE_ROOT'], config['SECRET_KEY'])
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,179 @@
+import json
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from revmark import db
+from revmark.models import User, Request, EscrowPayment, StripeEvent
+from revmark.listings import invalidate_request_listings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def record_event(event):
+    """
+    Store a verified webhook event for asynchronous processing
+    
+    Args:
+        event: Verified Stripe event (stripe.Event or dict)
+        
+    Returns:
+        bool: True if the event is new, False if it was already recorded
+    """
+    data_object = event["data"]["object"]
+    db.session.add(StripeEvent(
+        id=event["id"],
+        type=event["type"],
+        object_id=data_object.get("id"),
+        created=event.get("created") or 0,
+        payload=json.dumps(event.to_dict_recursive() if hasattr(event, "to_dict_recursive") else event)
+    ))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Stripe retry or redelivery of an event we already have
+        db.session.rollback()
+        return False
+
+
+# ---------- EVENT HANDLERS ----------
+# A handler gets the event's data object and creation time (Unix seconds).
+# It may return a callable to run once its changes are committed, such as
+# dropping the cached listings of the request it changed.
+
+def _drop_listings(request_id):
+    return lambda: invalidate_request_listings(request_id)
+
+
+def _payment_intent_succeeded(payment_intent, created):
+    logger.info(f"💰 Payment successful for {payment_intent['id']}")
+    
+    # Update request and escrow payment status
+    request_id = payment_intent.get('metadata', {}).get('request_id')
+    if request_id:
+        request_obj = Request.query.get(request_id)
+        if request_obj:
+            request_obj.status = 'funded'
+            
+        escrow_payment = EscrowPayment.query.filter_by(
+            stripe_payment_intent_id=payment_intent['id']
+        ).first()
+        if escrow_payment:
+            escrow_payment.status = 'paid'
+        return _drop_listings(request_obj.id) if request_obj else None
+
+
+def _transfer_paid(transfer, created):
+    logger.info(f"✅ Transfer completed for {transfer['id']}")
+    
+    # Find and update related request status
+    request_id = transfer.get('metadata', {}).get('request_id')
+    if request_id:
+        request_obj = Request.query.get(request_id)
+        if request_obj:
+            request_obj.status = 'completed'
+            return _drop_listings(request_obj.id)
+
+
+def _account_updated(account, created):
+    logger.info(f"👤 Account updated: {account['id']}")
+    
+    # Update user's onboarding status
+    user = User.query.filter_by(stripe_account_id=account['id']).first()
+    if user and account.get('details_submitted') and account.get('charges_enabled'):
+        user.stripe_onboarding_complete = True
+    
+    def refresh_snapshot():
+        # Refresh the cached account snapshot so dashboards skip the API call.
+        # Stamped with the event's time: a queued or retried event is as old
+        # as its payload, and must not replace a newer snapshot.
+        from revmark.stripe_utils import stripe_manager
+        stripe_manager.store_account_snapshot(account, fetched_at=created or None)
+    return refresh_snapshot
+
+
+def _payment_intent_failed(payment_intent, created):
+    logger.warning(f"❌ Payment failed for {payment_intent['id']}")
+
+
+EVENT_HANDLERS = {
+    'payment_intent.succeeded': _payment_intent_succeeded,
+    'transfer.paid': _transfer_paid,
+    'account.updated': _account_updated,
+    'payment_intent.payment_failed': _payment_intent_failed,
+}
+
+
+# ---------- PROCESSOR ----------
+
+def _claim_next_event(now):
+    """
+    Lock the oldest due event that heads its object's queue
+    
+    An event is only eligible when no earlier event for the same object is
+    still pending, so events for one object apply strictly in order even
+    with several workers (each skips rows another worker has locked).
+    """
+    earlier = aliased(StripeEvent)
+    blocked = db.session.query(earlier.id).filter(
+        earlier.object_id == StripeEvent.object_id,
+        earlier.status == 'pending',
+        db.or_(
+            earlier.created < StripeEvent.created,
+            db.and_(earlier.created == StripeEvent.created, earlier.received_at < StripeEvent.received_at)
+        )
+    ).exists()
+    return StripeEvent.query.filter(
+        StripeEvent.status == 'pending',
+        StripeEvent.next_attempt_at <= now,
+        ~blocked
+    ).order_by(StripeEvent.created, StripeEvent.received_at) \
+        .with_for_update(skip_locked=True).first()
+
+
+def process_pending_events(limit=100, max_attempts=None):
+    """
+    Apply queued webhook events, one transaction per event
+    
+    Returns:
+        int: Number of events handled (processed or failed)
+    """
+    max_attempts = max_attempts or current_app.config.get('STRIPE_EVENT_MAX_ATTEMPTS', 8)
+    handled = 0
+    
+    for _ in range(limit):
+        event = _claim_next_event(datetime.utcnow())
+        if event is None:
+            db.session.rollback()
+            break
+        event_id = event.id
+        
+        try:
+            handler = EVENT_HANDLERS.get(event.type)
+            after_commit = None
+            if handler:
+                after_commit = handler(json.loads(event.payload)["data"]["object"], event.created)
+            event.status = 'processed'
+            event.processed_at = datetime.utcnow()
+            event.attempts += 1
+            db.session.commit()
+            if after_commit is not None:
+                after_commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to process Stripe event {event_id}: {str(e)}")
+            event = StripeEvent.query.get(event_id)
+            event.attempts += 1
+            event.last_error = str(e)[:1000]
+            if event.attempts >= max_attempts:
+                event.status = 'failed'
+            else:
+                delay = min(30 * (2 ** (event.attempts - 1)), 3600)
+                event.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay + random.uniform(0, delay / 4))
+            db.session.commit()
+        handled += 1
+    
+    return handled
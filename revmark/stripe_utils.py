@@ -1,13 +1,158 @@
 import stripe
+import hashlib
+import json
 import os
+import threading
+import time
 from flask import current_app
 from revmark.models import User, EscrowPayment, Request
-from revmark import db
+from revmark import db, cache
+from revmark.listings import invalidate_request_listings
+from revmark.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Timeout class used for each kind of Stripe call (see STRIPE_*_TIMEOUT)
+OPERATION_TIMEOUTS = {
+    'read': 'STRIPE_READ_TIMEOUT',
+    'write': 'STRIPE_WRITE_TIMEOUT',
+    'list': 'STRIPE_LIST_TIMEOUT',
+}
+
+# Errors that mean Stripe (or the network path to it) is struggling, as opposed
+# to a request Stripe understood and rejected; only these trip the breaker
+UPSTREAM_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.APIError,
+    stripe.error.RateLimitError,
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+_breaker = None
+
+
+class StripeUnavailableError(stripe.error.APIConnectionError):
+    """Stripe calls are being refused locally because the circuit breaker is open"""
+
+
+def _stripe_breaker():
+    """Process-wide breaker shared by every StripeManager in this worker"""
+    global _breaker
+    if _breaker is None:
+        with _clients_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker(
+                    'Stripe',
+                    failure_threshold=current_app.config.get('STRIPE_BREAKER_THRESHOLD', 5),
+                    reset_timeout=current_app.config.get('STRIPE_BREAKER_RESET_SECONDS', 30)
+                )
+    return _breaker
+
+
+def get_stripe_client(operation='write'):
+    """
+    Get the pooled StripeClient for an operation's timeout class
+    
+    Clients are built once per worker process and reused, so each thread
+    keeps a keep-alive connection pool to Stripe instead of reconnecting on
+    every call. Network errors, 409s, 429s and retryable 5xx responses are
+    retried up to STRIPE_MAX_NETWORK_RETRIES times with jittered backoff.
+    
+    Args:
+        operation: 'read', 'write' or 'list'
+        
+    Returns:
+        stripe.StripeClient
+    """
+    config = current_app.config
+    api_key = config.get('STRIPE_SECRET_KEY')
+    if not api_key:
+        raise Exception("Stripe not initialized")
+    
+    read_timeout = config.get(OPERATION_TIMEOUTS.get(operation, 'STRIPE_WRITE_TIMEOUT'), 30)
+    api_base = config.get('STRIPE_API_BASE')
+    key = (api_key, api_base, read_timeout)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                base_addresses = {}
+                if api_base:
+                    base_addresses = {'api': api_base, 'connect': api_base}
+                client = stripe.StripeClient(
+                    api_key,
+                    base_addresses=base_addresses,
+                    max_network_retries=config.get('STRIPE_MAX_NETWORK_RETRIES', 2),
+                    http_client=stripe.RequestsClient(
+                        timeout=(config.get('STRIPE_CONNECT_TIMEOUT', 3), read_timeout)
+                    )
+                )
+                _clients[key] = client
+    return client
+
+
+def stripe_call(operation, func):
+    """
+    Run a Stripe API call on the pooled client, guarded by the circuit breaker
+    
+    Args:
+        operation: Timeout class ('read', 'write' or 'list')
+        func: Callable taking a StripeClient, e.g. lambda c: c.accounts.retrieve(id)
+        
+    Returns:
+        Whatever func returns
+        
+    Raises:
+        StripeUnavailableError: The breaker is open; Stripe was not called
+    """
+    client = get_stripe_client(operation)
+    try:
+        return _stripe_breaker().call(
+            func, client,
+            should_trip=lambda e: isinstance(e, UPSTREAM_ERRORS)
+        )
+    except CircuitOpenError as e:
+        logger.warning(f"⚡ Skipping Stripe call: {str(e)}")
+        raise StripeUnavailableError(str(e))
+
+def _to_plain(value):
+    """Convert StripeObjects (or plain webhook dicts) to JSON-friendly dicts"""
+    if hasattr(value, 'to_dict_recursive'):
+        return value.to_dict_recursive()
+    return value
+
+def account_snapshot(account):
+    """Compact, cacheable view of a Stripe Connect account"""
+    return {
+        'id': account.get('id'),
+        'email': account.get('email'),
+        'details_submitted': bool(account.get('details_submitted')),
+        'charges_enabled': bool(account.get('charges_enabled')),
+        'payouts_enabled': bool(account.get('payouts_enabled')),
+        'requirements': _to_plain(account.get('requirements')),
+        'capabilities': _to_plain(account.get('capabilities'))
+    }
+
+def to_cents(amount):
+    """
+    Dollar amount as integer cents, rounded half up
+    
+    Every path that sends the same money to Stripe must agree to the cent:
+    a retried request with a different amount is rejected as an idempotency
+    mismatch. The float is rounded through its shortest repr, so 19.99
+    becomes 1999 (int(19.99 * 100) would give 1998).
+    """
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), ROUND_HALF_UP))
+
+def transfer_idempotency_key(payment_intent_id):
+    """One transfer per escrow payment, whether released by the buyer or a batch run"""
+    return f"revmark-transfer-{payment_intent_id}"
+
 class StripeManager:
     def __init__(self):
         self.api_key = None
@@ -39,29 +184,29 @@ class StripeManager:
             
         try:
             # Create Express account
-            account = stripe.Account.create(
-                type='express',
-                country=country,
-                email=email,
-                capabilities={
+            account = stripe_call('write', lambda client: client.accounts.create(params={
+                'type': 'express',
+                'country': country,
+                'email': email,
+                'capabilities': {
                     'transfers': {'requested': True},
                 },
-                settings={
+                'settings': {
                     'payouts': {
                         'schedule': {
                             'interval': 'daily'
                         }
                     }
                 }
-            )
+            }, options={'idempotency_key': f"revmark-account-{user_id}"}))
             
             # Create account link for onboarding
-            account_link = stripe.AccountLink.create(
-                account=account.id,
-                refresh_url=f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/seller/onboarding/refresh",
-                return_url=f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/seller/onboarding/complete",
-                type='account_onboarding',
-            )
+            account_link = stripe_call('write', lambda client: client.account_links.create(params={
+                'account': account.id,
+                'refresh_url': f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/seller/onboarding/refresh",
+                'return_url': f"{current_app.config.get('BASE_URL', 'http://localhost:5000')}/seller/onboarding/complete",
+                'type': 'account_onboarding',
+            }))
             
             # Update user with Stripe account ID
             user = User.query.get(user_id)
@@ -95,7 +240,7 @@ class StripeManager:
             raise Exception("Stripe not initialized")
             
         try:
-            amount_cents = int(amount * 100)  # Convert to cents
+            amount_cents = to_cents(amount)
             platform_fee_cents = int(amount_cents * (current_app.config['PLATFORM_FEE_PERCENTAGE'] / 100))
             
             # Build PaymentIntent parameters
@@ -124,21 +269,33 @@ class StripeManager:
                         'destination': seller.stripe_account_id,
                     }
             
+            # Same parameters -> same key, so a retried or double-submitted checkout
+            # gets the original PaymentIntent back; any change (another seller,
+            # amount or destination) is a new PaymentIntent
+            params_digest = hashlib.sha256(json.dumps(intent_params, sort_keys=True).encode()).hexdigest()[:16]
+            idempotency_key = f"revmark-pi-{request_id}-{params_digest}"
+            
             # Create PaymentIntent
-            intent = stripe.PaymentIntent.create(**intent_params)
-            
-            # Create escrow payment record
-            escrow_payment = EscrowPayment(
-                request_id=request_id,
-                buyer_id=buyer_id,
-                seller_id=seller_id,
-                amount=amount,
-                platform_fee=platform_fee_cents / 100,  # Convert back to dollars
-                seller_amount=amount - (platform_fee_cents / 100),
-                stripe_payment_intent_id=intent.id,
-                status='pending'
-            )
-            db.session.add(escrow_payment)
+            intent = stripe_call('write', lambda client: client.payment_intents.create(
+                params=intent_params,
+                options={'idempotency_key': idempotency_key}
+            ))
+            
+            # Create escrow payment record (a replayed intent already has one)
+            escrow_payment = EscrowPayment.query.filter_by(stripe_payment_intent_id=intent.id).first()
+            if escrow_payment is None:
+                escrow_payment = EscrowPayment(
+                    request_id=request_id,
+                    buyer_id=buyer_id,
+                    seller_id=seller_id,
+                    amount=amount,
+                    platform_fee=platform_fee_cents / 100,  # Convert back to dollars
+                    seller_amount=amount - (platform_fee_cents / 100),
+                    stripe_payment_intent_id=intent.id,
+                    stripe_destination_account_id=intent_params.get('transfer_data', {}).get('destination'),
+                    status='pending'
+                )
+                db.session.add(escrow_payment)
             
             # Update request with payment info
             request_obj = Request.query.get(request_id)
@@ -151,6 +308,8 @@ class StripeManager:
                     request_obj.seller_id = seller_id
             
             db.session.commit()
+            # The request's seller is part of its cached listing
+            invalidate_request_listings(request_id)
             
             return {
                 'client_secret': intent.client_secret,
@@ -191,18 +350,21 @@ class StripeManager:
             if escrow_payment.status != 'pending':
                 raise Exception(f"Payment already {escrow_payment.status}")
             
+            if escrow_payment.stripe_destination_account_id:
+                raise Exception("Payment is a destination charge, Stripe pays the seller directly")
+            
             # Create transfer to seller
-            transfer = stripe.Transfer.create(
-                amount=int(escrow_payment.seller_amount * 100),  # Convert to cents
-                currency='usd',
-                destination=seller_account_id,
-                transfer_group=payment_intent_id,
-                metadata={
+            transfer = stripe_call('write', lambda client: client.transfers.create(params={
+                'amount': to_cents(escrow_payment.seller_amount),
+                'currency': 'usd',
+                'destination': seller_account_id,
+                'transfer_group': payment_intent_id,
+                'metadata': {
                     'request_id': str(escrow_payment.request_id),
                     'buyer_id': str(escrow_payment.buyer_id),
                     'seller_id': str(escrow_payment.seller_id)
                 }
-            )
+            }, options={'idempotency_key': transfer_idempotency_key(payment_intent_id)}))
             
             # Update escrow payment record
             escrow_payment.stripe_transfer_id = transfer.id
@@ -216,6 +378,7 @@ class StripeManager:
                 request_obj.status = 'completed'
             
             db.session.commit()
+            invalidate_request_listings(escrow_payment.request_id)
             
             return {
                 'transfer_id': transfer.id,
@@ -244,10 +407,10 @@ class StripeManager:
             
         try:
             # Create refund
-            refund = stripe.Refund.create(
-                payment_intent=payment_intent_id,
-                reason=reason
-            )
+            refund = stripe_call('write', lambda client: client.refunds.create(params={
+                'payment_intent': payment_intent_id,
+                'reason': reason
+            }, options={'idempotency_key': f"revmark-refund-{payment_intent_id}"}))
             
             # Update escrow payment record
             escrow_payment = EscrowPayment.query.filter_by(
@@ -264,6 +427,7 @@ class StripeManager:
                     request_obj.status = 'cancelled'
                 
                 db.session.commit()
+                invalidate_request_listings(escrow_payment.request_id)
             
             return {
                 'refund_id': refund.id,
@@ -276,28 +440,121 @@ class StripeManager:
             db.session.rollback()
             raise Exception(f"Failed to process refund: {str(e)}")
     
-    def get_account_status(self, account_id):
+    # ---------- CACHED ACCOUNT STATUS ----------
+    
+    @staticmethod
+    def _account_cache_key(account_id):
+        return f"stripe:account:{account_id}"
+    
+    def store_account_snapshot(self, account, fetched_at=None):
         """
-        Get the status of a Stripe Connect account
+        Cache a snapshot of an account (from the API or an account.updated webhook)
+        
+        A snapshot older than the one already cached is not stored, so an
+        event applied late cannot roll the cached account back.
         
         Args:
-            account_id: Stripe Connect account ID
+            account: Stripe Account object or webhook payload dict
+            fetched_at: Unix time the account data is from (default now)
             
         Returns:
-            dict: Account status and capabilities
+            dict: The cached snapshot (the newer one if the cache had it)
         """
+        snapshot = account_snapshot(account)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        key = self._account_cache_key(snapshot['id'])
+        try:
+            cached = cache.get(key)
+            if cached and cached['fetched_at'] > fetched_at:
+                return cached['account']
+            cache.set(
+                key,
+                {'account': snapshot, 'fetched_at': fetched_at},
+                timeout=current_app.config.get('STRIPE_ACCOUNT_CACHE_MAX_AGE', 86400)
+            )
+        except Exception as e:
+            logger.warning(f"Could not cache Stripe account {snapshot['id']}: {str(e)}")
+        return snapshot
+    
+    def _fetch_account(self, account_id):
+        """Retrieve an account from Stripe and refresh the cache"""
         if not self._initialize_stripe():
             raise Exception("Stripe not initialized")
+        account = stripe_call('read', lambda client: client.accounts.retrieve(account_id))
+        return self.store_account_snapshot(account)
+    
+    def _refresh_in_background(self, account_id):
+        """Revalidate a stale snapshot off the request thread (one refresh per account at a time)"""
+        lock_key = f"{self._account_cache_key(account_id)}:refreshing"
+        try:
+            if not cache.add(lock_key, 1, timeout=30):
+                return
+        except Exception:
+            return
+        app = current_app._get_current_object()
+        
+        def refresh():
+            with app.app_context():
+                try:
+                    self._fetch_account(account_id)
+                except Exception as e:
+                    logger.warning(f"Background refresh of Stripe account {account_id} failed: {str(e)}")
+                finally:
+                    try:
+                        cache.delete(lock_key)
+                    except Exception:
+                        pass
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def get_account_snapshot(self, account_id, max_age=None):
+        """
+        Get an account snapshot, preferring the cache
+        
+        Fresh entries (younger than STRIPE_ACCOUNT_CACHE_TTL) are returned
+        directly. Stale entries are returned immediately while a background
+        refresh runs; only a cache miss calls Stripe synchronously.
+        
+        Args:
+            account_id: Stripe Connect account ID
+            max_age: Override the freshness window in seconds (0 forces a fetch)
             
+        Returns:
+            dict: Account snapshot (see account_snapshot)
+        """
+        ttl = current_app.config.get('STRIPE_ACCOUNT_CACHE_TTL', 300) if max_age is None else max_age
         try:
-            account = stripe.Account.retrieve(account_id)
+            entry = cache.get(self._account_cache_key(account_id))
+        except Exception:
+            entry = None
+        
+        if entry and ttl > 0:
+            if time.time() - entry['fetched_at'] < ttl:
+                return entry['account']
+            self._refresh_in_background(account_id)
+            return entry['account']
+        
+        return self._fetch_account(account_id)
+    
+    def get_account_status(self, account_id, max_age=None):
+        """
+        Get the status of a Stripe Connect account
+        
+        Args:
+            account_id: Stripe Connect account ID
+            max_age: Cache freshness override in seconds (see get_account_snapshot)
             
+        Returns:
+            dict: Account status and capabilities
+        """
+        try:
+            snapshot = self.get_account_snapshot(account_id, max_age=max_age)
             return {
-                'charges_enabled': account.charges_enabled,
-                'payouts_enabled': account.payouts_enabled,
-                'details_submitted': account.details_submitted,
-                'requirements': account.requirements,
-                'capabilities': account.capabilities
+                'charges_enabled': snapshot['charges_enabled'],
+                'payouts_enabled': snapshot['payouts_enabled'],
+                'details_submitted': snapshot['details_submitted'],
+                'requirements': snapshot['requirements'],
+                'capabilities': snapshot['capabilities']
             }
             
         except stripe.error.StripeError as e:
@@ -320,12 +577,12 @@ class StripeManager:
             raise Exception("Stripe not initialized")
             
         try:
-            account_link = stripe.AccountLink.create(
-                account=account_id,
-                refresh_url=refresh_url,
-                return_url=return_url,
-                type='account_onboarding',
-            )
+            account_link = stripe_call('write', lambda client: client.account_links.create(params={
+                'account': account_id,
+                'refresh_url': refresh_url,
+                'return_url': return_url,
+                'type': 'account_onboarding',
+            }))
             
             logger.info(f"Created account link for account {account_id}")
             return {
@@ -337,30 +594,19 @@ class StripeManager:
             logger.error(f"Stripe error creating account link: {str(e)}")
             raise Exception(f"Failed to create onboarding link: {str(e)}")
     
-    def get_account(self, account_id):
+    def get_account(self, account_id, max_age=None):
         """
         Get Stripe account details
         
         Args:
             account_id: Stripe account ID
+            max_age: Cache freshness override in seconds (see get_account_snapshot)
             
         Returns:
             dict: Account details
         """
-        if not self._initialize_stripe():
-            raise Exception("Stripe not initialized")
-            
         try:
-            account = stripe.Account.retrieve(account_id)
-            return {
-                'id': account.id,
-                'email': account.email,
-                'details_submitted': account.details_submitted,
-                'charges_enabled': account.charges_enabled,
-                'payouts_enabled': account.payouts_enabled,
-                'requirements': account.requirements.to_dict_recursive() if account.requirements else None,
-                'capabilities': account.capabilities.to_dict_recursive() if account.capabilities else None
-            }
+            return dict(self.get_account_snapshot(account_id, max_age=max_age))
             
         except stripe.error.StripeError as e:
             logger.error(f"Stripe error retrieving account: {str(e)}")
@@ -395,9 +641,10 @@ class StripeManager:
             raise ValueError("Invalid payload")
         except stripe.error.SignatureVerificationError as e:
             logger.error(f"Invalid webhook signature: {str(e)}")
-            raise stripe.error.SignatureVerificationError("Invalid signature")
+            raise stripe.error.SignatureVerificationError("Invalid signature", signature)
     
-    def create_transfer(self, amount, destination_account, application_fee=None, metadata=None):
+    def create_transfer(self, amount, destination_account, application_fee=None, metadata=None,
+                        idempotency_key=None):
         """
         Create a transfer to a connected account
         
@@ -406,6 +653,7 @@ class StripeManager:
             destination_account: Stripe account ID to transfer to
             application_fee: Platform fee in cents (optional)
             metadata: Additional metadata (optional)
+            idempotency_key: Key that makes retries of this transfer safe (optional)
             
         Returns:
             dict: Transfer details
@@ -426,7 +674,10 @@ class StripeManager:
             if metadata:
                 transfer_data['metadata'] = metadata
             
-            transfer = stripe.Transfer.create(**transfer_data)
+            options = {'idempotency_key': idempotency_key} if idempotency_key else {}
+            transfer = stripe_call('write', lambda client: client.transfers.create(
+                params=transfer_data, options=options
+            ))
             
             logger.info(f"Created transfer {transfer.id} for ${amount/100:.2f} to {destination_account}")
             return {
@@ -1,3 +1,3 @@
 """Utilities package for RevMark."""
 
-__all__ = ["email_utils"]
+__all__ = ["circuit_breaker", "email_utils", "memoize", "query_counter", "request_cache", "startup_timer", "tiered_cache", "upload_stream"]
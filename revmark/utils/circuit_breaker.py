@@ -0,0 +1,113 @@
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because the breaker is open."""
+
+
+class CircuitBreaker:
+    """Per-process circuit breaker for calls to a flaky upstream.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    every call fails immediately for ``reset_timeout`` seconds. It then lets
+    a single trial call through (half-open); success closes the breaker,
+    failure opens it again.
+
+    Args:
+        name (str): Label used in error messages.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds to stay open before a trial call.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        """Reserve a call slot, raising CircuitOpenError if the breaker refuses it.
+
+        Returns:
+            bool: True if the slot is the half-open trial, which the caller
+            must settle with record_success/record_failure or release_trial.
+        """
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return False
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            retry_in = max(self.reset_timeout - (time.monotonic() - self._opened_at), 0)
+            raise CircuitOpenError(
+                f"{self.name} is unavailable (circuit open, retry in {retry_in:.0f}s)"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a trial slot without a verdict, so the next call can take it."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def call(self, func, *args, should_trip=None, **kwargs):
+        """Run ``func`` through the breaker.
+
+        Args:
+            func (callable): The upstream call.
+            should_trip (callable): Predicate deciding whether an exception
+                counts as an upstream failure (default: every exception).
+        """
+        is_trial = self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if should_trip is None or should_trip(e):
+                self.record_failure()
+            else:
+                # The upstream answered; the error is about the request itself
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+            return result
+        finally:
+            # A BaseException (KeyboardInterrupt, a greenlet timeout) says
+            # nothing about the upstream, but must not hold the trial forever
+            if is_trial:
+                self.release_trial()
+
+    def reset(self):
+        self.record_success()
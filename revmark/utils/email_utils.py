@@ -1,11 +1,18 @@
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
 from flask_mail import Message
 from flask import current_app
-from revmark import mail
+from revmark import mail, db
 
 
 def send_email(subject, recipients, body, html=None):
     """Send an email using the app's initialized Mail instance.
 
+    This talks to the SMTP server synchronously; request handlers should
+    use queue_email instead.
+
     Args:
         subject (str): Email subject.
         recipients (list[str]): List of recipient email addresses.
@@ -14,3 +21,151 @@ def send_email(subject, recipients, body, html=None):
     """
     msg = Message(subject, recipients=recipients, body=body, html=html)
     mail.send(msg)
+
+
+def queue_email(subject, recipients, body, html=None, coalesce_key=None, send_after=None, commit=True):
+    """Insert an email into the outbox for the background worker to send.
+
+    One row is written per recipient so retries and coalescing work per
+    address.
+
+    Args:
+        subject (str): Email subject.
+        recipients (list[str]): List of recipient email addresses.
+        body (str): Plain-text body.
+        html (str|None): Optional HTML body.
+        coalesce_key (str|None): Pending emails to the same recipient with
+            the same key may be merged into a single email.
+        send_after (datetime|None): Hold the email until this (UTC) time,
+            e.g. the end of the recipient's digest window.
+        commit (bool): Commit the session (False to join the caller's
+            transaction).
+    """
+    from revmark.models import EmailOutbox
+
+    for recipient in recipients:
+        if not recipient:
+            continue
+        db.session.add(EmailOutbox(
+            recipient=recipient,
+            subject=subject,
+            body=body,
+            html=html,
+            coalesce_key=coalesce_key,
+            next_attempt_at=send_after or datetime.utcnow()
+        ))
+    if commit:
+        db.session.commit()
+
+
+def _retry_delay(attempts):
+    """Exponential backoff with jitter: ~1m, 2m, 4m ... capped at 1h."""
+    delay = min(60 * (2 ** (attempts - 1)), 3600)
+    return timedelta(seconds=delay + random.uniform(0, delay / 4))
+
+
+def queue_message_notification(recipient_user, subject, body):
+    """Queue a new-message email, honouring the recipient's digest policy.
+
+    Batched and daily users get the email held until their window closes;
+    everything queued in the same window is sent as one digest.
+    """
+    send_after = recipient_user.notification_send_time(
+        daily_hour=current_app.config.get('EMAIL_DIGEST_DAILY_HOUR', 8)
+    )
+    queue_email(subject, [recipient_user.email], body, coalesce_key="message", send_after=send_after)
+
+
+def _build_message(rows):
+    """Render one outgoing message for a group of outbox rows."""
+    if len(rows) == 1:
+        row = rows[0]
+        return Message(row.subject, recipients=[row.recipient], body=row.body, html=row.html)
+    if rows[0].coalesce_key == "message":
+        subject = f"You have {len(rows)} new messages on RevMark"
+        intro = "Here's what you missed on RevMark:"
+    else:
+        subject = f"You have {len(rows)} new notifications on RevMark"
+        intro = "Here's a summary of your RevMark notifications:"
+    sections = "\n\n----------\n\n".join(f"{row.subject}\n\n{row.body}" for row in rows)
+    return Message(subject, recipients=[rows[0].recipient], body=f"{intro}\n\n{sections}")
+
+
+def _group_rows(rows):
+    """Group pending rows by (recipient, coalesce_key); rows without a key stay alone."""
+    groups = []
+    keyed = sorted((r for r in rows if r.coalesce_key), key=lambda r: (r.recipient, r.coalesce_key, r.id))
+    for _, group in groupby(keyed, key=lambda r: (r.recipient, r.coalesce_key)):
+        groups.append(list(group))
+    groups.extend([r] for r in rows if not r.coalesce_key)
+    return groups
+
+
+def drain_outbox(batch_size=None, max_attempts=None):
+    """Send one batch of due outbox rows over a single SMTP connection.
+
+    Failed sends are retried with exponential backoff until max_attempts,
+    after which the row is marked failed.
+
+    Returns:
+        dict: Counts of emails sent, rows delivered, rows retried/failed.
+    """
+    from revmark.models import EmailOutbox
+
+    config = current_app.config
+    batch_size = batch_size or config.get('EMAIL_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = max_attempts or config.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    now = datetime.utcnow()
+    stats = {'emails_sent': 0, 'rows_sent': 0, 'rows_retried': 0, 'rows_failed': 0}
+
+    rows = EmailOutbox.query.filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not rows:
+        db.session.rollback()
+        return stats
+
+    def record_failure(group, error):
+        for row in group:
+            row.attempts += 1
+            row.last_error = str(error)[:1000]
+            if row.attempts >= max_attempts:
+                row.status = 'failed'
+                stats['rows_failed'] += 1
+            else:
+                row.next_attempt_at = now + _retry_delay(row.attempts)
+                stats['rows_retried'] += 1
+
+    groups = _group_rows(rows)
+    handled = 0
+    started = time.monotonic()
+    try:
+        with mail.connect() as connection:
+            for group in groups:
+                handled += 1
+                try:
+                    connection.send(_build_message(group))
+                except Exception as e:
+                    current_app.logger.warning(f"Outbox send to {group[0].recipient} failed: {e}")
+                    record_failure(group, e)
+                    continue
+                sent_at = datetime.utcnow()
+                for row in group:
+                    row.status = 'sent'
+                    row.sent_at = sent_at
+                    row.attempts += 1
+                stats['emails_sent'] += 1
+                stats['rows_sent'] += len(group)
+    except Exception as e:
+        # Could not open (or lost) the SMTP connection: retry what is left
+        current_app.logger.error(f"Outbox SMTP connection failed: {e}")
+        for group in groups[handled:]:
+            record_failure(group, e)
+
+    db.session.commit()
+    current_app.logger.info(
+        f"Outbox batch: {stats['emails_sent']} emails ({stats['rows_sent']} rows) sent, "
+        f"{stats['rows_retried']} retried, {stats['rows_failed']} failed in {time.monotonic() - started:.2f}s"
+    )
+    return stats
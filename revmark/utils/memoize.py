@@ -0,0 +1,141 @@
+import functools
+import hashlib
+import math
+import random
+import time
+import uuid
+
+from revmark import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Polling interval while another worker computes a missing value
+WAIT_INTERVAL = 0.05
+
+
+def _generation_key(namespace):
+    return f"memo:gen:{namespace}"
+
+
+def _generation(namespace):
+    """Current generation token of a namespace (created on first use)."""
+    key = _generation_key(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        generation = uuid.uuid4().hex[:12]
+        if not cache.add(key, generation, timeout=0):
+            generation = cache.get(key) or generation
+    return generation
+
+
+def invalidate_namespace(namespace):
+    """Start a new generation: every value memoized under the namespace is dropped.
+
+    Old entries are simply never read again and expire on their own, so this
+    is one cache write however many keys (e.g. feed cursors) the namespace has.
+    """
+    try:
+        cache.set(_generation_key(namespace), uuid.uuid4().hex[:12], timeout=0)
+    except Exception as e:
+        logger.warning(f"Could not invalidate cache namespace {namespace}: {str(e)}")
+
+
+def memoize(timeout=60, namespace=None, stale_timeout=300, lock_timeout=10, beta=1.0, unless=None):
+    """Memoize a function's return value in the app cache, stampede-safe.
+
+    - Single flight: on a miss only the worker holding the per-key lock
+      (``cache.add``) computes; the others wait for its result.
+    - Early refresh: each call may recompute a little before ``timeout``
+      with a probability that grows as expiry nears and with how long the
+      value took to compute (XFetch), so entries are renewed by one request
+      instead of expiring under load.
+    - Serve stale: an expired value is kept for ``stale_timeout`` more
+      seconds and returned while someone else refreshes it, or if
+      recomputing raises.
+
+    The wrapper gains ``invalidate(*args, **kwargs)`` to drop one entry.
+
+    Args:
+        timeout (int): Seconds a value is fresh.
+        namespace (str|None): Generation namespace (see invalidate_namespace).
+        stale_timeout (int): Seconds an expired value may still be served.
+        lock_timeout (int): Seconds the recompute lock (and any wait) lasts.
+        beta (float): Early-refresh eagerness (1.0 is the XFetch default).
+        unless (callable|None): Call the function directly, uncached, when
+            this returns True (as Flask-Caching's ``cached(unless=...)``).
+    """
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        def make_key(args, kwargs):
+            digest = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+            generation = _generation(namespace) if namespace else "-"
+            return f"memo:{name}:{generation}:{digest}"
+
+        def compute(key, args, kwargs):
+            started = time.perf_counter()
+            value = func(*args, **kwargs)
+            delta = time.perf_counter() - started
+            cache.set(key, (value, time.time() + timeout, delta), timeout=timeout + stale_timeout)
+            return value
+
+        def refresh(key, entry, args, kwargs):
+            """Recompute under the lock; fall back to the entry on failure."""
+            lock_key = f"{key}:lock"
+            if not cache.add(lock_key, 1, timeout=lock_timeout):
+                return entry[0]
+            try:
+                return compute(key, args, kwargs)
+            except Exception:
+                logger.exception(f"Recomputing {name} failed, serving stale value")
+                return entry[0]
+            finally:
+                cache.delete(lock_key)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if unless is not None and unless():
+                return func(*args, **kwargs)
+            try:
+                key = make_key(args, kwargs)
+                entry = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Cache unavailable for {name}: {str(e)}")
+                return func(*args, **kwargs)
+
+            if entry is not None:
+                value, fresh_until, delta = entry
+                now = time.time()
+                if now < fresh_until and now - delta * beta * math.log(1.0 - random.random()) < fresh_until:
+                    return value
+                return refresh(key, entry, args, kwargs)
+
+            # Miss: one worker computes, the rest wait for its result
+            lock_key = f"{key}:lock"
+            if cache.add(lock_key, 1, timeout=lock_timeout):
+                try:
+                    return compute(key, args, kwargs)
+                finally:
+                    cache.delete(lock_key)
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_INTERVAL)
+                entry = cache.get(key)
+                if entry is not None:
+                    return entry[0]
+                if not cache.has(lock_key):
+                    break
+            return compute(key, args, kwargs)
+
+        def invalidate(*args, **kwargs):
+            try:
+                cache.delete(make_key(args, kwargs))
+            except Exception as e:
+                logger.warning(f"Could not invalidate {name}: {str(e)}")
+
+        wrapper.invalidate = invalidate
+        return wrapper
+
+    return decorator
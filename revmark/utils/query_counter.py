@@ -0,0 +1,54 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from revmark import db
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is active."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Count SQL statements issued on the engine inside the block.
+
+    ``engine`` defaults to ``db.engine``, which needs an application context.
+
+    Example:
+        with count_queries() as counter:
+            client.get("/")
+        print(counter.count)
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_query_count(expected, engine=None):
+    """Fail if the block does not issue exactly ``expected`` SQL statements.
+
+    Intended for tests that pin a page to a fixed query budget, e.g.:
+        with assert_query_count(3):
+            client.get("/inbox")
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count != expected:
+        listing = "\n".join(f"  {i + 1}. {sql}" for i, sql in enumerate(counter.statements))
+        raise AssertionError(
+            f"Expected {expected} SQL statements, got {counter.count}:\n{listing}"
+        )
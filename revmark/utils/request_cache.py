@@ -0,0 +1,24 @@
+from flask import g, has_app_context
+
+
+def request_cached(key, loader):
+    """Return a value memoized for the lifetime of the current request.
+
+    Outside an application context the loader is simply called.
+
+    Args:
+        key (hashable): Cache key, unique within the request.
+        loader (callable): Zero-argument function producing the value.
+    """
+    if not has_app_context():
+        return loader()
+    store = g.setdefault("_request_cache", {})
+    if key not in store:
+        store[key] = loader()
+    return store[key]
+
+
+def invalidate_request_cache(key):
+    """Drop a memoized value so the next lookup reloads it."""
+    if has_app_context():
+        g.setdefault("_request_cache", {}).pop(key, None)
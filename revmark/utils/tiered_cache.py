@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask_caching.backends.rediscache import RedisCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRU:
+    """Bounded, thread-safe LRU with a per-entry expiry.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is evicted.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (hit, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache(RedisCache):
+    """Flask-Caching backend: a small in-process LRU in front of Redis.
+
+    Reads are answered from worker memory for up to ``local_ttl`` seconds and
+    only go to Redis on a local miss. Every write or delete goes to Redis and
+    is published on ``channel``; each process runs a subscriber thread that
+    drops its local copies of the published keys, so gunicorn workers on every
+    node converge within pub/sub latency. ``local_ttl`` bounds staleness if a
+    message is missed, and the local tier is cleared whenever the subscriber
+    (re)connects.
+
+    Local entries hold the serialized bytes, so every get returns a fresh
+    object exactly as a Redis read would.
+
+    Configure with CACHE_TYPE = "revmark.utils.tiered_cache.TieredCache" plus
+    the usual CACHE_REDIS_URL, and CACHE_LOCAL_TTL, CACHE_LOCAL_MAX_ENTRIES and
+    CACHE_INVALIDATION_CHANNEL. A local_ttl of 0 disables the local tier.
+    """
+
+    def __init__(self, *args, local_ttl=5, local_max_entries=1024,
+                 channel="revmark:cache:invalidate", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local_ttl = local_ttl
+        self.channel = channel
+        self._local = LocalLRU(local_max_entries)
+        self._origin = uuid.uuid4().hex
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            local_ttl=config.get("CACHE_LOCAL_TTL", 5),
+            local_max_entries=config.get("CACHE_LOCAL_MAX_ENTRIES", 1024),
+            channel=config.get("CACHE_INVALIDATION_CHANNEL", "revmark:cache:invalidate"),
+        )
+        return super().factory(app, config, args, kwargs)
+
+    # ---------- INVALIDATION ----------
+
+    def _ensure_listener(self):
+        """Start the subscriber in this process (again after a fork)."""
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._listener_lock:
+            if self._listener_pid == pid:
+                return
+            # A forked worker (gunicorn --preload) has no subscriber thread and
+            # shares the parent's origin id, so it starts afresh
+            self._local.clear()
+            self._origin = uuid.uuid4().hex
+            self._listener_pid = pid
+            threading.Thread(target=self._listen, name="cache-invalidation", daemon=True).start()
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = self._write_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything published before this subscription was missed
+                self._local.clear()
+                backoff = 1
+                for message in pubsub.listen():
+                    self._on_message(message["data"])
+            except Exception as e:
+                logger.warning(f"Cache invalidation subscriber disconnected: {str(e)}")
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            self._local.clear()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _on_message(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        origin, _, keys = data.partition("\n")
+        if origin == self._origin:
+            return
+        if keys:
+            self._local.discard(*keys.split("\n"))
+        else:
+            self._local.clear()
+
+    def _invalidate(self, *keys):
+        """Drop keys locally and tell every other process (no keys = everything)."""
+        if keys:
+            self._local.discard(*keys)
+        else:
+            self._local.clear()
+        try:
+            self._write_client.publish(self.channel, "\n".join((self._origin,) + keys))
+        except Exception as e:
+            logger.warning(f"Could not publish cache invalidation: {str(e)}")
+
+    # ---------- READS ----------
+
+    def _remember(self, key, raw):
+        if raw is not None and self.local_ttl > 0:
+            self._local.set(key, raw, self.local_ttl)
+
+    def get(self, key):
+        self._ensure_listener()
+        hit, raw = self._local.get(key)
+        if not hit:
+            raw = self._read_client.get(f"{self._get_prefix()}{key}")
+            self._remember(key, raw)
+        return self.serializer.loads(raw)
+
+    def get_many(self, *keys):
+        self._ensure_listener()
+        raws = {}
+        missing = []
+        for key in keys:
+            hit, raw = self._local.get(key)
+            if hit:
+                raws[key] = raw
+            else:
+                missing.append(key)
+        if missing:
+            prefix = self._get_prefix()
+            fetched = self._read_client.mget([f"{prefix}{key}" for key in missing])
+            for key, raw in zip(missing, fetched):
+                self._remember(key, raw)
+                raws[key] = raw
+        return [self.serializer.loads(raws[key]) for key in keys]
+
+    def has(self, key):
+        self._ensure_listener()
+        hit, _ = self._local.get(key)
+        return hit or super().has(key)
+
+    # ---------- WRITES ----------
+
+    def set(self, key, value, timeout=None):
+        result = super().set(key, value, timeout=timeout)
+        self._invalidate(key)
+        return result
+
+    def add(self, key, value, timeout=None):
+        created = super().add(key, value, timeout=timeout)
+        if created:
+            self._invalidate(key)
+        return created
+
+    def set_many(self, mapping, timeout=None):
+        result = super().set_many(mapping, timeout=timeout)
+        if mapping:
+            self._invalidate(*mapping)
+        return result
+
+    def delete(self, key):
+        result = super().delete(key)
+        self._invalidate(key)
+        return result
+
+    def delete_many(self, *keys):
+        # Local copies go first: the base class checks has() afterwards
+        self._local.discard(*keys)
+        result = super().delete_many(*keys)
+        if keys:
+            self._invalidate(*keys)
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._invalidate()
+        return result
+
+    def inc(self, key, delta=1):
+        result = super().inc(key, delta=delta)
+        self._invalidate(key)
+        return result
+
+    def dec(self, key, delta=1):
+        result = super().dec(key, delta=delta)
+        self._invalidate(key)
+        return result
@@ -0,0 +1,65 @@
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+from flask import Request, current_app, has_app_context
+
+
+class UploadTooLarge(ValueError):
+    """Raised mid-stream when an upload passes its size limit."""
+
+
+class CountingReader:
+    """Read-only wrapper that counts bytes as they are read.
+
+    Replaces seeking to the end of an upload to learn its size: the size is
+    known once the consumer (e.g. boto3's transfer manager) has read the
+    stream, and an upload over ``max_size`` fails as soon as it crosses the
+    limit instead of after it has been sent.
+
+    Args:
+        stream: Readable file-like object.
+        max_size (int|None): Largest number of bytes allowed through.
+        hasher: Optional hashlib object updated with every chunk read.
+    """
+
+    def __init__(self, stream, max_size=None, hasher=None):
+        self._stream = stream
+        self.max_size = max_size
+        self.hasher = hasher
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self._stream.read(size)
+        self.bytes_read += len(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+        if self.max_size is not None and self.bytes_read > self.max_size:
+            raise UploadTooLarge(
+                f"File size exceeds maximum allowed size of {self.max_size} bytes"
+            )
+        return chunk
+
+    def drain(self, chunk_size=1024 * 1024):
+        """Read the rest of the stream (e.g. just to hash and size it)."""
+        while self.read(chunk_size):
+            pass
+        return self.bytes_read
+
+
+class UploadRequest(Request):
+    """Request class that keeps uploaded files in memory.
+
+    Werkzeug spools any multipart body over 500KB to a temporary file, so a
+    file sent through the app is written to disk and read back before it
+    reaches S3. Files are instead buffered in memory up to
+    UPLOAD_SPOOL_MAX_MEMORY (bounded by MAX_CONTENT_LENGTH) and streamed to
+    S3 from there.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_memory = 1024 * 500
+        if has_app_context():
+            max_memory = current_app.config.get("UPLOAD_SPOOL_MAX_MEMORY", max_memory)
+        if total_content_length is not None and total_content_length <= max_memory:
+            return BytesIO()
+        return SpooledTemporaryFile(max_size=max_memory, mode="rb+")
@@ -3,13 +3,20 @@ import os
 
 class ScalingConfig:
     # Caching configuration
-    CACHE_TYPE = "RedisCache" if os.getenv("REDIS_URL") else "SimpleCache"
+    # With Redis: per-worker LRU in front of Redis, kept coherent via pub/sub
+    CACHE_TYPE = "revmark.utils.tiered_cache.TieredCache" if os.getenv("REDIS_URL") else "SimpleCache"
     CACHE_REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutes
+    CACHE_LOCAL_TTL = int(os.getenv("CACHE_LOCAL_TTL", "5"))  # seconds a value is served from worker memory (0 = off)
+    CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "1024"))
+    CACHE_INVALIDATION_CHANNEL = "revmark:cache:invalidate"
     
     # Session configuration for multiple instances
-    SESSION_TYPE = 'redis' if os.getenv("REDIS_URL") else 'filesystem'
+    SESSION_TYPE = os.getenv("SESSION_TYPE", 'redis' if os.getenv("REDIS_URL") else 'filesystem')  # redis, filesystem, or cookie for signed-cookie sessions
     SESSION_REDIS = os.getenv("REDIS_URL")
+    SESSION_KEY_PREFIX = "session:"
+    SESSION_FILE_DIR = os.getenv("SESSION_FILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "sessions"))
+    SESSION_FILE_THRESHOLD = 10000  # filesystem sessions kept before the oldest are pruned
     
     # Performance settings - only for PostgreSQL
     # SQLite engine options will be set in Config class
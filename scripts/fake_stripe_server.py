@@ -0,0 +1,495 @@
+# Local stand-in for the subset of the Stripe API that RevMark uses, for
+# offline load testing of the payment paths.
+#
+#   python scripts/fake_stripe_server.py --port 12111 \
+#       --webhook-url http://localhost:5000/stripe/webhook \
+#       --webhook-url http://localhost:8000/webhook \
+#       --webhook-secret whsec_test --latency-ms 80 --error-rate 0.02
+#
+# Then point the apps at it:
+#   STRIPE_API_BASE=http://localhost:12111 STRIPE_SECRET_KEY=sk_test_fake \
+#   STRIPE_WEBHOOK_SECRET=whsec_test python app.py
+#   (the FastAPI escrow app reads STRIPE_API_BASE and STRIPE_API_KEY)
+#
+# Implemented: accounts, account_links, payment_intents (create, retrieve,
+# list, confirm, capture, cancel), transfers and refunds (create, retrieve,
+# list). Ids are deterministic (a per-type counter), Idempotency-Key is
+# honoured, and latency / 5xx / 429 injection is driven by a seeded RNG.
+# Test-control endpoints:
+#   POST /_fake/payment_intents/<id>/succeed   buyer paid (emits payment_intent.succeeded)
+#   POST /_fake/accounts/<id>/onboard          onboarding done (emits account.updated)
+#   GET  /_fake/stats                          request / error / webhook counters
+#   POST /_fake/reset                          drop all objects and counters
+
+import argparse
+import hashlib
+import hmac
+import json
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qsl
+
+RESOURCE_PREFIXES = {
+    'accounts': 'acct',
+    'payment_intents': 'pi',
+    'transfers': 'tr',
+    'refunds': 're',
+    'events': 'evt',
+}
+
+
+class StripeError(Exception):
+    def __init__(self, status, error_type, message, code=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'error': {'type': error_type, 'message': message}}
+        if code:
+            self.body['error']['code'] = code
+
+
+def decode_form(body):
+    """Decode Stripe's bracketed form encoding (metadata[k]=v, items[0]=x) into nested dicts/lists"""
+    result = {}
+    for raw_key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r'[^\[\]]+', raw_key)
+        target = result
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if last:
+                target[part] = value
+            else:
+                target = target.setdefault(part, {})
+    return _lists_from_indexes(result)
+
+
+def _lists_from_indexes(value):
+    if isinstance(value, dict):
+        converted = {k: _lists_from_indexes(v) for k, v in value.items()}
+        if converted and all(k.isdigit() for k in converted):
+            return [converted[k] for k in sorted(converted, key=int)]
+        return converted
+    return value
+
+
+def as_bool(value):
+    return str(value).lower() in ('true', '1', 'yes')
+
+
+class FakeStripe:
+    """In-memory Stripe state; every method runs under one lock"""
+
+    def __init__(self, seed=0, webhook_urls=(), webhook_secret=None, auto_succeed=False):
+        self.seed = seed
+        self.webhook_urls = list(webhook_urls)
+        self.webhook_secret = webhook_secret
+        self.auto_succeed = auto_succeed
+        self.lock = threading.RLock()
+        self.webhooks = queue.Queue()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.objects = {name: {} for name in RESOURCE_PREFIXES}
+            self.counters = {name: 0 for name in RESOURCE_PREFIXES}
+            self.idempotent = {}
+            self.clock = 1700000000
+            self.stats = {'requests': 0, 'injected_errors': 0, 'idempotent_replays': 0,
+                          'webhooks_sent': 0, 'webhooks_failed': 0}
+
+    # ---------- helpers ----------
+
+    def _new_id(self, resource):
+        self.counters[resource] += 1
+        return f"{RESOURCE_PREFIXES[resource]}_fake{self.seed:04d}{self.counters[resource]:010d}"
+
+    def _now(self):
+        # Strictly increasing so list ordering and created filters are deterministic
+        self.clock = max(self.clock + 1, int(time.time()))
+        return self.clock
+
+    def _get(self, resource, object_id):
+        obj = self.objects[resource].get(object_id)
+        if obj is None:
+            raise StripeError(404, 'invalid_request_error', f"No such {resource[:-1]}: '{object_id}'", 'resource_missing')
+        return obj
+
+    def _store(self, resource, obj):
+        self.objects[resource][obj['id']] = obj
+        return obj
+
+    def emit(self, event_type, obj):
+        """Queue a signed webhook delivery to every configured endpoint"""
+        if not self.webhook_urls:
+            return
+        event = {
+            'id': self._new_id('events'),
+            'object': 'event',
+            'api_version': '2023-10-16',
+            'created': self._now(),
+            'type': event_type,
+            'livemode': False,
+            'data': {'object': json.loads(json.dumps(obj))},
+        }
+        self.webhooks.put(event)
+
+    def sign(self, payload):
+        timestamp = int(time.time())
+        signature = hmac.new(self.webhook_secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={signature}"
+
+    def deliver_webhooks(self):
+        """Background thread: POST queued events to each endpoint"""
+        while True:
+            event = self.webhooks.get()
+            payload = json.dumps(event)
+            headers = {'Content-Type': 'application/json'}
+            if self.webhook_secret:
+                headers['Stripe-Signature'] = self.sign(payload)
+            for url in self.webhook_urls:
+                try:
+                    request = urllib.request.Request(url, data=payload.encode(), headers=headers, method='POST')
+                    with urllib.request.urlopen(request, timeout=10) as response:
+                        response.read()
+                    self.stats['webhooks_sent'] += 1
+                except Exception as e:
+                    self.stats['webhooks_failed'] += 1
+                    print(f"❌ Webhook {event['type']} to {url} failed: {e}")
+
+    # ---------- accounts ----------
+
+    def create_account(self, params):
+        account = self._store('accounts', {
+            'id': self._new_id('accounts'),
+            'object': 'account',
+            'type': params.get('type', 'express'),
+            'country': params.get('country', 'US'),
+            'email': params.get('email'),
+            'created': self._now(),
+            'details_submitted': False,
+            'charges_enabled': False,
+            'payouts_enabled': False,
+            'capabilities': {name: 'inactive' for name in params.get('capabilities', {})},
+            'requirements': {'currently_due': ['external_account', 'tos_acceptance.date'], 'disabled_reason': 'requirements.past_due'},
+            'settings': params.get('settings', {}),
+        })
+        return account
+
+    def onboard_account(self, account_id):
+        account = self._get('accounts', account_id)
+        account.update({
+            'details_submitted': True,
+            'charges_enabled': True,
+            'payouts_enabled': True,
+            'capabilities': {name: 'active' for name in account['capabilities'] or {'transfers': 1}},
+            'requirements': {'currently_due': [], 'disabled_reason': None},
+        })
+        self.emit('account.updated', account)
+        return account
+
+    def create_account_link(self, params):
+        account_id = params.get('account')
+        self._get('accounts', account_id)
+        created = self._now()
+        return {
+            'object': 'account_link',
+            'created': created,
+            'expires_at': created + 300,
+            'url': f"https://connect.stripe.test/setup/e/{account_id}/{created}",
+        }
+
+    # ---------- payment intents ----------
+
+    def create_payment_intent(self, params):
+        try:
+            amount = int(params['amount'])
+        except (KeyError, ValueError):
+            raise StripeError(400, 'invalid_request_error', 'Missing required param: amount.', 'parameter_missing')
+        intent_id = self._new_id('payment_intents')
+        intent = self._store('payment_intents', {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'amount_received': 0,
+            'currency': params.get('currency', 'usd'),
+            'capture_method': params.get('capture_method', 'automatic'),
+            'client_secret': f"{intent_id}_secret_{self.seed:04d}",
+            'created': self._now(),
+            'description': params.get('description'),
+            'metadata': params.get('metadata', {}),
+            'on_behalf_of': params.get('on_behalf_of'),
+            'application_fee_amount': int(params['application_fee_amount']) if params.get('application_fee_amount') else None,
+            'transfer_data': params.get('transfer_data'),
+            'payment_method_types': params.get('payment_method_types', ['card']),
+            'status': 'requires_payment_method',
+        })
+        self.emit('payment_intent.created', intent)
+        if self.auto_succeed or as_bool(params.get('confirm', False)):
+            self.succeed_payment_intent(intent_id)
+        return intent
+
+    def succeed_payment_intent(self, intent_id):
+        """Simulate the buyer completing payment"""
+        intent = self._get('payment_intents', intent_id)
+        if intent['status'] in ('succeeded', 'canceled'):
+            raise StripeError(400, 'invalid_request_error',
+                              f"This PaymentIntent's status is {intent['status']}.", 'payment_intent_unexpected_state')
+        if intent['capture_method'] == 'manual':
+            intent['status'] = 'requires_capture'
+            self.emit('payment_intent.amount_capturable_updated', intent)
+        else:
+            intent['status'] = 'succeeded'
+            intent['amount_received'] = intent['amount']
+            self.emit('payment_intent.succeeded', intent)
+        return intent
+
+    def capture_payment_intent(self, intent_id, params):
+        intent = self._get('payment_intents', intent_id)
+        if intent['status'] != 'requires_capture':
+            raise StripeError(400, 'invalid_request_error',
+                              f"This PaymentIntent could not be captured because it has a status of {intent['status']}.",
+                              'payment_intent_unexpected_state')
+        intent['status'] = 'succeeded'
+        intent['amount_received'] = int(params.get('amount_to_capture', intent['amount']))
+        self.emit('payment_intent.succeeded', intent)
+        return intent
+
+    def cancel_payment_intent(self, intent_id):
+        intent = self._get('payment_intents', intent_id)
+        if intent['status'] == 'succeeded':
+            raise StripeError(400, 'invalid_request_error', 'You cannot cancel this PaymentIntent because it has a status of succeeded.',
+                              'payment_intent_unexpected_state')
+        intent['status'] = 'canceled'
+        self.emit('payment_intent.canceled', intent)
+        return intent
+
+    # ---------- transfers and refunds ----------
+
+    def create_transfer(self, params):
+        destination = params.get('destination')
+        self._get('accounts', destination)
+        transfer = self._store('transfers', {
+            'id': self._new_id('transfers'),
+            'object': 'transfer',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'usd'),
+            'destination': destination,
+            'transfer_group': params.get('transfer_group'),
+            'metadata': params.get('metadata', {}),
+            'created': self._now(),
+            'reversed': False,
+        })
+        self.emit('transfer.created', transfer)
+        self.emit('transfer.paid', transfer)
+        return transfer
+
+    def create_refund(self, params):
+        intent = self._get('payment_intents', params.get('payment_intent'))
+        if intent['status'] != 'succeeded':
+            raise StripeError(400, 'invalid_request_error',
+                              f"This PaymentIntent does not have a successful charge to refund.", 'charge_not_refundable')
+        already = sum(r['amount'] for r in self.objects['refunds'].values() if r['payment_intent'] == intent['id'])
+        amount = int(params.get('amount', intent['amount_received'] - already))
+        if amount <= 0 or already + amount > intent['amount_received']:
+            raise StripeError(400, 'invalid_request_error', 'Charge has already been refunded.', 'charge_already_refunded')
+        refund = self._store('refunds', {
+            'id': self._new_id('refunds'),
+            'object': 'refund',
+            'amount': amount,
+            'currency': intent['currency'],
+            'payment_intent': intent['id'],
+            'reason': params.get('reason'),
+            'status': 'succeeded',
+            'metadata': params.get('metadata', {}),
+            'created': self._now(),
+        })
+        self.emit('charge.refunded', {'id': f"ch_{intent['id'][3:]}", 'object': 'charge',
+                                      'payment_intent': intent['id'], 'amount_refunded': already + amount})
+        return refund
+
+    # ---------- listing ----------
+
+    def list(self, resource, path, params):
+        """Newest first, with limit / starting_after / ending_before / created[...] like the real API"""
+        items = sorted(self.objects[resource].values(), key=lambda o: (o['created'], o['id']), reverse=True)
+        created = params.get('created')
+        if isinstance(created, dict):
+            for op, compare in (('gte', int.__ge__), ('gt', int.__gt__), ('lte', int.__le__), ('lt', int.__lt__)):
+                if op in created:
+                    bound = int(created[op])
+                    items = [o for o in items if compare(o['created'], bound)]
+        for field in ('payment_intent', 'destination', 'transfer_group'):
+            if params.get(field):
+                items = [o for o in items if o.get(field) == params[field]]
+        ids = [o['id'] for o in items]
+        if params.get('starting_after') in ids:
+            items = items[ids.index(params['starting_after']) + 1:]
+        elif params.get('ending_before') in ids:
+            items = items[:ids.index(params['ending_before'])]
+        limit = max(1, min(int(params.get('limit', 10)), 100))
+        return {'object': 'list', 'url': path, 'has_more': len(items) > limit, 'data': items[:limit]}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeStripe/1.0'
+
+    ROUTES = [
+        ('POST', r'/v1/accounts', lambda s, m, p: s.create_account(p)),
+        ('GET', r'/v1/accounts/(?P<id>[\w-]+)', lambda s, m, p: s._get('accounts', m['id'])),
+        ('POST', r'/v1/account_links', lambda s, m, p: s.create_account_link(p)),
+        ('POST', r'/v1/payment_intents', lambda s, m, p: s.create_payment_intent(p)),
+        ('GET', r'/v1/payment_intents/(?P<id>[\w-]+)', lambda s, m, p: s._get('payment_intents', m['id'])),
+        ('POST', r'/v1/payment_intents/(?P<id>[\w-]+)/confirm', lambda s, m, p: s.succeed_payment_intent(m['id'])),
+        ('POST', r'/v1/payment_intents/(?P<id>[\w-]+)/capture', lambda s, m, p: s.capture_payment_intent(m['id'], p)),
+        ('POST', r'/v1/payment_intents/(?P<id>[\w-]+)/cancel', lambda s, m, p: s.cancel_payment_intent(m['id'])),
+        ('POST', r'/v1/transfers', lambda s, m, p: s.create_transfer(p)),
+        ('GET', r'/v1/transfers/(?P<id>[\w-]+)', lambda s, m, p: s._get('transfers', m['id'])),
+        ('POST', r'/v1/refunds', lambda s, m, p: s.create_refund(p)),
+        ('GET', r'/v1/refunds/(?P<id>[\w-]+)', lambda s, m, p: s._get('refunds', m['id'])),
+        ('POST', r'/_fake/payment_intents/(?P<id>[\w-]+)/succeed', lambda s, m, p: s.succeed_payment_intent(m['id'])),
+        ('POST', r'/_fake/accounts/(?P<id>[\w-]+)/onboard', lambda s, m, p: s.onboard_account(m['id'])),
+        ('GET', r'/_fake/stats', lambda s, m, p: dict(s.stats, objects={k: len(v) for k, v in s.objects.items()})),
+        ('POST', r'/_fake/reset', lambda s, m, p: s.reset() or {'reset': True}),
+    ]
+    LISTABLE = ('payment_intents', 'transfers', 'refunds', 'accounts')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Request-Id', f"req_fake{random.getrandbits(48):012x}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _inject_faults(self):
+        """Sleep and maybe fail, as configured; returns True if an error was sent"""
+        options = self.server.options
+        with self.server.rng_lock:
+            delay = max(0.0, self.server.rng.gauss(options.latency_ms, options.jitter_ms)) / 1000
+            roll = self.server.rng.random()
+        if delay:
+            time.sleep(delay)
+        if roll < options.rate_limit_rate:
+            self.server.fake.stats['injected_errors'] += 1
+            self._send(429, {'error': {'type': 'invalid_request_error', 'code': 'rate_limit',
+                                       'message': 'Too many requests (injected).'}},
+                       {'Stripe-Should-Retry': 'true'})
+            return True
+        if roll < options.rate_limit_rate + options.error_rate:
+            self.server.fake.stats['injected_errors'] += 1
+            self._send(500, {'error': {'type': 'api_error', 'message': 'Internal error (injected).'}},
+                       {'Stripe-Should-Retry': 'true'})
+            return True
+        return False
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        params = decode_form(url.query if method == 'GET' else body)
+        is_control = url.path.startswith('/_fake/')
+
+        if not is_control:
+            if not (self.headers.get('Authorization') or '').startswith('Bearer sk_'):
+                self._send(401, {'error': {'type': 'invalid_request_error', 'message': 'Invalid API Key provided.'}})
+                return
+            if self._inject_faults():
+                return
+
+        idempotency_key = self.headers.get('Idempotency-Key') if method == 'POST' else None
+        with fake.lock:
+            fake.stats['requests'] += 1
+            if idempotency_key and idempotency_key in fake.idempotent:
+                fake.stats['idempotent_replays'] += 1
+                status, response = fake.idempotent[idempotency_key]
+                self._send(status, response, {'Idempotent-Replayed': 'true'})
+                return
+            try:
+                status, response = 200, self._route(method, url.path, params)
+            except StripeError as e:
+                status, response = e.status, e.body
+            if idempotency_key and status < 500:
+                fake.idempotent[idempotency_key] = (status, response)
+            # Serialize under the lock so concurrent updates cannot tear the snapshot
+            response = json.loads(json.dumps(response))
+        self._send(status, response)
+
+    def _route(self, method, path, params):
+        fake = self.server.fake
+        if method == 'GET':
+            match = re.fullmatch(r'/v1/(\w+)', path)
+            if match and match[1] in self.LISTABLE:
+                return fake.list(match[1], path, params)
+        for route_method, pattern, action in self.ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, path)
+            if match:
+                return action(fake, match.groupdict(), params)
+        raise StripeError(404, 'invalid_request_error', f"Unrecognized request URL ({method}: {path}).")
+
+
+def make_server(host='127.0.0.1', port=12111, seed=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                rate_limit_rate=0.0, webhook_urls=(), webhook_secret=None, auto_succeed=False, verbose=False):
+    """Build (but do not start) a fake Stripe server; also usable from tests"""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.options = argparse.Namespace(latency_ms=latency_ms, jitter_ms=jitter_ms,
+                                        error_rate=error_rate, rate_limit_rate=rate_limit_rate)
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.verbose = verbose
+    server.fake = FakeStripe(seed=seed, webhook_urls=webhook_urls, webhook_secret=webhook_secret,
+                             auto_succeed=auto_succeed)
+    threading.Thread(target=server.fake.deliver_webhooks, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Stripe stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--seed", type=int, default=0, help="Seeds ids and fault injection")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean added latency per API call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Std deviation of the added latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API calls answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of API calls answered with a 429")
+    parser.add_argument("--webhook-url", action="append", default=[], help="Endpoint to send signed events to (repeatable)")
+    parser.add_argument("--webhook-secret", default=None, help="Signing secret (STRIPE_WEBHOOK_SECRET of the apps)")
+    parser.add_argument("--auto-succeed", action="store_true", help="Mark PaymentIntents paid as soon as they are created")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                         webhook_urls=args.webhook_url, webhook_secret=args.webhook_secret,
+                         auto_succeed=args.auto_succeed, verbose=args.verbose)
+    print(f"✅ Fake Stripe listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}±{args.jitter_ms}ms, errors {args.error_rate:.1%}, 429s {args.rate_limit_rate:.1%}, "
+          f"webhooks -> {', '.join(args.webhook_url) or 'none'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
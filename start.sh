@@ -1,2 +1,2 @@
 # Railway Start Command
-gunicorn --bind 0.0.0.0:$PORT app:app
+gunicorn -c gunicorn.conf.py app:app
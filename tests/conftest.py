@@ -0,0 +1,102 @@
+import threading
+from pytest import fixture, MonkeyPatch
+from werkzeug.security import generate_password_hash
+from config import Config
+from scaling_config import ScalingConfig
+from revmark import create_app, db, cache
+from revmark.models import User
+
+
+@fixture(scope="session")
+def app(tmp_path_factory):
+    root = tmp_path_factory.mktemp("revmark")
+    with MonkeyPatch.context() as mp:
+        mp.setattr(Config, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{root / 'test.db'}")
+        mp.setattr(Config, "AUTO_CREATE_TABLES", True)
+        mp.setattr(Config, "ADMIN_ENABLED", False)
+        mp.setattr(ScalingConfig, "CACHE_TYPE", "SimpleCache")
+        mp.setattr(ScalingConfig, "SESSION_TYPE", "cookie")
+        app = create_app()
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        STORAGE_BACKEND="local",
+        LOCAL_STORAGE_ROOT=str(root / "storage"),
+    )
+    yield app
+
+
+@fixture(autouse=True)
+def database(app):
+    """Fresh tables, an empty cache and a clean storage root for every test"""
+    from revmark.s3_utils import s3_manager
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        cache.clear()
+    # Built from config on first use; rebuild against the test root
+    s3_manager._backend = None
+
+
+@fixture
+def app_context(app):
+    """App context for tests that call the code directly
+
+    Requests made through the test client must not run inside it: they would
+    share its session and g, hiding the queries a real request issues.
+    """
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@fixture
+def shared_cache(monkeypatch):
+    """Cache as a Redis-backed deployment would (SimpleCache stands in for Redis)"""
+    from revmark import models, listings
+    monkeypatch.setattr(models, "cache_is_shared", lambda: True)
+    monkeypatch.setattr(listings, "cache_is_shared", lambda: True)
+
+
+@fixture
+def client(app):
+    return app.test_client()
+
+
+@fixture
+def users(app):
+    with app.app_context():
+        alice = User(username="alice", email="alice@example.com", password=generate_password_hash("pw"))
+        bob = User(username="bob", email="bob@example.com", password=generate_password_hash("pw"))
+        db.session.add_all([alice, bob])
+        db.session.commit()
+        return alice.id, bob.id
+
+
+@fixture
+def login(client):
+    def log_in(email):
+        response = client.post("/login", data={"email": email, "password": "pw"})
+        assert response.status_code == 302
+    return log_in
+
+
+@fixture(scope="session")
+def stripe_server():
+    from scripts.fake_stripe_server import make_server
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@fixture
+def fake_stripe(app, stripe_server, monkeypatch):
+    """The app pointed at an empty fake Stripe (scripts/fake_stripe_server.py)"""
+    from revmark import stripe_utils
+    stripe_server.fake.reset()
+    host, port = stripe_server.server_address[:2]
+    monkeypatch.setitem(app.config, "STRIPE_API_BASE", f"http://{host}:{port}")
+    monkeypatch.setitem(app.config, "STRIPE_SECRET_KEY", "sk_test_fake")
+    monkeypatch.setattr(stripe_utils, "_breaker", None)
+    return stripe_server.fake
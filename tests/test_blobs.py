@@ -0,0 +1,87 @@
+from io import BytesIO
+from pytest import fixture
+from werkzeug.datastructures import FileStorage
+from revmark import db
+from revmark.models import Message, MessageAttachment, AttachmentBlob
+from revmark.s3_utils import s3_manager
+
+
+@fixture
+def attach(app_context, users):
+    """Send a message carrying one file and return the message id"""
+    alice, bob = users
+
+    def send_file(content, filename="notes.pdf"):
+        message = Message(body="file", sender_id=alice, receiver_id=bob)
+        db.session.add(message)
+        db.session.flush()
+        upload = FileStorage(stream=BytesIO(content), filename=filename, content_type="application/pdf")
+        db.session.add(MessageAttachment.from_file_info(message.id, s3_manager.upload_blob(upload)))
+        db.session.commit()
+        return message.id
+
+    return send_file
+
+
+def delete_message(message_id):
+    db.session.delete(Message.query.get(message_id))
+    db.session.commit()
+
+
+def test_same_content_is_stored_once(attach):
+    attach(b"%PDF same")
+    attach(b"%PDF same", filename="copy.pdf")
+    attach(b"%PDF other")
+    blobs = AttachmentBlob.query.order_by(AttachmentBlob.id).all()
+    assert [blob.ref_count for blob in blobs] == [2, 1]
+    keys = {a.s3_key for a in MessageAttachment.query}
+    assert keys == {blob.s3_key for blob in blobs}
+
+
+def test_deleting_attachments_releases_references(attach):
+    first = attach(b"%PDF same")
+    second = attach(b"%PDF same")
+    delete_message(first)
+    assert AttachmentBlob.query.populate_existing().one().ref_count == 1
+    delete_message(second)
+    blob = AttachmentBlob.query.populate_existing().one()
+    assert blob.ref_count == 0
+    assert blob.released_at is not None
+
+
+def test_sweep_deletes_only_unreferenced_blobs_after_the_grace_period(attach):
+    attach(b"%PDF kept")
+    dropped = attach(b"%PDF dropped")
+    delete_message(dropped)
+    dropped_key = AttachmentBlob.query.filter_by(ref_count=0).one().s3_key
+
+    assert s3_manager.delete_orphaned_blobs(grace_seconds=3600) == 0
+    assert s3_manager.delete_orphaned_blobs(grace_seconds=0) == 1
+    assert s3_manager.get_file_info(dropped_key) is None
+    blob = AttachmentBlob.query.one()
+    assert blob.ref_count == 1
+    assert s3_manager.get_file_info(blob.s3_key) is not None
+
+
+def test_reuploading_swept_content_stores_it_again(attach):
+    delete_message(attach(b"%PDF again"))
+    s3_manager.delete_orphaned_blobs(grace_seconds=0)
+    attach(b"%PDF again")
+    blob = AttachmentBlob.query.one()
+    assert blob.ref_count == 1
+    assert s3_manager.get_file_info(blob.s3_key) is not None
+
+
+def test_blobs_whose_objects_survive_the_sweep_are_retried(attach, monkeypatch):
+    delete_message(attach(b"%PDF stuck"))
+    blob_key = AttachmentBlob.query.one().s3_key
+    monkeypatch.setattr(s3_manager.backend, "delete_many", lambda keys: list(keys))
+
+    assert s3_manager.delete_orphaned_blobs(grace_seconds=0) == 0
+    blob = AttachmentBlob.query.populate_existing().one()
+    assert (blob.s3_key, blob.ref_count) == (blob_key, 0)
+
+    monkeypatch.undo()
+    assert s3_manager.delete_orphaned_blobs(grace_seconds=0) == 1
+    assert AttachmentBlob.query.count() == 0
+    assert s3_manager.get_file_info(blob_key) is None
@@ -0,0 +1,66 @@
+import time
+from pytest import fixture, raises
+from revmark.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@fixture
+def clock(monkeypatch):
+    """A monotonic clock the test moves by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+def fail():
+    raise ConnectionError("upstream down")
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        with raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=3, reset_timeout=30)
+    trip(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with raises(CircuitOpenError):
+        breaker.call(lambda: "never called")
+
+
+def test_requests_the_upstream_rejects_do_not_trip_it(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=1)
+    with raises(ValueError):
+        breaker.call(lambda: int("x"), should_trip=lambda e: not isinstance(e, ValueError))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_one_trial_call_after_the_timeout_closes_or_reopens_it(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=2, reset_timeout=30)
+    trip(breaker)
+    clock(30)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock(30)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_interrupted_trial_frees_the_slot(clock):
+    breaker = CircuitBreaker("upstream", failure_threshold=1, reset_timeout=30)
+    trip(breaker)
+    clock(30)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with raises(KeyboardInterrupt):
+        breaker.call(interrupted)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.call(lambda: "ok") == "ok"
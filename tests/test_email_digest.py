@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from pytest import fixture
+from revmark import db, mail
+from revmark.models import User, EmailOutbox
+from revmark.utils import email_utils
+from revmark.utils.email_utils import queue_message_notification, drain_outbox
+
+
+@fixture
+def outbox(app, app_context, monkeypatch):
+    """Messages drain_outbox sends, with its clock movable by a number of minutes"""
+    monkeypatch.setattr(app.extensions['mail'], "suppress", True)
+    real_datetime = email_utils.datetime
+
+    class Clock(real_datetime):
+        offset = timedelta()
+
+        @classmethod
+        def utcnow(cls):
+            return real_datetime.utcnow() + cls.offset
+
+    monkeypatch.setattr(email_utils, "datetime", Clock)
+
+    def drain(minutes_later=0):
+        Clock.offset = timedelta(minutes=minutes_later)
+        with mail.record_messages() as sent:
+            stats = drain_outbox()
+        return stats, sent
+
+    return drain
+
+
+def recipient(users, digest):
+    user = User.query.get(users[1])
+    user.notification_digest = digest
+    user.digest_interval_minutes = 15
+    db.session.commit()
+    return user
+
+
+def test_batched_notifications_go_out_as_one_digest(users, outbox):
+    bob = recipient(users, "batched")
+    for i in range(3):
+        queue_message_notification(bob, f"New message {i}", f"body {i}")
+    stats, sent = outbox()
+    assert sent == []
+    stats, sent = outbox(minutes_later=15)
+    assert (stats['emails_sent'], stats['rows_sent']) == (1, 3)
+    assert sent[0].subject == "You have 3 new messages on RevMark"
+    assert all(f"body {i}" in sent[0].body for i in range(3))
+    assert EmailOutbox.query.filter_by(status='pending').count() == 0
+
+
+def test_immediate_notifications_are_not_held(users, outbox):
+    bob = recipient(users, "immediate")
+    queue_message_notification(bob, "New message", "hello")
+    stats, sent = outbox()
+    assert [m.subject for m in sent] == ["New message"]
+
+
+def test_notifications_in_one_window_share_a_send_time(app_context, users):
+    bob = recipient(users, "batched")
+    start = datetime(2026, 10, 18, 9, 0, 1)
+    assert bob.notification_send_time(now=start) == bob.notification_send_time(now=start + timedelta(minutes=14))
+    assert bob.notification_send_time(now=start) == datetime(2026, 10, 18, 9, 15)
+    bob.notification_digest = "daily"
+    assert bob.notification_send_time(now=start, daily_hour=8) == datetime(2026, 10, 19, 8, 0)
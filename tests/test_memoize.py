@@ -0,0 +1,103 @@
+import time
+from pytest import fixture
+from revmark.utils.memoize import memoize, invalidate_namespace
+
+
+def counted(**options):
+    """A memoized function that records every real call"""
+    calls = []
+
+    @memoize(**options)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    return square, calls
+
+
+def test_hit_returns_the_cached_value(app_context):
+    square, calls = counted(timeout=60)
+    assert square(3) == 9
+    assert square(3) == 9
+    assert square(4) == 16
+    assert calls == [3, 4]
+
+
+def test_invalidate_drops_one_entry(app_context):
+    square, calls = counted(timeout=60)
+    square(3)
+    square(4)
+    square.invalidate(3)
+    square(3)
+    square(4)
+    assert calls == [3, 4, 3]
+
+
+def test_invalidate_namespace_drops_every_entry(app_context):
+    square, calls = counted(timeout=60, namespace="squares")
+    cube_calls = []
+
+    @memoize(timeout=60, namespace="cubes")
+    def cube(x):
+        cube_calls.append(x)
+        return x ** 3
+
+    square(3)
+    square(4)
+    cube(2)
+    invalidate_namespace("squares")
+    square(3)
+    square(4)
+    cube(2)
+    assert calls == [3, 4, 3, 4]
+    assert cube_calls == [2]
+
+
+@fixture
+def expire(monkeypatch):
+    """Move memoize's clock past the freshness timeout (the cache still holds the entry)"""
+    def move_on(seconds=5):
+        now = time.time() + seconds
+        monkeypatch.setattr(time, "time", lambda: now)
+    return move_on
+
+
+def test_stale_value_is_served_when_recomputing_fails(app_context, expire):
+    results = [1]
+
+    @memoize(timeout=1, stale_timeout=60)
+    def flaky():
+        value = results.pop()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    assert flaky() == 1
+    expire()
+    results.append(RuntimeError("database down"))
+    assert flaky() == 1
+    assert results == []
+
+
+def test_expired_value_is_refreshed(app_context, expire):
+    results = [2, 1]
+
+    @memoize(timeout=1, stale_timeout=60)
+    def counter():
+        return results.pop()
+
+    assert counter() == 1
+    expire()
+    assert counter() == 2
+    assert counter() == 2
+
+
+def test_unless_calls_through_uncached(app_context):
+    bypass = [True]
+    square, calls = counted(timeout=60, unless=lambda: bypass[0])
+    square(3)
+    square(3)
+    bypass[0] = False
+    square(3)
+    square(3)
+    assert calls == [3, 3, 3]
@@ -0,0 +1,124 @@
+import re
+from datetime import datetime, timedelta
+from pytest import fixture, mark
+from revmark import db
+from revmark.models import User, Request, Message, Conversation
+from revmark.utils.query_counter import assert_query_count
+
+# Statements every logged-in page issues: the user loader, which also reads
+# the navbar's unread badge (the per-process SimpleCache does not hold users)
+LOGGED_IN = 1
+
+
+@fixture
+def engine(app):
+    # Counted outside any app context, so each request runs in its own
+    with app.app_context():
+        return db.engine
+
+
+@fixture
+def posted_requests(app, users):
+    alice, _ = users
+    with app.app_context():
+        started = datetime(2026, 1, 1)
+        for i in range(30):
+            db.session.add(Request(title=f"Request {i}", description="d" * 50, budget=10,
+                                   buyer_id=alice, timestamp=started + timedelta(minutes=i)))
+        db.session.commit()
+
+
+def send(sender_id, receiver_id, body):
+    message = Message(body=body, sender_id=sender_id, receiver_id=receiver_id)
+    db.session.add(message)
+    db.session.flush()
+    Conversation.record_message(message)
+
+
+def next_cursor(response):
+    return re.search(r'cursor=([\w-]+)', response.get_data(as_text=True)).group(1)
+
+
+def test_index_is_served_from_a_shared_feed_cache(client, engine, posted_requests, shared_cache):
+    # Row estimate and one page of requests, then nothing until the feed changes
+    with assert_query_count(2, engine):
+        assert client.get("/").status_code == 200
+    with assert_query_count(0, engine):
+        assert client.get("/").status_code == 200
+
+
+def test_index_reads_the_feed_with_a_per_process_cache(app, client, engine, posted_requests):
+    client.get("/")
+    # The page itself (the row estimate is still cached)
+    with assert_query_count(1, engine):
+        assert client.get("/").status_code == 200
+    # A request posted through another process is listed at once
+    with app.app_context():
+        db.session.add(Request(title="Posted elsewhere", description="d" * 50, budget=10,
+                               buyer_id=Request.query.first().buyer_id, timestamp=datetime(2027, 1, 1)))
+        db.session.commit()
+    assert "Posted elsewhere" in client.get("/").get_data(as_text=True)
+
+
+def test_index_logged_in(client, engine, posted_requests, login):
+    login("alice@example.com")
+    client.get("/")
+    with assert_query_count(LOGGED_IN + 1, engine):
+        assert client.get("/").status_code == 200
+
+
+def test_browse_pages_cost_the_same_at_any_depth(client, engine, posted_requests, shared_cache):
+    with assert_query_count(2, engine):
+        response = client.get("/browse")
+    for _ in range(2):
+        # One keyset range scan per page; the row estimate is cached
+        with assert_query_count(1, engine):
+            response = client.get(f"/browse?cursor={next_cursor(response)}")
+        assert response.status_code == 200
+
+
+def test_malformed_cursors_share_the_first_page_entry(client, engine, posted_requests, shared_cache):
+    client.get("/browse")
+    for junk in ("junk", "x" * 40, "e30"):
+        with assert_query_count(0, engine):
+            assert client.get(f"/browse?cursor={junk}").status_code == 200
+
+
+@mark.parametrize("partners", [1, 8])
+def test_inbox_query_count_does_not_grow_with_conversations(app, client, engine, users, login, partners):
+    alice, _ = users
+    with app.app_context():
+        for i in range(partners):
+            partner = User(username=f"partner{i}", email=f"partner{i}@example.com", password="-")
+            db.session.add(partner)
+            db.session.flush()
+            send(partner.id, alice, "hello")
+            send(alice, partner.id, "hi")
+        db.session.commit()
+    login("alice@example.com")
+    client.get("/inbox")
+    # Conversations with partners and last messages joined in, and the
+    # mark-read UPDATE (which matches nothing on a second visit)
+    with assert_query_count(LOGGED_IN + 2, engine):
+        response = client.get("/inbox")
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count("partner") >= partners
+
+
+@mark.parametrize("messages", [2, 40])
+def test_thread_query_count_does_not_grow_with_messages(app, client, engine, users, login, messages):
+    alice, bob = users
+    with app.app_context():
+        for i in range(messages):
+            if i % 2:
+                send(alice, bob, f"message {i}")
+            else:
+                send(bob, alice, f"message {i}")
+        db.session.commit()
+    login("alice@example.com")
+    # Receiver, conversation, the page of messages, their attachments in one
+    # IN query, and the one sender not already loaded as the receiver
+    with assert_query_count(LOGGED_IN + 5, engine):
+        response = client.get(f"/message/{bob}")
+    assert response.status_code == 200
+    assert f"message {messages - 1}" in response.get_data(as_text=True)
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+from pytest import fixture, mark, raises
+from sqlalchemy.exc import IntegrityError
+from revmark import db
+from revmark.models import Request, Message
+from revmark.pagination import encode_cursor, decode_cursor, keyset_paginate
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2026, 3, 4, 5, 6, 7, 890)
+    cursor = encode_cursor(timestamp, 42, 'next', 3)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == {'timestamp': timestamp, 'id': 42, 'direction': 'next', 'page': 3}
+
+
+@mark.parametrize("cursor", [None, "", "not-a-cursor", encode_cursor(datetime(2026, 1, 1), 1, 'sideways', 2)])
+def test_bad_cursors_mean_the_first_page(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@fixture
+def request_ids(app_context, users):
+    """25 requests, newest first; timestamps are shared by pairs to exercise the id tie-break"""
+    alice, bob = users
+    started = datetime(2026, 1, 1)
+    requests = [
+        Request(title=f"r{i}", description="d", budget=10, buyer_id=alice if i % 3 else bob,
+                seller_id=bob if i % 4 == 0 else None, timestamp=started + timedelta(minutes=i // 2))
+        for i in range(25)
+    ]
+    db.session.add_all(requests)
+    db.session.commit()
+    ordered = sorted(requests, key=lambda r: (r.timestamp, r.id), reverse=True)
+    return [r.id for r in ordered]
+
+
+def walk(branches=None, per_page=4):
+    """Page forwards to the end, then back to the start; returns both id sequences"""
+    query = Request.query
+    forward, pages = [], []
+    page = keyset_paginate(query, Request.timestamp, Request.id, per_page=per_page, branches=branches)
+    while True:
+        pages.append(page)
+        forward.extend(r.id for r in page.items)
+        if not page.has_next:
+            break
+        page = keyset_paginate(query, Request.timestamp, Request.id, cursor=page.next_cursor,
+                               per_page=per_page, branches=branches)
+    backward = [r.id for r in page.items]
+    while page.has_prev:
+        page = keyset_paginate(query, Request.timestamp, Request.id, cursor=page.prev_cursor,
+                               per_page=per_page, branches=branches)
+        backward = [r.id for r in page.items] + backward
+    return forward, backward, pages
+
+
+def test_keyset_pages_cover_every_row_once_in_both_directions(request_ids):
+    forward, backward, pages = walk()
+    assert forward == request_ids
+    assert backward == request_ids
+    assert [p.page for p in pages] == list(range(1, 8))
+    assert not pages[0].has_prev and not pages[-1].has_next
+
+
+def test_branches_match_the_or_filter(request_ids, users):
+    alice, bob = users
+    forward, backward, _ = walk(branches=(Request.buyer_id == alice, Request.seller_id == bob))
+    expected = [
+        r.id for r in Request.query.filter(db.or_(Request.buyer_id == alice, Request.seller_id == bob))
+        .order_by(Request.timestamp.desc(), Request.id.desc())
+    ]
+    assert len(expected) < len(request_ids)
+    # Including rows that match both branches, which must appear once
+    assert forward == expected
+    assert backward == expected
+
+
+
+
+
+@mark.parametrize("model", [Request, Message])
+def test_rows_without_a_timestamp_are_rejected(app_context, users, model):
+    # A NULL key could not be encoded into a cursor or compared in the range scan
+    alice, bob = users
+    if model is Request:
+        values = {'title': "r", 'description': "d", 'buyer_id': alice}
+    else:
+        values = {'body': "b", 'sender_id': alice, 'receiver_id': bob}
+    with raises(IntegrityError):
+        db.session.execute(db.insert(model).values(**values, timestamp=None))
+    db.session.rollback()
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from pytest import fixture
+from revmark import db, payouts
+from revmark.models import User, Request, EscrowPayment
+from revmark.payouts import eligible_payouts, release_payouts
+from revmark.stripe_utils import stripe_manager
+
+
+@fixture
+def seller(app_context, fake_stripe):
+    """Create a seller with a connected account, onboarded or not"""
+    def make_seller(name, onboarded):
+        account_id = fake_stripe.create_account({'email': f"{name}@example.com"})['id']
+        user = User(username=name, email=f"{name}@example.com", password="-",
+                    stripe_account_id=account_id, stripe_onboarding_complete=onboarded)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    return make_seller
+
+
+@fixture
+def paid_escrow(app_context, fake_stripe, users):
+    """Check out a request with a seller and mark it paid past the hold period"""
+    alice, _ = users
+
+    def check_out(seller_id):
+        request_obj = Request(title="Logo", description="A logo", budget=50, buyer_id=alice)
+        db.session.add(request_obj)
+        db.session.commit()
+        intent_id = stripe_manager.create_payment_intent(request_obj.id, alice, 50.0, seller_id=seller_id)['payment_intent_id']
+        escrow = EscrowPayment.query.filter_by(stripe_payment_intent_id=intent_id).one()
+        escrow.status = 'paid'
+        escrow.created_at = datetime.utcnow() - timedelta(days=7)
+        db.session.commit()
+        return escrow.id
+    return check_out
+
+
+def test_destination_charges_are_not_transferred_again(seller, paid_escrow, fake_stripe):
+    connected = paid_escrow(seller("dana", onboarded=True))
+    separate = paid_escrow(seller("erin", onboarded=False))
+    assert EscrowPayment.query.get(connected).stripe_destination_account_id is not None
+
+    assert [p['id'] for p in eligible_payouts()] == [separate]
+    stats = release_payouts(workers=2)
+    assert (stats['eligible'], stats['released']) == (1, 1)
+    assert len(fake_stripe.objects['transfers']) == 1
+    assert EscrowPayment.query.get(connected).status == 'paid'
+    assert EscrowPayment.query.get(separate).status == 'completed'
+
+
+def test_transfer_is_not_recorded_over_a_refund_made_during_the_run(seller, paid_escrow, monkeypatch):
+    escrow_id = paid_escrow(seller("erin", onboarded=False))
+    create_transfer = payouts._create_transfer
+
+    def refunded_in_flight(app, payout):
+        result = create_transfer(app, payout)
+        with app.app_context():
+            EscrowPayment.query.filter_by(id=payout['id']).update({'status': 'refunded'})
+            db.session.commit()
+        return result
+
+    monkeypatch.setattr(payouts, "_create_transfer", refunded_in_flight)
+    stats = release_payouts(workers=1)
+    assert (stats['released'], stats['conflicts']) == (0, 1)
+    escrow = EscrowPayment.query.populate_existing().get(escrow_id)
+    assert (escrow.status, escrow.stripe_transfer_id) == ('refunded', None)
+    assert Request.query.populate_existing().get(escrow.request_id).status != 'completed'
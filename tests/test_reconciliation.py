@@ -0,0 +1,45 @@
+import time
+from io import StringIO
+from revmark import reconciliation
+from revmark.reconciliation import Reconciler, Checkpoint
+
+
+def test_since_days_run_resumes_from_its_checkpoint(app_context, fake_stripe, tmp_path, monkeypatch):
+    monkeypatch.setattr(reconciliation, "PAGE_SIZE", 2)
+    for request_id in range(1, 6):
+        fake_stripe.create_payment_intent({'amount': '1000', 'metadata': {'request_id': str(request_id)}})
+    path = str(tmp_path / "checkpoint.json")
+
+    # Crash on the first object of the second page
+    reconciled = []
+    reconcile_intent = Reconciler._reconcile_intent
+
+    def crash_after_first_page(self, intent, escrow, request_obj):
+        if len(reconciled) == 2:
+            raise RuntimeError("worker killed")
+        reconciled.append(intent['id'])
+        return reconcile_intent(self, intent, escrow, request_obj)
+
+    monkeypatch.setattr(Reconciler, "_reconcile_intent", crash_after_first_page)
+    # reconcile_stripe.py --since-days 1 computes the cutoff from the clock on every run
+    first = Reconciler(StringIO(), checkpoint=Checkpoint(path), created_gte=time.time() - 86400)
+    try:
+        first.run(('payment_intents',))
+    except RuntimeError:
+        pass
+    assert Checkpoint(path).position('payment_intents')['starting_after'] == reconciled[-1]
+
+    monkeypatch.setattr(Reconciler, "_reconcile_intent", reconcile_intent)
+    resumed = Reconciler(StringIO(), checkpoint=Checkpoint(path), created_gte=time.time() + 5 - 86400)
+    assert resumed.created_gte == first.created_gte
+    stats = resumed.run(('payment_intents',))
+    assert stats['objects'] == 3
+    assert Checkpoint(path).state == {}
+
+
+def test_checkpoint_of_a_report_run_does_not_resume_a_repair(app_context, tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    Reconciler(StringIO(), checkpoint=checkpoint)
+    checkpoint.advance('payment_intents', last_id='pi_1')
+    resumed = Reconciler(StringIO(), repair=True, checkpoint=Checkpoint(checkpoint.path))
+    assert resumed.checkpoint.position('payment_intents') == {}
@@ -0,0 +1,98 @@
+import threading
+import time
+from pytest import fixture
+from werkzeug.serving import make_server
+from revmark import db, cache
+from revmark.models import User, StripeEvent, Request, EscrowPayment
+from revmark.stripe_events import record_event, process_pending_events
+from revmark.stripe_utils import stripe_manager
+
+ACCOUNT_KEY = "stripe:account:acct_1"
+
+
+def account_event(event_id, created, charges_enabled):
+    account = {'id': 'acct_1', 'details_submitted': True, 'charges_enabled': charges_enabled,
+               'payouts_enabled': charges_enabled}
+    return {'id': event_id, 'type': 'account.updated', 'created': created, 'data': {'object': account}}
+
+
+def test_account_snapshot_is_stamped_with_the_event_time(app_context, users):
+    created = int(time.time()) - 600
+    record_event(account_event('evt_1', created, True))
+    process_pending_events()
+    entry = cache.get(ACCOUNT_KEY)
+    assert entry['fetched_at'] == created
+    assert entry['account']['charges_enabled'] is True
+
+
+def test_late_event_does_not_replace_a_newer_snapshot(app_context, users):
+    stripe_manager.store_account_snapshot({'id': 'acct_1', 'charges_enabled': True})
+    record_event(account_event('evt_old', int(time.time()) - 600, False))
+    process_pending_events()
+    assert cache.get(ACCOUNT_KEY)['account']['charges_enabled'] is True
+
+
+def test_snapshot_is_only_cached_once_the_event_commits(app_context, users, monkeypatch):
+    alice, _ = users
+    User.query.get(alice).stripe_account_id = 'acct_1'
+    db.session.commit()
+    record_event(account_event('evt_1', int(time.time()), True))
+
+    commit = db.session.commit
+    failures = [RuntimeError("database went away")]
+
+    def flaky_commit():
+        if failures:
+            raise failures.pop()
+        commit()
+
+    monkeypatch.setattr(db.session, "commit", flaky_commit)
+    process_pending_events()
+    assert cache.get(ACCOUNT_KEY) is None
+    assert StripeEvent.query.get('evt_1').status == 'pending'
+
+
+@fixture
+def webhooks(app, fake_stripe, monkeypatch):
+    """Serve the app and point the fake's signed webhooks at /stripe/webhook"""
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(app.config, "STRIPE_WEBHOOK_SECRET", "whsec_test")
+    monkeypatch.setattr(fake_stripe, "webhook_secret", "whsec_test")
+    monkeypatch.setattr(fake_stripe, "webhook_urls", [f"http://127.0.0.1:{server.server_port}/stripe/webhook"])
+
+    def wait_for(count):
+        deadline = time.monotonic() + 10
+        while fake_stripe.stats['webhooks_sent'] + fake_stripe.stats['webhooks_failed'] < count:
+            assert time.monotonic() < deadline, "webhooks were not delivered"
+            time.sleep(0.02)
+        assert fake_stripe.stats['webhooks_failed'] == 0
+
+    yield wait_for
+    server.shutdown()
+
+
+def test_fake_stripe_webhooks_arrive_signed_and_in_order(webhooks, app_context, fake_stripe, users):
+    alice, _ = users
+    request_obj = Request(title="Logo", description="A logo", budget=50, buyer_id=alice)
+    db.session.add(request_obj)
+    db.session.commit()
+    intent_id = stripe_manager.create_payment_intent(request_obj.id, alice, 50.0)['payment_intent_id']
+    fake_stripe.succeed_payment_intent(intent_id)
+    webhooks(2)
+
+    events = StripeEvent.query.order_by(StripeEvent.received_at).all()
+    assert [e.type for e in events] == ['payment_intent.created', 'payment_intent.succeeded']
+    assert events[0].created < events[1].created
+    assert process_pending_events() == 2
+    assert EscrowPayment.query.filter_by(stripe_payment_intent_id=intent_id).one().status == 'paid'
+
+
+def test_events_for_one_object_apply_in_created_order(app_context, users):
+    now = int(time.time())
+    record_event(account_event('evt_new', now, True))
+    record_event(account_event('evt_old', now - 60, False))
+    process_pending_events()
+    applied = StripeEvent.query.order_by(StripeEvent.processed_at).all()
+    assert [e.id for e in applied] == ['evt_old', 'evt_new']
+    assert cache.get(ACCOUNT_KEY)['account']['charges_enabled'] is True
@@ -0,0 +1,36 @@
+from pytest import fixture
+from revmark import db
+from revmark.models import User, Request, EscrowPayment
+from revmark.stripe_utils import stripe_manager
+
+
+@fixture
+def funded_request(app_context, fake_stripe, users):
+    """A request by alice and two sellers who have not finished Stripe onboarding"""
+    alice, bob = users
+    carol = User(username="carol", email="carol@example.com", password="-")
+    db.session.add(carol)
+    request_obj = Request(title="Logo", description="A logo", budget=50, buyer_id=alice)
+    db.session.add(request_obj)
+    db.session.commit()
+    return request_obj.id, alice, bob, carol.id
+
+
+def test_retried_checkout_gets_the_same_payment_intent(funded_request, fake_stripe):
+    request_id, buyer, seller, _ = funded_request
+    first = stripe_manager.create_payment_intent(request_id, buyer, 50.0, seller_id=seller)
+    again = stripe_manager.create_payment_intent(request_id, buyer, 50.0, seller_id=seller)
+    assert again['payment_intent_id'] == first['payment_intent_id']
+    assert fake_stripe.stats['idempotent_replays'] == 1
+    assert EscrowPayment.query.count() == 1
+
+
+def test_another_seller_gets_a_new_payment_intent(funded_request, fake_stripe):
+    request_id, buyer, seller, other_seller = funded_request
+    first = stripe_manager.create_payment_intent(request_id, buyer, 50.0, seller_id=seller)
+    second = stripe_manager.create_payment_intent(request_id, buyer, 50.0, seller_id=other_seller)
+    assert second['payment_intent_id'] != first['payment_intent_id']
+    escrow = EscrowPayment.query.filter_by(stripe_payment_intent_id=second['payment_intent_id']).one()
+    assert escrow.seller_id == other_seller
+    intent = fake_stripe.objects['payment_intents'][second['payment_intent_id']]
+    assert intent['metadata']['seller_id'] == str(other_seller)
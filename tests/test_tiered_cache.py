@@ -0,0 +1,92 @@
+import os
+import time
+from pytest import fixture
+from revmark.utils.tiered_cache import TieredCache
+
+
+class SharedRedis:
+    """Just enough of a Redis client for TieredCache; publish reaches every
+    subscribed cache at once, standing in for their listener threads"""
+
+    def __init__(self):
+        self.data = {}
+        self.subscribers = []
+        self.reads = 0
+
+    def get(self, name):
+        self.reads += 1
+        return self.data.get(name)
+
+    def mget(self, names):
+        self.reads += 1
+        return [self.data.get(name) for name in names]
+
+    def set(self, name, value, ex=None):
+        self.data[name] = value
+        return True
+
+    def delete(self, *names):
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+    def exists(self, name):
+        return int(name in self.data)
+
+    def flushdb(self):
+        self.data.clear()
+        return True
+
+    def publish(self, channel, message):
+        for cache in self.subscribers:
+            cache._on_message(message.encode())
+
+
+@fixture
+def redis():
+    return SharedRedis()
+
+
+@fixture
+def worker(redis):
+    """A TieredCache as one worker process would hold it"""
+    def start(local_ttl=5):
+        cache = TieredCache(host=redis, local_ttl=local_ttl)
+        cache._listener_pid = os.getpid()
+        redis.subscribers.append(cache)
+        return cache
+    return start
+
+
+def test_reads_are_served_locally_until_another_worker_writes(redis, worker):
+    first, second = worker(), worker()
+    first.set("greeting", "hello")
+    assert second.get("greeting") == "hello"
+    reads = redis.reads
+    assert second.get("greeting") == "hello"
+    assert redis.reads == reads
+
+    first.set("greeting", "bonjour")
+    assert second.get("greeting") == "bonjour"
+    first.delete("greeting")
+    assert second.get("greeting") is None
+
+
+def test_clear_drops_every_local_copy(worker):
+    first, second = worker(), worker()
+    first.set("a", 1)
+    first.set("b", 2)
+    assert second.get_many("a", "b") == [1, 2]
+    first.clear()
+    assert second.get_many("a", "b") == [None, None]
+
+
+def test_a_missed_invalidation_is_bounded_by_the_local_ttl(redis, worker, monkeypatch):
+    first, second = worker(local_ttl=5), worker(local_ttl=5)
+    first.set("greeting", "hello")
+    second.get("greeting")
+    redis.subscribers.remove(second)
+    first.set("greeting", "bonjour")
+    assert second.get("greeting") == "hello"
+
+    later = time.monotonic() + 5
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert second.get("greeting") == "bonjour"
@@ -0,0 +1,72 @@
+from revmark import db
+from revmark.models import User, UserSnapshot, Message, Conversation
+
+
+def test_snapshots_are_served_from_the_cache(app_context, shared_cache, users):
+    alice, _ = users
+    snapshot = UserSnapshot.load(alice)
+    assert snapshot.username == "alice"
+    assert UserSnapshot.load(alice) is not None
+    # Still served after the row is changed behind the ORM's back
+    User.query.filter_by(id=alice).update({User.username: "changed"}, synchronize_session=False)
+    db.session.commit()
+    assert UserSnapshot.load(alice).username == "alice"
+
+
+def test_update_retires_the_snapshot(app_context, shared_cache, users):
+    alice, _ = users
+    UserSnapshot.load(alice)
+    user = User.query.get(alice)
+    user.username = "alicia"
+    db.session.commit()
+    assert UserSnapshot.load(alice).username == "alicia"
+
+
+def test_delete_retires_the_snapshot(app_context, shared_cache, users):
+    alice, _ = users
+    UserSnapshot.load(alice)
+    db.session.delete(User.query.get(alice))
+    db.session.commit()
+    assert UserSnapshot.load(alice) is None
+
+
+def test_rollback_keeps_the_snapshot(app_context, shared_cache, users):
+    alice, _ = users
+    before = UserSnapshot.load(alice)
+    user = User.query.get(alice)
+    user.username = "alicia"
+    db.session.flush()
+    db.session.rollback()
+    assert UserSnapshot.load(alice).version == before.version
+    assert "changed_user_ids" not in db.session.info
+
+
+def test_unshared_cache_reads_the_database(app_context, users):
+    alice, _ = users
+    UserSnapshot.load(alice)
+    User.query.filter_by(id=alice).update({User.username: "changed"}, synchronize_session=False)
+    db.session.commit()
+    assert UserSnapshot.load(alice).username == "changed"
+
+
+def test_unshared_snapshot_carries_the_unread_count(app, client, users, login):
+    alice, bob = users
+    with app.app_context():
+        for body in ("one", "two"):
+            message = Message(body=body, sender_id=bob, receiver_id=alice)
+            db.session.add(message)
+            db.session.flush()
+            Conversation.record_message(message)
+        User.query.filter_by(id=alice).update({User.unread_count: 2})
+        db.session.commit()
+        assert UserSnapshot.load(alice).unread_count == 2
+    login("alice@example.com")
+    assert '<span class="notification-badge">2</span>' in client.get("/").get_data(as_text=True)
+    # Read back after the inbox marks the messages read within the same request
+    assert "notification-badge" not in client.get("/inbox").get_data(as_text=True)
+
+
+def test_cached_snapshot_has_no_unread_count(app_context, shared_cache, users):
+    alice, _ = users
+    UserSnapshot.load(alice)
+    assert UserSnapshot.load(alice).unread_count is None
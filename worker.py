@@ -0,0 +1,61 @@
+# Background worker for queued work that must not run inside web requests.
+#   python worker.py          # poll forever
+#   python worker.py --once   # run every job once and exit (cron / debugging)
+
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The worker serves no pages, so skip importing and building Flask-Admin
+os.environ.setdefault("ADMIN_ENABLED", "false")
+
+from revmark import create_app, db
+from revmark.utils.email_utils import drain_outbox
+from revmark.stripe_events import process_pending_events
+from revmark.s3_utils import s3_manager
+from revmark.image_derivatives import process_pending_derivatives
+
+logger = logging.getLogger("revmark.worker")
+
+def send_outbox_email():
+    stats = drain_outbox()
+    return stats['rows_sent'] + stats['rows_retried'] + stats['rows_failed']
+
+# Each job returns how many items it handled; the loop only sleeps when
+# every job comes back idle.
+JOBS = [
+    ("stripe_events", process_pending_events),
+    ("email_outbox", send_outbox_email),
+    ("image_derivatives", process_pending_derivatives),
+    ("attachment_blobs", s3_manager.delete_orphaned_blobs),
+]
+
+def run_jobs(app):
+    handled = 0
+    for name, job in JOBS:
+        with app.app_context():
+            try:
+                handled += job() or 0
+            except Exception:
+                logger.exception(f"Worker job {name} failed")
+                db.session.rollback()
+    return handled
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RevMark background worker")
+    parser.add_argument("--once", action="store_true", help="Run every job once and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    app = create_app()
+    poll_seconds = app.config.get("WORKER_POLL_SECONDS", 5)
+
+    if args.once:
+        run_jobs(app)
+    else:
+        logger.info(f"Worker started (jobs: {', '.join(name for name, _ in JOBS)})")
+        while True:
+            if not run_jobs(app):
+                time.sleep(poll_seconds)